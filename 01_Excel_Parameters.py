@@ -1,11 +1,16 @@
 # Import required modules
 import time  # For timing execution
 import os  # For file system operations
-import re  # For regular expressions
 import platform  # To detect operating system
 from pathlib import Path  # For path handling
+from concurrent.futures import ProcessPoolExecutor  # For parallel file scanning
 from tkinter import Tk, filedialog, messagebox  # For GUI interactions
 from tqdm import tqdm  # For progress bar
+from jpk_metadata import read_jpk_header_text, compile_parameter_matcher  # Header-only JPK metadata helpers
+from jpk_metadata import load_parameters  # Parameter list (default or Parameters_To_Find.txt)
+import parameter_index  # Persistent index of already parsed files
+from parameter_export import export_parameters  # Typed, streaming table export
+from force_calc import add_forces, resolve_force_parameters, FORCE_COLUMNS  # Normal/tapping forces per row
 
 # --- Prompt user to choose a folder ---
 def choose_folder():
@@ -25,7 +30,7 @@ def choose_save_location(default_folder):
         other_folder = filedialog.askdirectory(title="Select Folder to Save CSV")  # Choose a different folder
         return Path(other_folder) if other_folder else None  # Return path or None if canceled
 
-# --- Automatically open CSV with the default app ---
+# --- Automatically open the table with the default app ---
 def open_csv(csv_path):
     system = platform.system()  # Get OS name
     if system == "Darwin":  # macOS
@@ -37,75 +42,138 @@ def open_csv(csv_path):
     else:
         print("Unsupported OS. Please open the file manually.")
 
+# --- Settings ---
+NUM_WORKERS = os.cpu_count() or 1  # Number of parallel worker processes (1 = scan serially)
+CHUNK_SIZE = 16  # Number of files handed to a worker at a time
+COMMIT_EVERY = 500  # Save progress to the index every N parsed files
+EXPORT_FORMATS = ["xlsx", "csv"]  # Any of "xlsx", "csv", "parquet" (parquet needs pyarrow); the first one is opened
+
+# --- Per-file work (runs inside the worker processes) ---
+_match_parameters = None
+
+def init_worker(parameters):
+    # Compile the matcher once per worker: every file is then scanned in a single pass
+    global _match_parameters
+    _match_parameters = compile_parameter_matcher(parameters)
+
+def parse_file(file_path):
+    # Returns (row, error). Never raises, so one broken file cannot stop the whole scan
+    try:
+        text = read_jpk_header_text(file_path)  # Only the TIFF tag tables are read, never the image data
+        return _match_parameters(text), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+# --- Scan files, serially or with a process pool ---
+def scan_files(files, parameters, num_workers):
+    # Yields (file_path, row, error) in the same order as `files`, as soon as each result is ready
+    if num_workers <= 1:
+        init_worker(parameters)
+        for file_path in files:
+            yield (file_path, *parse_file(file_path))
+        return
+
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=init_worker, initargs=(parameters,)) as pool:
+        for file_path, result in zip(files, pool.map(parse_file, files, chunksize=CHUNK_SIZE)):
+            yield (file_path, *result)
+
 # --- Main ---
-start_time = time.time()  # Start timing
-
-# Ask user to choose the source folder
-folder_path = choose_folder()
-if not folder_path:
-    print("No folder selected. Exiting.")
-    exit()
-
-# Ask where to save the CSV file
-save_folder = choose_save_location(folder_path)
-if not save_folder:
-    print("No save location selected. Exiting.")
-    exit()
-
-# Parameters to search for in the files
-parameters_to_find = [
-    "relative-setpoint",
-    "cantilever-calibration-info.calibration-environment",
-    "cantilever-calibration-info.cantilever-name",
-    "cantilever-calibration-info.defined",
-    "cantilever-calibration-info.frequency",
-    "cantilever-calibration-info.qFactor",
-    "cantilever-calibration-info.sensitivity",
-    "cantilever-calibration-info.spring-constant",
-    "experiment-mode.name",
-    "feedback-mode.adjust-reference-amplitude-feedback-settings.reference-amplitude",
-]
-
-# Create full path to the CSV file
-csv_path = save_folder / "Parameters.csv"
-
-# Open CSV file and write header
-with open(csv_path, "w") as csv_file:
-    csv_file.write("Filename," + ",".join(parameters_to_find) + "\n")
-
-    # Collect all files (recursively) in the source folder
-    files = list(folder_path.glob("**/*"))
-
-    # Loop over each file
-    for file_path in tqdm(files):
-        if not file_path.is_file():
-            continue  # Skip directories
-
-        with open(file_path, "rb") as infile:
-            data = infile.read()  # Read binary data
-
-        text = data.decode("ISO-8859-1", errors="ignore")  # Decode to text
-        row = {"Filename": file_path.name}  # Initialize row with filename
-
-        # Search each parameter
-        for parameter in parameters_to_find:
-            pattern = rf"({re.escape(parameter)}) ?: ?(.*)"
-            for line in text.splitlines():
-                match = re.search(pattern, line)
-                if match:
-                    row[parameter] = match.group(2).strip()
-                    break  # Stop at first match
-
-        # Write row to CSV in correct column order
-        values = [row.get(param, "") for param in ["Filename"] + parameters_to_find]
-        csv_file.write(",".join(values) + "\n")
-
-# Notify user
-print(f"CSV file saved as {csv_path}")
-
-# Print execution time
-end_time = time.time()
-print(f"Time in seconds: {round(end_time - start_time)}")
-
-# Open the CSV file in the default program
-open_csv(csv_path)
+def main():
+    start_time = time.time()  # Start timing
+
+    # Ask user to choose the source folder
+    folder_path = choose_folder()
+    if not folder_path:
+        print("No folder selected. Exiting.")
+        return
+
+    # Ask where to save the CSV file
+    save_folder = choose_save_location(folder_path)
+    if not save_folder:
+        print("No save location selected. Exiting.")
+        return
+
+    parameters_to_find = load_parameters()
+
+    # Base path of the exported tables (the suffix is set per format)
+    export_base = save_folder / "Parameters"
+
+    # Collect all JPK files (recursively) in the source folder, keyed by relative path
+    files = {
+        p.relative_to(folder_path).as_posix(): p
+        for p in folder_path.glob("**/*") if p.is_file() and p.suffix.lower() == ".jpk"
+    }
+    file_stats = {rel: (p.stat().st_size, p.stat().st_mtime_ns) for rel, p in files.items()}
+    errors = []
+
+    # Only new or changed files (by size and mtime) are parsed, the rest comes from the index
+    index_path = folder_path / parameter_index.INDEX_FILENAME
+    con = parameter_index.open_index(index_path)
+    try:
+        removed = parameter_index.remove_missing(con, file_stats)
+        stale = sorted(parameter_index.find_stale(con, file_stats, parameters_to_find))
+        print(f"{len(files) - len(stale)} file(s) unchanged, {len(stale)} to parse, {removed} removed from index")
+
+        to_parse = [files[rel] for rel in stale]
+        for n, (file_path, row, error) in enumerate(
+            tqdm(scan_files(to_parse, parameters_to_find, NUM_WORKERS), total=len(to_parse)), 1
+        ):
+            rel = file_path.relative_to(folder_path).as_posix()
+            if error:
+                tqdm.write(f"Error reading {file_path.name}: {error}")
+                errors.append((file_path, error))
+                parameter_index.remove_row(con, rel)  # Never export stale values for an unreadable file
+                continue
+            parameter_index.store_row(con, rel, *file_stats[rel], parameters_to_find, row)
+            if n % COMMIT_EVERY == 0:
+                con.commit()  # Keep progress if the run is interrupted
+        con.commit()
+
+        # Regenerate the tables from the index, in path order. Numbers are split from
+        # their units and written as floats, rows are streamed so memory stays flat
+        def indexed_rows():
+            for rel, row in parameter_index.iter_rows(con):
+                row["Filename"] = rel  # Relative path: files of different subfolders may share a name
+                yield row
+
+        # Forces are computed in vectorized batches and exported as extra columns
+        columns = list(parameters_to_find)
+        with_forces = resolve_force_parameters(parameters_to_find) is not None
+        if with_forces:
+            columns += FORCE_COLUMNS
+            flagged = sum(row["force-status"] != "ok" for row in add_forces(indexed_rows(), parameters_to_find))
+            if flagged:
+                print(f"{flagged} file(s) with missing or invalid force inputs, see the force-status column")
+
+        def table_rows():
+            rows = indexed_rows()
+            return add_forces(rows, parameters_to_find) if with_forces else rows
+
+        written = export_parameters(export_base, columns, table_rows, EXPORT_FORMATS)
+    finally:
+        con.close()
+
+    # Notify user
+    for path in written:
+        print(f"Table saved as {path}")
+
+    # Report files that could not be read
+    errors_path = save_folder / "Parameters_errors.txt"
+    if errors:
+        with open(errors_path, "w", encoding="utf-8") as f:
+            for file_path, error in errors:
+                f.write(f"{file_path}\t{error}\n")
+        print(f"{len(errors)} file(s) could not be read, see {errors_path}")
+    elif errors_path.exists():
+        errors_path.unlink()  # Left over from an earlier run
+
+    # Print execution time
+    end_time = time.time()
+    print(f"Time in seconds: {round(end_time - start_time)}")
+
+    # Open the first exported table in the default program
+    if written:
+        open_csv(written[0])
+
+if __name__ == "__main__":  # Required so worker processes do not re-run the GUI
+    main()
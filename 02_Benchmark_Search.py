@@ -0,0 +1,93 @@
+import time
+import random
+import argparse
+import statistics
+import tempfile
+from pathlib import Path
+import metadata_search
+from jpk_metadata import parse_properties
+
+# Measures 02_Search_Metadata.py queries on a synthetic index of many files, so the
+# speed of the search index can be checked on this machine without a large archive.
+# Every file gets a JPK-like header (same parser and index rows as real files) in which
+# the values that are usually searched vary from file to file.
+
+# ----------------------------- Settings (defaults for the command-line options) -----------------------------
+NUM_FILES = 100_000      # Indexed files (building 100k files takes a few minutes and ~2 GB of temp space)
+EXTRA_KEYS = 150         # Further header properties per file (a JPK header has a few hundred)
+REPEATS = 5              # Runs of each query, the median is reported
+SEED = 0
+
+CANTILEVERS = ["240AC-NA", "TAP300AL-G", "qp-BioAC", "NCHV", "FMV-A"]
+
+# (label, full-text query, predicates), as typed into 02_Search_Metadata.py
+QUERIES = [
+    ("exact text value", None, ["cantilever.name == TAP300AL-G"]),
+    ("numeric range", None, ["spring-constant > 40", "spring-constant < 41"]),
+    ("numeric with unit", None, ["relative-setpoint == 70 %"]),
+    ("date range", None, ["start-time >= 2024-06", "start-time < 2024-07"]),
+    ("full text", "qp*", []),
+    ("text + predicate", "NCHV", ["spring-constant > 45"]),
+]
+
+# ----------------------------- Build the synthetic index -----------------------------
+def header_text(rng, index, extra_keys):
+    day = 1 + index % 28
+    lines = [
+        f"cantilever.name : {rng.choice(CANTILEVERS)}",
+        f"cantilever-calibration-info.spring-constant : {rng.uniform(20, 50):.4f} N/m",
+        f"cantilever-calibration-info.sensitivity : {rng.uniform(5, 50):.3f} nm/V",
+        f"feedback-mode.setpoint-feedback-settings.relative-setpoint : {rng.choice([60, 70, 80])} %",
+        f"start-time : 2024-{1 + index % 12:02d}-{day:02d} {rng.randrange(24):02d}:{rng.randrange(60):02d}:00.000",
+    ]
+    lines += [f"section-{k // 10}.property-{k} : {rng.uniform(0, 1000):.3f}" for k in range(extra_keys)]
+    return "\n".join(lines)
+
+def build_index(db_path, num_files, extra_keys, seed):
+    rng = random.Random(seed)
+    con = metadata_search.open_search_index(db_path)
+    key_cache = {}
+    for index in range(num_files):
+        text = header_text(rng, index, extra_keys)
+        metadata_search.insert_file(con, f"scan_{index:06d}.jpk", 0, 0, parse_properties(text), text, key_cache)
+        if (index + 1) % metadata_search.COMMIT_EVERY == 0:
+            con.commit()
+    con.commit()
+    return con
+
+# ----------------------------- Measure -----------------------------
+def measure(con, repeats):
+    # [(label, matches, median ms, fastest ms)] of every query in QUERIES
+    results = []
+    for label, text, where in QUERIES:
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            names = metadata_search.search(con, text, where)
+            timings.append((time.perf_counter() - start) * 1000)
+        results.append((label, len(names), statistics.median(timings), min(timings)))
+    return results
+
+# ----------------------------- Main -----------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Time metadata searches on a synthetic index.")
+    parser.add_argument("--files", type=int, default=NUM_FILES)
+    parser.add_argument("--extra-keys", type=int, default=EXTRA_KEYS)
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        db_path = Path(folder) / metadata_search.SEARCH_INDEX_FILENAME
+        start = time.perf_counter()
+        con = build_index(db_path, args.files, args.extra_keys, SEED)
+        print(f"Indexed {args.files} synthetic files ({args.extra_keys + 5} properties each) in "
+              f"{time.perf_counter() - start:.1f} s, {db_path.stat().st_size / 2 ** 20:.0f} MB, "
+              f"FTS5: {'yes' if metadata_search.has_fts5(con) else 'no'}")
+        try:
+            for label, matches, median_ms, fastest_ms in measure(con, args.repeats):
+                print(f"{label:<20} {matches:>7} match(es)  median {median_ms:8.1f} ms  fastest {fastest_ms:8.1f} ms")
+        finally:
+            con.close()
+
+if __name__ == "__main__":
+    main()
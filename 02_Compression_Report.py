@@ -0,0 +1,92 @@
+import io
+import time
+import tifffile
+import tkinter as tk
+from tkinter import filedialog
+from pathlib import Path
+from jpk_extract import compression_options, palette_lut, mapped_file, read_page, detach
+
+# ----------------------------- Settings -----------------------------
+ENCODE_THREADS = 4  # Same meaning as in the extract scripts
+REPEATS = 3         # Best of N timings per codec
+
+# (label, compression, predictor); lzw and zstd need imagecodecs.
+# The floating point predictor only applies to float pages (see compression_options)
+CODECS = [
+    ("none", None, None),
+    ("zlib", "zlib", None),
+    ("zlib + horizontal", "zlib", "horizontal"),
+    ("zlib + floatingpoint", "zlib", "floatingpoint"),
+    ("lzw + horizontal", "lzw", "horizontal"),
+    ("zstd", "zstd", None),
+    ("zstd + horizontal", "zstd", "horizontal"),
+]
+
+# ----------------------------- Decode all pages once -----------------------------
+def load_pages(jpk_path):
+    # Pages as the extract scripts write them by default (palette pages expanded to RGB)
+    # Uncompressed pages are read through the memory-mapped file and copied once, since
+    # the map is closed before the codecs are measured
+    images = []
+    palette_cache = {}
+    with mapped_file(jpk_path) as file_map, tifffile.TiffFile(jpk_path) as tif:
+        for page in tif.pages:
+            image_data = read_page(page, file_map)
+            if page.photometric == 3 and hasattr(page, "colormap"):
+                image_data = palette_lut(page.colormap, palette_cache)[image_data]
+            images.append(detach(image_data, file_map))
+        image_data = None  # Drop the last view before the map closes
+    return images
+
+# ----------------------------- Measure one codec -----------------------------
+def measure_codec(images, compression, predictor):
+    # Returns (total bytes written, best write seconds, best read seconds)
+    best_write = best_read = float("inf")
+    for _ in range(REPEATS):
+        buffers = []
+        start = time.perf_counter()
+        for image_data in images:
+            buffer = io.BytesIO()
+            options = compression_options(image_data, compression, predictor, encode_threads=ENCODE_THREADS)
+            tifffile.imwrite(buffer, image_data, **options)
+            buffers.append(buffer)
+        best_write = min(best_write, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for buffer in buffers:
+            buffer.seek(0)
+            tifffile.imread(buffer, maxworkers=ENCODE_THREADS)
+        best_read = min(best_read, time.perf_counter() - start)
+    return sum(len(b.getvalue()) for b in buffers), best_write, best_read
+
+# ----------------------------- Main -----------------------------
+if __name__ == "__main__":
+    root = tk.Tk()
+    root.withdraw()
+    jpk_path = filedialog.askopenfilename(title="Select a .jpk File", filetypes=[("JPK files", "*.jpk")])
+    if not jpk_path:
+        raise SystemExit("No file selected. Exiting.")
+    jpk_path = Path(jpk_path)
+
+    images = load_pages(jpk_path)
+    raw_bytes = sum(image_data.nbytes for image_data in images)
+    print(f"{jpk_path.name}: {len(images)} pages, {raw_bytes / 1e6:.2f} MB of image data\n")
+    print(f"{'Codec':<22}{'Size (MB)':>10}{'Ratio':>8}{'Write MB/s':>12}{'Read MB/s':>11}")
+
+    float_images = [image_data for image_data in images if image_data.dtype.kind == "f"]
+    for label, compression, predictor in CODECS:
+        measured = images
+        if predictor == "floatingpoint":
+            if not float_images:
+                print(f"{label:<22}skipped: no float pages (integer pages would use horizontal)")
+                continue
+            if len(float_images) < len(images):
+                measured, label = float_images, f"{compression} + fp (float)"  # Only the pages it applies to
+        try:
+            size, write_s, read_s = measure_codec(measured, compression, predictor)
+        except KeyError as e:  # tifffile has no encoder for it: imagecodecs is missing
+            print(f"{label:<22}unavailable: {e}")
+            continue
+        measured_bytes = sum(image_data.nbytes for image_data in measured)
+        print(f"{label:<22}{size / 1e6:>10.2f}{measured_bytes / size:>8.2f}"
+              f"{measured_bytes / 1e6 / write_s:>12.1f}{measured_bytes / 1e6 / read_s:>11.1f}")
@@ -1,24 +1,81 @@
-import os              # For file operations
-import tifffile        # For reading TIFF files and metadata
-import tkinter as tk   # For folder selection UI
-from tkinter import filedialog
-
-# --- Prompt user to select the folder containing TIFF files ---
-root = tk.Tk()
-root.withdraw()  # Hide the empty root window
-tiff_folder = filedialog.askdirectory(title="Select Folder Containing TIFF Files")
-if not tiff_folder:
-    raise SystemExit("No folder selected. Exiting.")
-
-# --- Loop through all .tif files in the folder, sorted alphabetically ---
-for filename in sorted(os.listdir(tiff_folder)):
-    if filename.endswith(".tif"):
-        path = os.path.join(tiff_folder, filename)
-
-        # --- Open the TIFF file and read the ImageDescription tag from the first page ---
-        with tifffile.TiffFile(path) as tif:
-            desc = tif.pages[0].tags.get("ImageDescription")
-
-            # --- Print the metadata or a message if it's missing ---
-            print(f"\n=== {filename} ===")
-            print(desc.value if desc else "No metadata found.")
+import os              # For the default number of workers
+import sys             # For errors and the summary on stderr
+import argparse        # For command-line use
+from pathlib import Path
+from metadata_query import query_files, parse_predicate, format_json_line, format_table
+
+# ----------------------------- Settings (defaults for the command-line options) -----------------------------
+QUERY = []                        # Predicates that must all hold, e.g. ["spring-constant > 40", "experiment-mode.name == AC"]
+FIELDS = []                       # Keys to print; empty = the keys used in QUERY, or every property if QUERY is empty too
+OUTPUT_FORMAT = "table"           # "table" or "jsonl" (one JSON object per file)
+FILE_PATTERNS = ["*.tif", "*.jpk"]  # Files to query
+RECURSIVE = False                 # Also search subfolders
+NUM_WORKERS = os.cpu_count() or 1  # Parallel worker processes (1 = read serially)
+
+# ----------------------------- Command line -----------------------------
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Query the metadata of TIFF/JPK files. Only the first IFD of each file is read.",
+        epilog='Example: 02_Print_TIFF_Metadata.py data -w "spring-constant > 40" -w "experiment-mode.name == AC" -f sensitivity',
+    )
+    parser.add_argument("folder", nargs="?", help="Folder to query (a folder picker opens if omitted)")
+    parser.add_argument("-w", "--where", action="append", default=None, metavar="PREDICATE",
+                        help="Key/value predicate: ==, !=, <, <=, >, >=, ~ (contains), or a bare key (exists)")
+    parser.add_argument("-f", "--field", action="append", default=None, help="Key to print (repeatable)")
+    parser.add_argument("--format", choices=["table", "jsonl"], default=OUTPUT_FORMAT)
+    parser.add_argument("-r", "--recursive", action="store_true", default=RECURSIVE)
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS)
+    return parser.parse_args()
+
+def choose_folder():
+    import tkinter as tk
+    from tkinter import filedialog
+    root = tk.Tk()
+    root.withdraw()  # Hide the empty root window
+    folder = filedialog.askdirectory(title="Select Folder Containing TIFF Files")
+    return Path(folder) if folder else None
+
+# ----------------------------- Main -----------------------------
+def main():
+    args = parse_arguments()
+    folder = Path(args.folder) if args.folder else choose_folder()
+    if not folder:
+        raise SystemExit("No folder selected. Exiting.")
+
+    predicates = args.where if args.where is not None else QUERY
+    fields = args.field if args.field is not None else FIELDS
+    try:
+        keys = [parse_predicate(p)[0] for p in predicates]  # Reject typos before reading any file
+    except ValueError as e:
+        raise SystemExit(str(e))
+    if not fields:
+        fields = list(dict.fromkeys(keys))
+
+    # --- Files, sorted alphabetically ---
+    search = folder.rglob if args.recursive else folder.glob
+    files = sorted({p for pattern in FILE_PATTERNS for p in search(pattern) if p.is_file()})
+
+    rows = []  # Table rows, printed at the end so the columns line up
+    matched = errors = 0
+    for file_path, record, error in query_files(files, predicates, fields, args.workers):
+        name = file_path.relative_to(folder).as_posix()
+        if error:
+            errors += 1
+            print(f"Error reading {name}: {error}", file=sys.stderr)
+            continue
+        matched += 1
+        if args.format == "jsonl":
+            print(format_json_line(name, record))
+        elif fields:
+            rows.append((name, record))
+        else:
+            # Nothing to tabulate: print every property of the file
+            print(f"\n=== {name} ===")
+            print("\n".join(f"{key} : {value}" for key, value in record.items()) or "No metadata found.")
+
+    if rows:
+        print("\n".join(format_table(rows, fields)))
+    print(f"{matched} of {len(files)} files matched" + (f", {errors} unreadable" if errors else ""), file=sys.stderr)
+
+if __name__ == "__main__":  # Required for the worker processes
+    main()
@@ -0,0 +1,89 @@
+import sys             # For the summary on stderr
+import time            # For timing the query
+import argparse        # For command-line use
+from pathlib import Path
+import metadata_search
+from metadata_query import parse_predicate, format_json_line, format_table
+
+# ----------------------------- Settings (defaults for the command-line options) -----------------------------
+TEXT = ""                         # Full-text query, e.g. '"cantilever-name" AND tap300*'; empty = no text filter
+QUERY = []                        # Predicates that must all hold, e.g. ["cantilever-name == X", "relative-setpoint == 0.7"]
+FIELDS = []                       # Keys to print; empty = the keys used in QUERY
+OUTPUT_FORMAT = "table"           # "table" or "jsonl" (one JSON object per file)
+UPDATE = True                     # Index new/changed JPK files of the folder (and subfolders) before searching
+LIMIT = None                      # Maximum number of results (None = all)
+
+# ----------------------------- Command line -----------------------------
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description=f"Search the JPK metadata index ({metadata_search.SEARCH_INDEX_FILENAME}) of a folder.",
+        epilog='Example: 02_Search_Metadata.py data -w "cantilever-name == X" -w "start-time >= 2024-05" -f relative-setpoint',
+    )
+    parser.add_argument("folder", nargs="?", help="Indexed folder (a folder picker opens if omitted)")
+    parser.add_argument("-t", "--text", default=TEXT, help="Full-text query (FTS5 syntax)")
+    parser.add_argument("-w", "--where", action="append", default=None, metavar="PREDICATE",
+                        help="Key/value predicate: ==, !=, <, <=, >, >=, ~ (contains), or a bare key (exists)")
+    parser.add_argument("-f", "--field", action="append", default=None, help="Key to print (repeatable)")
+    parser.add_argument("--format", choices=["table", "jsonl"], default=OUTPUT_FORMAT)
+    parser.add_argument("--no-update", dest="update", action="store_false", default=UPDATE,
+                        help="Search the index as it is, without checking the folder for new files")
+    parser.add_argument("--limit", type=int, default=LIMIT)
+    return parser.parse_args()
+
+def choose_folder():
+    import tkinter as tk
+    from tkinter import filedialog
+    root = tk.Tk()
+    root.withdraw()
+    folder = filedialog.askdirectory(title="Select Folder Containing .jpk Files")
+    return Path(folder) if folder else None
+
+# ----------------------------- Main -----------------------------
+def main():
+    args = parse_arguments()
+    folder = Path(args.folder) if args.folder else choose_folder()
+    if not folder:
+        raise SystemExit("No folder selected. Exiting.")
+
+    predicates = args.where if args.where is not None else QUERY
+    fields = args.field if args.field is not None else FIELDS
+    try:
+        keys = [parse_predicate(p)[0] for p in predicates]
+    except ValueError as e:
+        raise SystemExit(str(e))
+    if not fields:
+        fields = list(dict.fromkeys(keys))
+
+    con = metadata_search.open_search_index(folder / metadata_search.SEARCH_INDEX_FILENAME)
+    try:
+        if args.update:
+            start = time.perf_counter()
+            indexed, errors = metadata_search.update_index(con, folder)
+            for name, error in errors:
+                print(f"Error reading {name}: {error}", file=sys.stderr)
+            if indexed:
+                print(f"Indexed {indexed} new or changed file(s) in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+
+        start = time.perf_counter()
+        try:
+            names = metadata_search.search(con, args.text, predicates, args.limit)
+        except Exception as e:  # e.g. a full-text query with invalid FTS5 syntax
+            raise SystemExit(f"Invalid query: {e}")
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        rows = [(name, metadata_search.get_properties(con, name, fields or None)) for name in names]
+        if args.format == "jsonl":
+            for name, record in rows:
+                print(format_json_line(name, record))
+        elif fields and rows:
+            print("\n".join(format_table(rows, fields)))
+        else:
+            for name in names:
+                print(name)
+        total = con.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+        print(f"{len(names)} of {total} indexed files matched in {elapsed_ms:.1f} ms", file=sys.stderr)
+    finally:
+        con.close()
+
+if __name__ == "__main__":
+    main()
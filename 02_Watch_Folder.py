@@ -0,0 +1,34 @@
+import tkinter as tk
+from tkinter import filedialog
+from pathlib import Path
+from jpk_watch import watch_folder
+from extract_settings import extract_options
+
+# ----------------------------- Settings -----------------------------
+# New files are extracted with the settings in extract_settings.py (as 02_Extract_Channels.py),
+# except for the ones below.
+POLL_SECONDS = 2.0                 # How often the folder is checked for new files
+STABLE_SECONDS = 5.0               # A file must stay unchanged this long before it is processed
+RETRY_SECONDS = 60.0               # A file that failed is tried again after this long
+NUM_WORKERS = 2                    # JPK files processed in parallel when several arrive at once
+METADATA_MODE = "readable"         # "readable", "full" or "structured", see jpk_extract.py
+EXPORT_FORMATS = ["csv"]           # Parameter tables regenerated from the index: "xlsx", "csv", "parquet"
+EXPORT_SECONDS = 30.0              # At most this often while files arrive, and once more when the watch stops
+
+# ----------------------------- Main -----------------------------
+if __name__ == "__main__":  # Required so worker processes do not re-open the dialog
+    # --- GUI to Select Folder ---
+    root = tk.Tk()
+    root.withdraw()
+    folder_path = filedialog.askdirectory(title="Select Folder Where the JPK Files Arrive")
+    if not folder_path:
+        raise SystemExit("No folder selected. Exiting.")
+    folder_path = Path(folder_path)
+
+    print(f"Watching {folder_path} (Ctrl+C to stop)")
+    try:
+        watch_folder(folder_path, poll_seconds=POLL_SECONDS, stable_seconds=STABLE_SECONDS,
+                     retry_seconds=RETRY_SECONDS, export_seconds=EXPORT_SECONDS, export_formats=EXPORT_FORMATS,
+                     **extract_options(num_workers=NUM_WORKERS, metadata_mode=METADATA_MODE))
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
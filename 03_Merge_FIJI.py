@@ -1,4 +1,5 @@
 # NOTE Something is not working but moving on since this goal is less important
+# For a headless merge (no FIJI, any number of stacks, grid layouts) use 03_Merge_Stacks.py
 
 #@ File(label="Select first folder with TIFF files", style="directory") folder1
 #@ File(label="Select second folder with TIFF files", style="directory") folder2
@@ -10,14 +11,20 @@ from ij import ImageStack
 from java.io import File
 from javax.swing import JFrame, JButton
 import os
-
-# --- FUNCTION: Return sorted list of TIFFs in a folder ---
+# Acquisition order from Timestamp_index.csv, if fiji_timestamps.py is in Fiji.app/jars/Lib;
+# without it, files are taken in name order as before
+try:
+    from fiji_timestamps import load_timestamp_index, acquisition_order
+except ImportError:
+    def load_timestamp_index(folder):
+        return {}
+    def acquisition_order(fnames, index):
+        return sorted(fnames)
+
+# --- FUNCTION: Return list of TIFFs in a folder, in acquisition order ---
 def sorted_tiff_paths(folder):
-    return sorted([
-        os.path.join(folder, f)
-        for f in os.listdir(folder)
-        if f.endswith('.tif')
-    ])
+    names = [f for f in os.listdir(folder) if f.endswith('.tif')]
+    return [os.path.join(folder, f) for f in acquisition_order(names, load_timestamp_index(folder))]
 
 # --- LOAD TIFFs FROM BOTH FOLDERS ---
 folder1_path = folder1.getAbsolutePath()
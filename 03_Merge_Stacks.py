@@ -0,0 +1,50 @@
+import time
+import tkinter as tk
+from tkinter import filedialog, messagebox
+from pathlib import Path
+from stack_merge import merge_stacks
+
+# Headless replacement for 03_Merge_FIJI.py: no FIJI needed, multi-page inputs are memory-mapped
+# and merged frames are streamed to one multi-page TIFF.
+
+# ----------------------------- Settings -----------------------------
+INPUT_MODE = "folders"    # "folders" (TIFFs in name/acquisition order, every page a frame) or "stacks" (multi-page TIFF files)
+LAYOUT = "split"          # "split" (each stack shows its own vertical strip, 2 stacks = left/right halves),
+                          # "side-by-side" (full frames in one row) or "grid"
+GRID_COLUMNS = None       # Columns for "grid" (None = square-ish)
+GAP = 0                   # Pixels between cells (side-by-side and grid)
+SIZE_MODE = "crop"        # Unequal frame sizes: "crop" to the smallest, "pad" to the largest, "resize" to the smallest
+SLICE_MODE = "shortest"   # Unequal slice counts: "shortest", "longest" (blank frames) or "repeat" (hold last frame)
+FILL_VALUE = 0            # Value of padding and missing frames
+COMPRESSION = None        # None or "zlib" for the merged stack
+
+# ----------------------------- Main -----------------------------
+if __name__ == "__main__":
+    root = tk.Tk()
+    root.withdraw()
+
+    # --- Select two or more inputs ---
+    sources = []
+    while True:
+        title = f"Select stack {len(sources) + 1}"
+        if INPUT_MODE == "folders":
+            source = filedialog.askdirectory(title=f"{title} (folder with TIFF files)")
+        else:
+            source = filedialog.askopenfilename(title=title, filetypes=[("TIFF files", "*.tif *.tiff")])
+        if not source:
+            break
+        sources.append(Path(source))
+        if len(sources) >= 2 and not messagebox.askyesno("Merge Stacks", "Add another stack?"):
+            break
+    if len(sources) < 2:
+        raise SystemExit("At least two stacks are needed. Exiting.")
+
+    output_path = filedialog.asksaveasfilename(title="Save Merged Stack As", defaultextension=".tif",
+                                               initialfile="Merged_stack.tif", filetypes=[("TIFF files", "*.tif")])
+    if not output_path:
+        raise SystemExit("No output file selected. Exiting.")
+
+    start = time.time()
+    num_frames = merge_stacks(sources, Path(output_path), LAYOUT, GRID_COLUMNS, SIZE_MODE, SLICE_MODE,
+                              GAP, FILL_VALUE, COMPRESSION)
+    print(f"✔ {num_frames} merged frame(s) saved to {output_path} in {time.time() - start:.1f} s")
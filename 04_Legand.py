@@ -9,11 +9,23 @@ from ij import IJ, ImagePlus, ImageStack
 from ij.gui import Overlay, TextRoi, GenericDialog
 from java.awt import Color, Font
 from datetime import datetime
-import os, re
-
-# --- Step 1: Get all TIFF files in the selected folder ---
+import os, re, csv
+# Acquisition order from Timestamp_index.csv, if fiji_timestamps.py is in Fiji.app/jars/Lib;
+# without it, files are taken in name order as before
+try:
+    from fiji_timestamps import load_timestamp_index, acquisition_order, find_timestamp_row
+except ImportError:
+    def load_timestamp_index(folder):
+        return {}
+    def acquisition_order(fnames, index):
+        return sorted(fnames)
+    def find_timestamp_row(index, fname):
+        return None
+
+# --- Step 1: Get all TIFF files in the selected folder (in acquisition order) ---
 folder_path = folder.getAbsolutePath()
-tiff_files = [f for f in sorted(os.listdir(folder_path)) if f.lower().endswith((".tif", ".tiff"))]
+timestamp_index = load_timestamp_index(folder_path)
+tiff_files = acquisition_order([f for f in os.listdir(folder_path) if f.lower().endswith((".tif", ".tiff"))], timestamp_index)
 
 if not tiff_files:
     IJ.showMessage("No TIFF images found.")
@@ -49,30 +61,25 @@ if x_scan_length and y_scan_length:
 else:
     msg += "\nNo scan size info found in TIFF metadata (tags 32834/32835)."
 
-msg += "\n\nProceeding to manual scale setting..."
+msg += "\n\nThe stack will be calibrated with this pixel size." if x_scan_length and y_scan_length else "\n\nProceeding to manual scale setting..."
 IJ.showMessage("TIFF Metadata", msg)
 
-# --- Step 5: Build an image stack from all TIFF files ---
-stack = ImageStack(width, height)
-for fname in tiff_files:
-    imp = IJ.openImage(os.path.join(folder_path, fname))
-    if imp is not None:
-        stack.addSlice(fname, imp.getProcessor())
-
-if stack.getSize() == 0:
-    IJ.showMessage("No valid images loaded.")
-    exit()
-
-stack_imp = ImagePlus("Stacked TIFFs", stack)
-stack_imp.show()
+# --- Step 5: Metadata parsing helpers ---
+metadata_store_cache = {}
+
+def resolve_metadata_store(info):
+    # TIFFs extracted with METADATA_STORAGE = "store" only reference the shared JPK header
+    match = re.search(r"metadata-store : (.+)", info)
+    if not match:
+        return info
+    store_path = os.path.normpath(os.path.join(folder_path, match.group(1).strip()))
+    if store_path not in metadata_store_cache:
+        metadata_store_cache[store_path] = ""
+        if os.path.isfile(store_path):
+            with open(store_path) as f:
+                metadata_store_cache[store_path] = f.read()
+    return info + "\n" + metadata_store_cache[store_path]
 
-# --- Apply AFM JPK LUT to the stack ---
-IJ.run(stack_imp, "AFM JPK", "")
-
-# --- Step 6: Ask user to set the scale manually (opens dialog) ---
-IJ.run("Set Scale...")
-
-# --- Step 7: Metadata parsing helpers ---
 def parse_info_param(info, param_name):
     for line in info.split("\n"):
         if param_name in line:
@@ -89,41 +96,190 @@ def extract_start_time(info_str):
             return None
     return None
 
-def get_metadata_values(imp):
-    info = imp.getInfoProperty() or ""
+# --- Per-slice metadata table, cached next to the images ---
+# One row per slice, computed once while the stack is built. Rows are reused on the
+# next run as long as the file size and modification time are unchanged and the row has
+# the current LEGEND_SCHEMA (same table and schema as legend_render.py).
+LEGEND_TABLE = os.path.join(folder_path, "Legend_metadata.csv")
+LEGEND_SCHEMA = "2"
+LEGEND_COLUMNS = ["file", "schema", "size", "mtime", "time", "spring_constant", "sensitivity",
+                  "amplitude", "setpoint", "normal_force", "tapping_force", "force_status"]
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+def as_text(value):
+    # The csv module of Jython 2.7 writes byte strings
+    if isinstance(value, unicode):
+        return value.encode("utf-8")
+    return str(value)
+
+def file_stamp(path):
+    st = os.stat(path)
+    return str(st.st_size), str(int(st.st_mtime))
+
+# Unit tables and to_si, shared with "04_Legand copy.py", if fiji_units.py is in
+# Fiji.app/jars/Lib. Without it, forces are left empty and such rows are stored
+# without a schema, so they are recomputed once the module is installed.
+UNITS_MISSING = "fiji_units.py not installed"
+try:
+    from fiji_units import SPRING_UNITS, SENSITIVITY_UNITS, AMPLITUDE_UNITS, SETPOINT_UNITS, to_si
+except ImportError:
+    SPRING_UNITS = SENSITIVITY_UNITS = AMPLITUDE_UNITS = SETPOINT_UNITS = None
+    def to_si(text, units, name, problems):
+        if UNITS_MISSING not in problems:
+            problems.append(UNITS_MISSING)
+        return None
+
+def slice_metadata(fname, info):
+    info = resolve_metadata_store(info)
     spring = parse_info_param(info, "cantilever-calibration-info.spring-constant")
     sensitivity = parse_info_param(info, "cantilever-calibration-info.sensitivity")
     voltage = parse_info_param(info, "feedback-mode.adjust-reference-amplitude-feedback-settings.reference-amplitude")
     relset = parse_info_param(info, "feedback-mode.setpoint-feedback-settings.relative-setpoint")
 
+    # Explicit unit conversion as in force_calc.py, problems are recorded instead of hidden
+    problems = []
+    k = to_si(spring, SPRING_UNITS, "spring constant", problems)  # N/m
+    s = to_si(sensitivity, SENSITIVITY_UNITS, "sensitivity", problems)  # m/V
+    V = to_si(voltage, AMPLITUDE_UNITS, "amplitude", problems)  # V
+    rel = to_si(relset, SETPOINT_UNITS, "setpoint", problems)
+    F_normal = repr(k * V * s) if None not in (k, V, s) else ""
+    F_tapping = repr(k * V * rel) if None not in (k, V, rel) else ""
+
+    dt = extract_start_time(info)  # Parsed once per slice
+    return {
+        "file": fname,
+        "time": dt.strftime(TIME_FORMAT) if dt else "",
+        "spring_constant": as_text(spring),
+        "sensitivity": as_text(sensitivity),
+        "amplitude": as_text(voltage),
+        "setpoint": as_text(relset),
+        "normal_force": F_normal,
+        "tapping_force": F_tapping,
+        "force_status": "; ".join(problems),
+    }
+
+def load_legend_table(path):
+    rows = {}
+    if os.path.isfile(path):
+        with open(path, "rb") as f:
+            for row in csv.DictReader(f):
+                rows[row["file"]] = row
+    return rows
+
+def save_legend_table(path, rows):
+    with open(path, "wb") as f:
+        writer = csv.DictWriter(f, LEGEND_COLUMNS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+
+def frame_sources(path):
+    # Output names of the frames of a stack written by the extract scripts
+    # (<stack>_frames.txt next to it), or None. FIJI only reads a stack's first description.
+    list_path = os.path.splitext(path)[0] + "_frames.txt"
+    if not os.path.isfile(list_path):
+        return None
+    with open(list_path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+def read_text(path):
+    with open(path) as f:
+        return f.read()
+
+# --- Step 6: Build an image stack and its metadata table in one pass ---
+# Every TIFF is opened exactly once; table rows line up with the stack slices.
+# Multi-page files (stack output of the extract scripts) contribute every slice, each
+# with the metadata of its own source file (TIFF_<channel>_<role>/metadata/<name>_metadata.txt).
+cached_rows = load_legend_table(LEGEND_TABLE)
+legend_rows = []
+metadata_folder = os.path.join(os.path.dirname(folder_path), "metadata")
+stack = ImageStack(width, height)
+for fname in tiff_files:
+    path = os.path.join(folder_path, fname)
+    imp = IJ.openImage(path)
+    if imp is None:
+        continue
+    source = imp.getStack()
+    names = frame_sources(path) if source.getSize() > 1 else None
+    for s in range(1, source.getSize() + 1):
+        label, info_path = fname, path
+        if source.getSize() > 1:
+            label = "{}:{}".format(fname, s)
+            if names and s <= len(names) and os.path.isfile(os.path.join(metadata_folder, names[s - 1] + "_metadata.txt")):
+                label = names[s - 1]
+                info_path = os.path.join(metadata_folder, label + "_metadata.txt")
+        stack.addSlice(label, source.getProcessor(s))
+        size, mtime = file_stamp(info_path)
+        row = cached_rows.get(label)
+        if row is None or (row.get("schema"), row["size"], row["mtime"]) != (LEGEND_SCHEMA, size, mtime):
+            info = read_text(info_path) if info_path != path else (imp.getInfoProperty() or "")
+            row = slice_metadata(label, info)
+            row["schema"] = LEGEND_SCHEMA if SPRING_UNITS is not None else ""
+            row["size"], row["mtime"] = size, mtime
+        legend_rows.append(row)
+
+if stack.getSize() == 0:
+    IJ.showMessage("No valid images loaded.")
+    exit()
+
+try:
+    save_legend_table(LEGEND_TABLE, legend_rows)
+except IOError as e:
+    print("Could not save {}: {}".format(LEGEND_TABLE, e))
+
+stack_imp = ImagePlus("Stacked TIFFs", stack)
+stack_imp.show()
+
+# --- Apply AFM JPK LUT to the stack ---
+IJ.run(stack_imp, "AFM JPK", "")
+
+# --- Step 7: Calibrate from the scan size written at extraction, else ask the user (opens dialog) ---
+if x_scan_length and y_scan_length:
+    cal = stack_imp.getCalibration()
+    cal.setUnit("um")
+    cal.pixelWidth = px_size_x * 1e6
+    cal.pixelHeight = px_size_y * 1e6
+    stack_imp.setCalibration(cal)
+else:
+    IJ.run("Set Scale...")
+
+# --- Legend values from the table (no image is reopened) ---
+def parse_time(text):
+    try:
+        return datetime.strptime(text, TIME_FORMAT) if text else None
+    except ValueError:
+        return None
+
+def format_force(text):
     try:
-        k = float(spring.split()[0]) / 1000.0  # mN/m → N/m
-        s = float(sensitivity.split()[0]) * 1e-9  # nm/V → m/V
-        V = float(voltage)
-        rel = float(relset)
-        F_normal = k * V * s
-        F_tapping = k * V * rel
-    except:
-        F_normal = F_tapping = "N/A"
+        return "{:.2e} N".format(float(text))
+    except ValueError:
+        return "N/A"
 
+def get_metadata_values(row):
+    dt = parse_time(row["time"])
     return {
-        "Title": imp.getTitle(),
-        "Time": extract_start_time(info).strftime("%Y-%m-%d %H:%M:%S") if extract_start_time(info) else "N/A",
-        "Spring Constant": spring,
-        "Normal Force": "{:.2e} N".format(F_normal) if isinstance(F_normal, float) else "N/A",
-        "Tapping Force": "{:.2e} N".format(F_tapping) if isinstance(F_tapping, float) else "N/A"
+        "Title": row["file"],
+        "Time": dt.strftime("%Y-%m-%d %H:%M:%S") if dt else "N/A",
+        "Spring Constant": row["spring_constant"] or "N/A",
+        "Normal Force": format_force(row["normal_force"]),
+        "Tapping Force": format_force(row["tapping_force"])
     }
 
-def get_elapsed_times(tiff_paths):
-    timestamps = []
-    for path in tiff_paths:
-        imp = IJ.openImage(path)
-        if imp is None:
-            timestamps.append(None)
-            continue
-        info = imp.getInfoProperty() or ""
-        dt = extract_start_time(info)
-        timestamps.append(dt)
+def get_elapsed_times(rows):
+    # From the timestamp index when it covers the first slice (gaps and out-of-order
+    # files were checked at extraction), else from the slice times in the table
+    index_rows = [find_timestamp_row(timestamp_index, row["file"]) for row in rows]
+    if index_rows and index_rows[0] is not None and index_rows[0]["elapsed_s"]:
+        t0 = float(index_rows[0]["elapsed_s"])
+        elapsed = []
+        for row, r in zip(rows, index_rows):
+            if r is not None and r["status"] != "ok":
+                IJ.log("{}: {}".format(row["file"], r["status"]))
+            elapsed.append(float(r["elapsed_s"]) - t0 if r is not None and r["elapsed_s"] else None)
+        return elapsed
+
+    timestamps = [parse_time(row["time"]) for row in rows]
 
     if not timestamps[0]:
         return [None] * len(timestamps)
@@ -154,8 +310,7 @@ if not selected:
     exit()
 
 # --- Step 9: Draw overlay text on each slice of the stack ---
-image_paths = [os.path.join(folder_path, f) for f in tiff_files]
-elapsed_times = get_elapsed_times(image_paths)
+elapsed_times = get_elapsed_times(legend_rows)
 
 font_size = max(10, int(height * 0.03))
 spacing = int(font_size * 1.5)
@@ -163,8 +318,7 @@ font = Font("SansSerif", Font.PLAIN, font_size)
 x, y = 10, 10
 
 for i in range(stack.getSize()):
-    imp = IJ.openImage(image_paths[i])
-    meta = get_metadata_values(imp)
+    meta = get_metadata_values(legend_rows[i])
     overlay = Overlay()
     ypos = y
 
@@ -0,0 +1,35 @@
+import time
+import tkinter as tk
+from tkinter import filedialog
+from pathlib import Path
+from legend_render import render_legends
+
+# Headless counterpart of 04_Legand.py: the legend is burned into the pixels of every
+# frame and saved as one annotated stack, e.g. for publication figures and movies.
+
+# ----------------------------- Settings -----------------------------
+FIELDS = ["Title", "Time", "Spring Constant", "Normal Force", "Tapping Force", "Elapsed Time"]  # Lines, top to bottom
+FONT_SIZE = None          # Pixels; None = 3% of the image height (as 04_Legand.py)
+POSITION = (10, 10)       # Top-left corner of the legend
+TO_8BIT = True            # Contrast-stretch frames to 8-bit first (False = keep the original data type)
+SATURATED = 0.35          # % of saturated pixels for the 8-bit stretch (FIJI's Enhance Contrast default)
+BOX_OPACITY = 0.5         # Darkening behind the text (0 = none)
+NUM_THREADS = 4           # Frames rendered in parallel
+OUTPUT_NAME = "Legend_stack.tif"  # Saved as <folder name>_Legend_stack.tif next to (not in) the selected folder
+
+# ----------------------------- Main -----------------------------
+if __name__ == "__main__":
+    root = tk.Tk()
+    root.withdraw()
+    folder_path = filedialog.askdirectory(title="Choose folder with TIFF images")
+    if not folder_path:
+        raise SystemExit("No folder selected. Exiting.")
+    folder_path = Path(folder_path)
+
+    start = time.time()
+    output_path = folder_path.parent / f"{folder_path.name}_{OUTPUT_NAME}"  # Outside, so it is never read as a frame
+    num_frames = render_legends(folder_path, output_path, FIELDS, FONT_SIZE, POSITION, TO_8BIT, SATURATED,
+                                BOX_OPACITY, NUM_THREADS)
+    if not num_frames:
+        raise SystemExit("No TIFF images found.")
+    print(f"✔ {num_frames} annotated frame(s) saved to {output_path} in {time.time() - start:.1f} s")
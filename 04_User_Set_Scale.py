@@ -2,10 +2,20 @@
 
 from ij import IJ, ImagePlus, ImageStack
 import os
+# Acquisition order from Timestamp_index.csv, if fiji_timestamps.py is in Fiji.app/jars/Lib;
+# without it, files are taken in name order as before
+try:
+    from fiji_timestamps import load_timestamp_index, acquisition_order
+except ImportError:
+    def load_timestamp_index(folder):
+        return {}
+    def acquisition_order(fnames, index):
+        return sorted(fnames)
 
-# --- Step 1: Load TIFF images from folder ---
+# --- Step 1: Load TIFF images from folder (in acquisition order) ---
 folder_path = folder.getAbsolutePath()
-tiff_files = [f for f in sorted(os.listdir(folder_path)) if f.lower().endswith((".tif", ".tiff"))]
+timestamp_index = load_timestamp_index(folder_path)
+tiff_files = acquisition_order([f for f in os.listdir(folder_path) if f.lower().endswith((".tif", ".tiff"))], timestamp_index)
 
 if not tiff_files:
     IJ.showMessage("No TIFF images found in selected folder.")
@@ -48,7 +58,7 @@ if x_scan_length and y_scan_length:
 else:
     msg += "\n\nNo physical scan size found in TIFF tags 32834/32835.\nPixel size unknown."
 
-msg += "\n\nYou can now set the scale manually."
+msg += "\n\nThe stack will be calibrated with this pixel size." if x_scan_length and y_scan_length else "\n\nYou can now set the scale manually."
 IJ.showMessage("TIFF Metadata", msg)
 
 # --- Step 4: Create image stack ---
@@ -61,7 +71,11 @@ for fname in tiff_files:
         continue
     if stack is None:
         stack = ImageStack(imp.getWidth(), imp.getHeight())
-    stack.addSlice(fname, imp.getProcessor())
+    # Multi-page files (stack output of the extract scripts) contribute every slice
+    source = imp.getStack()
+    for s in range(1, source.getSize() + 1):
+        label = fname if source.getSize() == 1 else "{}:{}".format(fname, s)
+        stack.addSlice(label, source.getProcessor(s))
 
 if stack is None or stack.getSize() == 0:
     IJ.showMessage("No valid images to stack.")
@@ -70,5 +84,12 @@ if stack is None or stack.getSize() == 0:
 stack_imp = ImagePlus("Stacked TIFFs", stack)
 stack_imp.show()
 
-# --- Step 5: Prompt user to manually set scale ---
-IJ.run("Set Scale...")
+# --- Step 5: Calibrate from the scan size written at extraction, else prompt the user ---
+if x_scan_length and y_scan_length:
+    cal = stack_imp.getCalibration()
+    cal.setUnit("um")
+    cal.pixelWidth = px_size_x * 1e6
+    cal.pixelHeight = px_size_y * 1e6
+    stack_imp.setCalibration(cal)
+else:
+    IJ.run("Set Scale...")
@@ -1,6 +1,7 @@
 # NOTE StagregJ being weird and creating black images 
 # NOTE Being imporved: Image flattening, Plane leveling
 # NOTE Script is automatic 
+# NOTE Steps 1, 2, 4 and 6 also run without FIJI on whole stacks: 05_Headless_Pipeline.py
 
 from ij import IJ, WindowManager, ImagePlus, ImageStack
 from ij.io import FileSaver
@@ -9,6 +10,15 @@ from javax.swing import JOptionPane
 from ij.plugin import ZProjector
 from ij.measure import Calibration
 import os
+# Acquisition order from Timestamp_index.csv, if fiji_timestamps.py is in Fiji.app/jars/Lib;
+# without it, files are taken in name order as before
+try:
+    from fiji_timestamps import load_timestamp_index, acquisition_order
+except ImportError:
+    def load_timestamp_index(folder):
+        return {}
+    def acquisition_order(fnames, index):
+        return sorted(fnames)
 
 # ========== UTILITY FUNCTIONS ==========
 
@@ -71,7 +81,8 @@ def process_stack_slices(imp, step_name, command, args):
 
 # ========== IMAGE LOADING ==========
 folder_path = folder.getAbsolutePath()
-tiff_files = [f for f in sorted(os.listdir(folder_path)) if f.lower().endswith((".tif", ".tiff"))]
+timestamp_index = load_timestamp_index(folder_path)
+tiff_files = acquisition_order([f for f in os.listdir(folder_path) if f.lower().endswith((".tif", ".tiff"))], timestamp_index)
 
 if not tiff_files:
     IJ.showMessage("No TIFF images found in selected folder.")
@@ -104,7 +115,7 @@ if x_scan_length and y_scan_length:
     msg += "\n\nEstimated pixel size:\nX = {:.3e} m/pixel\nY = {:.3e} m/pixel".format(px_size_x, px_size_y)
 else:
     msg += "\n\nNo physical scan size found in TIFF tags 32834/32835.\nPixel size unknown."
-msg += "\n\nYou can now set the scale manually."
+msg += "\n\nThe stack will be calibrated with this pixel size." if x_scan_length and y_scan_length else "\n\nYou can now set the scale manually."
 IJ.showMessage("TIFF Metadata", msg)
 
 stack = ImageStack(width, height)
@@ -112,7 +123,11 @@ for fname in tiff_files:
     path = os.path.join(folder_path, fname)
     imp = IJ.openImage(path)
     if imp:
-        stack.addSlice(fname, imp.getProcessor())
+        # Multi-page files (stack output of the extract scripts) contribute every slice
+        source = imp.getStack()
+        for s in range(1, source.getSize() + 1):
+            label = fname if source.getSize() == 1 else "{}:{}".format(fname, s)
+            stack.addSlice(label, source.getProcessor(s))
 
 if stack.getSize() == 0:
     IJ.showMessage("No valid images to stack.")
@@ -121,7 +136,15 @@ if stack.getSize() == 0:
 imp = ImagePlus("Stacked TIFFs", stack)
 imp.show()
 
-IJ.run("Set Scale...")
+# Calibrate from the scan size written at extraction, else let the user set the scale
+if x_scan_length and y_scan_length:
+    cal = imp.getCalibration()
+    cal.setUnit("um")
+    cal.pixelWidth = px_size_x * 1e6
+    cal.pixelHeight = px_size_y * 1e6
+    imp.setCalibration(cal)
+else:
+    IJ.run("Set Scale...")
 
 # ====== OPTIONAL: Apply AFM JPK LUT ======
 if ask_yes_no_nonblocking("Apply LUT?", "Do you want to apply the 'AFM JPK' LUT to the stack?"):
@@ -15,6 +15,15 @@ from javax.swing import JOptionPane
 from ij.plugin import ZProjector
 from ij.measure import Calibration
 import os
+# Acquisition order from Timestamp_index.csv, if fiji_timestamps.py is in Fiji.app/jars/Lib;
+# without it, files are taken in name order as before
+try:
+    from fiji_timestamps import load_timestamp_index, acquisition_order
+except ImportError:
+    def load_timestamp_index(folder):
+        return {}
+    def acquisition_order(fnames, index):
+        return sorted(fnames)
 
 # ========== UTILITY FUNCTIONS ==========
 
@@ -78,7 +87,8 @@ def offer_to_save_log(basename, last_step):
 
 # Load folder of TIFFs
 folder_path = folder.getAbsolutePath()
-tiff_files = [f for f in sorted(os.listdir(folder_path)) if f.lower().endswith((".tif", ".tiff"))]
+timestamp_index = load_timestamp_index(folder_path)
+tiff_files = acquisition_order([f for f in os.listdir(folder_path) if f.lower().endswith((".tif", ".tiff"))], timestamp_index)
 
 if not tiff_files:
     IJ.showMessage("No TIFF images found in selected folder.")
@@ -114,7 +124,7 @@ if x_scan_length and y_scan_length:
     msg += "\n\nEstimated pixel size:\nX = {:.3e} m/pixel\nY = {:.3e} m/pixel".format(px_size_x, px_size_y)
 else:
     msg += "\n\nNo physical scan size found in TIFF tags 32834/32835.\nPixel size unknown."
-msg += "\n\nYou can now set the scale manually."
+msg += "\n\nThe stack will be calibrated with this pixel size." if x_scan_length and y_scan_length else "\n\nYou can now set the scale manually."
 IJ.showMessage("TIFF Metadata", msg)
 
 # Stack all images from folder into a single image stack
@@ -123,7 +133,11 @@ for fname in tiff_files:
     path = os.path.join(folder_path, fname)
     imp = IJ.openImage(path)
     if imp:
-        stack.addSlice(fname, imp.getProcessor())
+        # Multi-page files (stack output of the extract scripts) contribute every slice
+        source = imp.getStack()
+        for s in range(1, source.getSize() + 1):
+            label = fname if source.getSize() == 1 else "{}:{}".format(fname, s)
+            stack.addSlice(label, source.getProcessor(s))
 
 if stack.getSize() == 0:
     IJ.showMessage("No valid images to stack.")
@@ -133,8 +147,15 @@ if stack.getSize() == 0:
 imp = ImagePlus("Stacked TIFFs", stack)
 imp.show()
 
-# Let user manually set scale
-IJ.run("Set Scale...")
+# Calibrate from the scan size written at extraction, else let the user set the scale
+if x_scan_length and y_scan_length:
+    cal = imp.getCalibration()
+    cal.setUnit("um")
+    cal.pixelWidth = px_size_x * 1e6
+    cal.pixelHeight = px_size_y * 1e6
+    imp.setCalibration(cal)
+else:
+    IJ.run("Set Scale...")
 
 # ====== OPTIONAL: Apply LUT for AFM JPK images ======
 
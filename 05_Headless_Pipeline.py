@@ -0,0 +1,41 @@
+import time
+import tkinter as tk
+from tkinter import filedialog
+from pathlib import Path
+from stack_pipeline import parse_workflow, run_folder, default_output_folder, FIJI_ONLY_STEPS
+
+# Headless counterpart of 05_Final_Automatic.py: the same step codes and parameter strings,
+# applied to the whole stack with NumPy, without FIJI and without confirmation dialogs.
+
+# ----------------------------- Settings -----------------------------
+# Step codes as in 05_Final_Automatic.py: 1 Gaussian Blur, 2 Enhance Contrast, 3 Drift Correction,
+# 4 Z Projection, 5 TrackMate Kymograph, 6 Subtract Background (3 and 5 need FIJI and are skipped)
+STEP_ORDER = "1,2,6,4"
+PARAMETERS = "sigma=2; saturated=0.35; ; ; ; rolling=50"  # One entry per step code 1–6, empty = default
+INPUT_MODE = "folder"      # "folder" (TIFFs as 05_Final_Automatic.py, every page a frame) or "stack" (multi-page TIFF)
+SAVE_EACH_STEP = False     # Also save the stack after every step (<title>_<Step_Name>_<n>.tif)
+OUTPUT_FOLDER = None       # None = "<folder>_pipeline" next to the selected folder, or the stack's folder
+
+# ----------------------------- Main -----------------------------
+if __name__ == "__main__":
+    root = tk.Tk()
+    root.withdraw()
+
+    if INPUT_MODE == "folder":
+        source = filedialog.askdirectory(title="Choose folder with TIFF images")
+    else:
+        source = filedialog.askopenfilename(title="Choose TIFF stack", filetypes=[("TIFF files", "*.tif *.tiff")])
+    if not source:
+        raise SystemExit("No input selected. Exiting.")
+    source = Path(source)
+    output_folder = Path(OUTPUT_FOLDER) if OUTPUT_FOLDER else default_output_folder(source)
+
+    print("Selected Workflow:")
+    for i, (step, name, parameters) in enumerate(parse_workflow(STEP_ORDER, PARAMETERS), start=1):
+        print(f"{i}. {name} ({'needs FIJI, skipped' if step in FIJI_ONLY_STEPS else parameters or 'default'})")
+
+    start = time.time()
+    written = run_folder(source, output_folder, STEP_ORDER, PARAMETERS, save_each_step=SAVE_EACH_STEP)
+    for path in written:
+        print(f"Saved: {path}")
+    print(f"✔ Done in {time.time() - start:.1f} s")
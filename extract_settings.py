@@ -0,0 +1,35 @@
+import os
+
+# Extraction settings shared by 02_Extract_Channels.py, 02_Extract_Channels_Full_Metadata.py
+# and 02_Watch_Folder.py. Edit them here once; each script only sets what differs
+# (the metadata mode, and the watch's own polling settings).
+
+# ----------------------------- Settings -----------------------------
+NUM_WORKERS = os.cpu_count() or 1  # JPK files processed in parallel (1 = one after another)
+PAGE_THREADS = 4                   # Pages decoded/written in parallel within each JPK
+USE_MANIFEST = True                # Record finished files in Extraction_manifest.sqlite and skip them on reruns (always on when watching)
+INDEX_METADATA = True              # Add each file's metadata to Metadata_search.sqlite (see 02_Search_Metadata.py)
+INDEX_TIMESTAMPS = True            # Record acquisition times in Timestamp_index.csv (stacks are then ordered by time)
+PALETTE_MODE = "rgb"               # Palette pages: "rgb" (expand to RGB) or "indexed" (keep indices + colormap)
+METADATA_STORAGE = "embedded"      # "embedded" (full metadata in every TIFF) or "store" (saved once in metadata_store/, TIFFs keep a reference)
+OUTPUT_LAYOUT = "files"            # "files" (one TIFF per JPK and channel) or "stack" (one multi-page TIFF per channel)
+EXPORT_ZARR = False                # Also append all channels to one chunked store, channels.zarr (file × channel × role × y × x)
+COMPRESSION = None                 # None, "zlib", "lzw" or "zstd" (lzw/zstd need imagecodecs), see 02_Compression_Report.py
+PREDICTOR = None                   # None, "horizontal" or "floatingpoint" (only used with compression)
+TILE = None                        # None (strips) or a tile size such as (256, 256)
+ENCODE_THREADS = 1                 # Threads compressing the strips/tiles of each image
+CHANNEL_FILTER = []                # Channels to keep, "<channel glob>[:<role glob>]", e.g. ["height*:trace", "amplitude*"]; empty = all
+CALIBRATE = True                   # Write the scan size (tags 32834/32835) as pixel size into every TIFF, FIJI opens them calibrated
+
+
+def extract_options(**overrides):
+    # Keyword arguments of jpk_extract.extract_folder from the settings above;
+    # `overrides` (e.g. metadata_mode="full") replace or add single entries.
+    options = {"num_workers": NUM_WORKERS, "page_threads": PAGE_THREADS, "use_manifest": USE_MANIFEST,
+               "index_metadata": INDEX_METADATA, "index_timestamps": INDEX_TIMESTAMPS,
+               "palette_mode": PALETTE_MODE, "metadata_storage": METADATA_STORAGE,
+               "output_layout": OUTPUT_LAYOUT, "export_zarr": EXPORT_ZARR, "compression": COMPRESSION,
+               "predictor": PREDICTOR, "tile": TILE, "encode_threads": ENCODE_THREADS,
+               "channel_filter": list(CHANNEL_FILTER), "calibrate": CALIBRATE}
+    options.update(overrides)
+    return options
@@ -0,0 +1,78 @@
+import json  # For storing settings and output lists
+import sqlite3  # For the on-disk manifest
+import hashlib  # For fingerprinting extraction settings
+from datetime import datetime
+
+# Manifest file stored next to the JPK files
+MANIFEST_FILENAME = "Extraction_manifest.sqlite"
+
+# Options that change speed but not the written files
+_SPEED_ONLY_OPTIONS = {"encode_threads"}
+
+# ----------------------------- Open (or create) the manifest -----------------------------
+def open_manifest(db_path):
+    con = sqlite3.connect(db_path)
+    con.execute(
+        "CREATE TABLE IF NOT EXISTS jobs ("
+        " name TEXT PRIMARY KEY,"        # JPK file name
+        " size INTEGER NOT NULL,"        # Source size in bytes
+        " mtime_ns INTEGER NOT NULL,"    # Source modification time in nanoseconds
+        " settings TEXT NOT NULL,"       # Fingerprint of the extraction settings
+        " status TEXT NOT NULL,"         # "done" or "failed"
+        " outputs TEXT NOT NULL,"        # JSON list of written files, relative to the folder
+        " error TEXT,"                   # Last error for failed jobs
+        " updated TEXT NOT NULL)"        # Time of the last attempt
+    )
+    return con
+
+# ----------------------------- Fingerprint of the extraction settings -----------------------------
+def settings_signature(options):
+    relevant = {key: value for key, value in options.items() if key not in _SPEED_ONLY_OPTIONS}
+    return hashlib.sha1(json.dumps(relevant, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+# ----------------------------- Find files that need (re)extraction -----------------------------
+def find_pending(con, file_stats, signature, folder_path):
+    # file_stats: {file name: (size, mtime_ns)}. Returns {file name: reason} of the files
+    # that need (re)extraction, in file_stats order. The reason is "new", "changed" (on
+    # disk), "settings" (extracted with other settings), "failed" (last time, unchanged
+    # since) or "missing output".
+    jobs = {
+        name: (size, mtime_ns, settings, status, outputs)
+        for name, size, mtime_ns, settings, status, outputs
+        in con.execute("SELECT name, size, mtime_ns, settings, status, outputs FROM jobs")
+    }
+    pending = {}
+    for name, stat in file_stats.items():
+        job = jobs.get(name)
+        if job is None:
+            pending[name] = "new"
+        elif job[:2] != stat:
+            pending[name] = "changed"
+        elif job[2] != signature:
+            pending[name] = "settings"
+        elif job[3] != "done":
+            pending[name] = "failed"
+        elif not all((folder_path / output).exists() for output in json.loads(job[4])):
+            pending[name] = "missing output"
+    return pending
+
+# ----------------------------- Record results -----------------------------
+def get_outputs(con, name):
+    row = con.execute("SELECT outputs FROM jobs WHERE name = ?", (name,)).fetchone()
+    return json.loads(row[0]) if row else []
+
+def record_done(con, name, stat, signature, outputs):
+    con.execute(
+        "INSERT OR REPLACE INTO jobs (name, size, mtime_ns, settings, status, outputs, error, updated)"
+        " VALUES (?, ?, ?, ?, 'done', ?, NULL, ?)",
+        (name, *stat, signature, json.dumps(outputs), datetime.now().isoformat(timespec="seconds")),
+    )
+    con.commit()  # Every finished file survives a crash
+
+def record_failed(con, name, stat, signature, error):
+    con.execute(
+        "INSERT OR REPLACE INTO jobs (name, size, mtime_ns, settings, status, outputs, error, updated)"
+        " VALUES (?, ?, ?, ?, 'failed', '[]', ?, ?)",
+        (name, *stat, signature, str(error), datetime.now().isoformat(timespec="seconds")),
+    )
+    con.commit()
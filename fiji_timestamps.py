@@ -0,0 +1,32 @@
+# Acquisition order from Timestamp_index.csv (written by the 02_Extract scripts), shared
+# by the FIJI scripts (03_Merge_FIJI, 04_Legand, 04_User_Set_Scale, 05_Final_*).
+# Jython 2.7: copy this file to Fiji.app/jars/Lib, which is on FIJI's Jython path. It is
+# optional: without it, the scripts fall back to name order.
+# timestamp_index.py holds the same lookups for the CPython scripts.
+import os, csv
+
+def load_timestamp_index(folder):
+    # {output stem: row} of the extraction folder's index: the folder itself, or two levels
+    # up from TIFF_<channel>_<role>/images. {} if there is none (then files keep name order).
+    for parent in (folder, os.path.dirname(folder), os.path.dirname(os.path.dirname(folder))):
+        path = os.path.join(parent, "Timestamp_index.csv")
+        if os.path.isfile(path):
+            with open(path, "rb") as f:
+                return dict((row["stem"], row) for row in csv.DictReader(f))
+    return {}
+
+def find_timestamp_row(index, fname):
+    # Row of the JPK a TIFF was extracted from ("<stem>_<channel>_<role>.tif")
+    name = os.path.splitext(fname)[0]
+    while name:
+        if name in index:
+            return index[name]
+        name = name.rpartition("_")[0]
+    return None
+
+def acquisition_order(fnames, index):
+    # File names sorted by acquisition time; files not in the index follow in name order
+    def key(fname):
+        row = find_timestamp_row(index, fname)
+        return (0, int(row["order"]), fname) if row else (1, 0, fname)
+    return sorted(fnames, key=key)
@@ -0,0 +1,33 @@
+# Unit conversion of the legend inputs, shared by the FIJI legend scripts (04_Legand.py
+# and "04_Legand copy.py"). Jython 2.7: copy this file to Fiji.app/jars/Lib, next to
+# fiji_timestamps.py. FIJI's Jython cannot import force_calc.py (it needs NumPy), so the
+# tables below must stay identical to force_calc.UNITS and DEFAULT_UNITS;
+# tests/test_force_calc.py checks them.
+import re
+
+# Unit -> factor to SI. "" is a value without a unit: the spring constant is then read
+# as mN/m and the sensitivity as nm/V.
+SPRING_UNITS = {"": 1e-3, "mN/m": 1e-3, "N/m": 1.0, "nN/nm": 1.0, "pN/nm": 1e-3}
+SENSITIVITY_UNITS = {"": 1e-9, "nm/V": 1e-9, "um/V": 1e-6, u"\u00b5m/V": 1e-6, "mm/V": 1e-3, "m/V": 1.0}
+AMPLITUDE_UNITS = {"": 1.0, "V": 1.0, "mV": 1e-3}
+SETPOINT_UNITS = {"": 1.0, "%": 1e-2}
+
+# Number and unit as parameter_export.split_value_unit reads them: the unit follows
+# after whitespace, only "%" may follow the number directly
+VALUE_UNIT = re.compile(r"\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)(?:\s+(\S+)|\s*(%))?\s*$")
+
+def to_si(text, units, name, problems):
+    # "0.1 N/m" -> 0.1; appends a reason to `problems` and returns None if unusable
+    if not text.strip() or text == "N/A":
+        problems.append("missing " + name)
+        return None
+    match = VALUE_UNIT.match(text)
+    if not match:
+        problems.append(name + " not a number")
+        return None
+    number = float(match.group(1))
+    unit = match.group(2) or match.group(3) or ""
+    if unit not in units:
+        problems.append("unknown {} unit {}".format(name, unit))
+        return None
+    return number * units[unit]
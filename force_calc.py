@@ -0,0 +1,113 @@
+import numpy as np
+from parameter_export import split_value_unit
+
+# Batch force calculation for whole parameter tables:
+#   F_normal  = k * V * s    (spring constant × reference amplitude × sensitivity)
+#   F_tapping = k * V * rel  (spring constant × reference amplitude × relative setpoint)
+# Values are parsed with their units and converted to SI explicitly; the arithmetic
+# runs on whole columns at once. Rows whose inputs are missing or have an unknown
+# unit get NaN and a reason in "status" instead of a silent "N/A".
+
+# Unit -> factor to SI. A value without a unit uses DEFAULT_UNITS: 04_Legand.py has
+# always read the spring constant as mN/m and the sensitivity as nm/V. fiji_units.py
+# holds the Jython copy of these tables for the FIJI legend scripts, which must be changed
+# together with them; tests/test_force_calc.py fails when they differ.
+UNITS = {
+    "spring_constant": {"N/m": 1.0, "mN/m": 1e-3, "nN/nm": 1.0, "pN/nm": 1e-3},  # -> N/m
+    "sensitivity": {"m/V": 1.0, "mm/V": 1e-3, "µm/V": 1e-6, "um/V": 1e-6, "nm/V": 1e-9},  # -> m/V
+    "amplitude": {"V": 1.0, "mV": 1e-3},  # -> V
+    "setpoint": {"%": 1e-2},  # -> fraction
+}
+DEFAULT_UNITS = {"spring_constant": "mN/m", "sensitivity": "nm/V", "amplitude": "V", "setpoint": None}
+
+# Parameter names (as in Parameters_To_Find.txt) of the four inputs; dotted suffixes match
+FORCE_PARAMETERS = {
+    "spring_constant": "cantilever-calibration-info.spring-constant",
+    "sensitivity": "cantilever-calibration-info.sensitivity",
+    "amplitude": "feedback-mode.adjust-reference-amplitude-feedback-settings.reference-amplitude",
+    "setpoint": "relative-setpoint",
+}
+FORCE_COLUMNS = ["normal-force", "tapping-force", "force-status"]
+
+# ----------------------------- Parse one column to SI -----------------------------
+def to_si(values, quantity):
+    # Returns (float array with NaN where invalid, list of problem strings, "" if fine).
+    # Parsing the text values is a plain Python loop, one value at a time; only the
+    # arithmetic in compute_forces runs on whole arrays.
+    units = UNITS[quantity]
+    default = DEFAULT_UNITS[quantity]
+    name = quantity.replace("_", " ")
+    numbers = np.full(len(values), np.nan)
+    problems = [""] * len(values)
+    for i, value in enumerate(values):
+        if value is None or (isinstance(value, str) and value.strip() in ("", "N/A")):
+            problems[i] = f"missing {name}"
+            continue
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            number, unit = float(value), ""
+        else:
+            number, unit = split_value_unit(str(value))
+            if number is None:
+                problems[i] = f"{name} not a number: {value!r}"
+                continue
+        unit = unit or default
+        if unit is None:
+            numbers[i] = number
+        elif unit in units:
+            numbers[i] = number * units[unit]
+        else:
+            problems[i] = f"unknown {name} unit {unit!r}"
+    return numbers, problems
+
+# ----------------------------- Forces for a whole table -----------------------------
+def compute_forces(spring_constant, sensitivity, amplitude, setpoint):
+    # Each argument is a column (sequence of strings such as "0.1 N/m", or numbers).
+    # Returns a dict of arrays: "k" (N/m), "s" (m/V), "V" (V), "rel", "normal" and
+    # "tapping" (N, NaN where an input is invalid) and "status" (list, "" = valid).
+    k, k_problems = to_si(spring_constant, "spring_constant")
+    s, s_problems = to_si(sensitivity, "sensitivity")
+    V, V_problems = to_si(amplitude, "amplitude")
+    rel, rel_problems = to_si(setpoint, "setpoint")
+
+    kV = k * V
+    normal = kV * s
+    tapping = kV * rel
+    status = ["; ".join(p for p in problems if p) for problems in zip(k_problems, s_problems, V_problems, rel_problems)]
+    return {"k": k, "s": s, "V": V, "rel": rel, "normal": normal, "tapping": tapping, "status": status}
+
+# ----------------------------- Rows of the parameter table -----------------------------
+def resolve_force_parameters(parameters):
+    # {input: parameter name} among `parameters`, or None if one of the inputs is not extracted
+    resolved = {}
+    for quantity, key in FORCE_PARAMETERS.items():
+        match = next((p for p in parameters if p == key or key.endswith("." + p) or p.endswith("." + key)), None)
+        if match is None:
+            return None
+        resolved[quantity] = match
+    return resolved
+
+def add_forces(rows, parameters, batch_size=1000):
+    # Generator: yields the row dicts with "normal-force", "tapping-force" (e.g. "1.2e-10 N",
+    # so the table export splits them into a number and a unit column) and "force-status".
+    # Rows are processed in batches so a streamed table stays streamed.
+    resolved = resolve_force_parameters(parameters)
+    batch = []
+
+    def flush():
+        columns = {quantity: [row.get(name) for row in batch] for quantity, name in (resolved or {}).items()}
+        forces = compute_forces(**columns) if resolved else None
+        for i, row in enumerate(batch):
+            if forces is None:
+                row.update({"normal-force": None, "tapping-force": None, "force-status": "inputs not extracted"})
+            else:
+                row["normal-force"] = f"{forces['normal'][i]:.6e} N" if np.isfinite(forces["normal"][i]) else None
+                row["tapping-force"] = f"{forces['tapping'][i]:.6e} N" if np.isfinite(forces["tapping"][i]) else None
+                row["force-status"] = forces["status"][i] or "ok"
+            yield row
+        batch.clear()
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield from flush()
+    yield from flush()
@@ -0,0 +1,580 @@
+import os
+import re
+import mmap
+import fnmatch
+import hashlib
+import tifffile
+import numpy as np
+import jpk_zarr
+import metadata_search
+import timestamp_index
+import extraction_manifest
+from pathlib import Path
+from contextlib import contextmanager
+from collections import defaultdict
+from jpk_metadata import parse_properties, read_jpk_metadata, read_jpk_header_text
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# ----------------------------- Text of the TIFF tags -----------------------------
+def read_tag_bytes(file_path):
+    # Every text tag of every IFD (the JPK header plus the page tags), see
+    # jpk_metadata.read_jpk_header_text. Only the tag tables are read, never the image data,
+    # so a channel filter really skips the pixels of the pages it rejects.
+    return read_jpk_header_text(file_path).encode("ISO-8859-1")
+
+# ----------------------------- Extract ASCII Metadata -----------------------------
+def extract_readable_metadata(file_path, min_length=4):
+    data = read_tag_bytes(file_path)
+    pattern = rb'[\x20-\x7E]{%d,}' % min_length
+    found = re.findall(pattern, data)
+    strings_out = [s.decode('utf-8', errors='replace') for s in found]
+    metadata_lines = [line for line in strings_out if re.match(r"^[\w\-\. ]{3,} *: *.+", line)]
+    return "\n".join(metadata_lines)
+
+# ----------------------------- Extract All Readable Strings -----------------------------
+def extract_all_ascii_strings(file_path, min_length=1):
+    data = read_tag_bytes(file_path)
+    pattern = rb'[\x20-\x7E]{%d,}' % min_length  # Printable ASCII only
+    found = re.findall(pattern, data)
+    strings_out = [s.decode('utf-8', errors='replace') for s in found]
+    return "\n".join(strings_out)
+
+# ----------------------------- Structured Header Properties -----------------------------
+def extract_structured_metadata(file_path):
+    # "key : value" lines of the parsed JPK header, read from the TIFF tags only
+    header = read_jpk_metadata(file_path)["header"]
+    lines = []
+    for key, value in header.items():
+        if isinstance(value, bool):
+            value = "true" if value else "false"
+        lines.append(f"{key} : {value}")
+    return "\n".join(lines)
+
+# ----------------------------- TIFF Tag Summaries -----------------------------
+def summarize_tags(tags):
+    return "\n".join([f"{t.code}: {t.value}" for t in tags.values()])
+
+def summarize_all_tags(tags):
+    # Full TIFF tag dump (all tags, even numeric/binary)
+    tiff_tag_summary = ""
+    for tag in tags.values():
+        try:
+            tiff_tag_summary += f"{tag.code}: {tag.name} = {tag.value}\n"
+        except Exception as e:
+            tiff_tag_summary += f"{tag.code}: <unreadable> ({e})\n"
+    return tiff_tag_summary
+
+# Metadata mode -> (whole-file metadata reader, per-page tag summary)
+METADATA_MODES = {
+    "readable": (extract_readable_metadata, summarize_tags),   # 02_Extract_Channels.py
+    "full": (extract_all_ascii_strings, summarize_all_tags),   # 02_Extract_Channels_Full_Metadata.py
+    "structured": (extract_structured_metadata, summarize_tags),  # Parsed header only
+}  # No mode reads image data
+
+# ----------------------------- Parse "retrace : true/false" from 32851 -----------------------------
+def parse_retrace_value(meta):
+    if isinstance(meta, bytes):
+        meta = meta.split(b"\x00", 1)[0].decode("ISO-8859-1")  # Tag stored as BYTE/UNDEFINED
+    retrace = next((v for k, v in parse_properties(meta).items() if k.lower() == "retrace"), None)
+    return retrace if isinstance(retrace, bool) else None  # None if unknown
+
+# ----------------------------- Assign trace/retrace roles within a channel group -----------------------------
+def assign_page_roles(pages):
+    if len(pages) == 1:
+        return [("trace", pages[0])]
+    elif len(pages) == 2:
+        meta0 = pages[0].tags.get(32851).value if 32851 in pages[0].tags else ""
+        meta1 = pages[1].tags.get(32851).value if 32851 in pages[1].tags else ""
+        retrace0 = parse_retrace_value(meta0)
+        retrace1 = parse_retrace_value(meta1)
+
+        if retrace0 and not retrace1:
+            return [("retrace", pages[0]), ("trace", pages[1])]
+        elif retrace1 and not retrace0:
+            return [("trace", pages[0]), ("retrace", pages[1])]
+        else:
+            return [("trace", pages[0]), ("retrace", pages[1])]
+    else:
+        return [(f"trace{i+1}", p) for i, p in enumerate(pages)]
+
+# ----------------------------- Channel/role filter -----------------------------
+def compile_channel_filter(patterns):
+    # Patterns are "<channel glob>" or "<channel glob>:<role glob>", matched case-insensitively
+    # against the channel name (tag 32850) and the role, e.g. ["height*:trace", "amplitude*"].
+    # An empty list keeps every page.
+    if not patterns:
+        return lambda channel_name, role: True
+
+    rules = []
+    for pattern in patterns:
+        channel_glob, _, role_glob = pattern.partition(":")
+        rules.append((channel_glob.strip().lower(), role_glob.strip().lower() or "*"))
+
+    def keep(channel_name, role):
+        channel_name, role = channel_name.lower(), role.lower()
+        return any(
+            fnmatch.fnmatchcase(channel_name, channel_glob) and fnmatch.fnmatchcase(role, role_glob)
+            for channel_glob, role_glob in rules
+        )
+
+    return keep
+
+# ----------------------------- Output naming -----------------------------
+def clean_name(name):
+    return name.replace(" ", "_").replace("(", "").replace(")", "")
+
+# ----------------------------- Content-addressed metadata store -----------------------------
+METADATA_STORE_FOLDER = "metadata_store"
+
+def store_metadata(folder_path, text):
+    # Saves `text` once under metadata_store/<sha256>.txt and returns its path.
+    # Identical headers (from any number of pages or files) share one file.
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    store_path = folder_path / METADATA_STORE_FOLDER / f"{digest}.txt"
+    if not store_path.exists():
+        store_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = store_path.with_suffix(f".{os.getpid()}.tmp")  # Other workers may write the same file
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, store_path)
+    return store_path
+
+# ----------------------------- Palette conversion -----------------------------
+def palette_lut(colormap, cache):
+    # (3, N) TIFF colormap -> (N, 3) uint8 lookup table, computed once per distinct palette
+    key = colormap.tobytes()
+    lut = cache.get(key)
+    if lut is None:
+        if colormap.dtype == np.uint16:
+            colormap = colormap >> 8  # Same as the old "/ 256" then truncation, without floats
+        lut = np.ascontiguousarray(colormap.T, dtype=np.uint8)
+        cache[key] = lut
+    return lut
+
+def tiff_colormap(colormap):
+    # TIFF files store colormaps as uint16
+    if colormap.dtype == np.uint8:
+        return colormap.astype(np.uint16) * 257
+    return colormap
+
+# ----------------------------- Zero-copy page reads -----------------------------
+def map_file(file_path):
+    # Read-only memory map of a whole JPK, shared by all its pages (None if it cannot be mapped)
+    try:
+        with open(file_path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):  # e.g. empty file or no mmap support
+        return None
+
+@contextmanager
+def mapped_file(file_path):
+    # map_file as a context manager: the map is closed on exit, so every view read from
+    # it (see read_page) must be copied or dropped inside the block
+    file_map = map_file(file_path)
+    try:
+        yield file_map
+    except BaseException:
+        if file_map is not None:
+            try:
+                file_map.close()
+            except BufferError:  # Views still held by the traceback, released with it
+                pass
+        raise
+    if file_map is not None:
+        file_map.close()
+
+def detach(array, file_map):
+    # `array` itself, or a copy of it if it is a view into `file_map`
+    if file_map is None or array is None or not np.may_share_memory(array, np.frombuffer(file_map, np.uint8)):
+        return array
+    return np.array(array, copy=True)
+
+def read_page(page, file_map=None):
+    # Page data as a read-only view into `file_map` (no copy, pages are read lazily by the OS)
+    # when the page is stored contiguous and uncompressed. The view keeps the file's byte
+    # order (e.g. ">u2" for big-endian JPKs); NumPy and tifffile convert it where needed.
+    # Any other page is decoded with page.asarray() as before.
+    if file_map is not None and page.is_memmappable:
+        dtype = page.dtype.newbyteorder(page.parent.byteorder)
+        offset = page.dataoffsets[0]
+        count = int(np.prod(page.shape))
+        if offset + count * dtype.itemsize <= len(file_map):
+            return np.frombuffer(file_map, dtype, count, offset).reshape(page.shape)
+    return page.asarray()
+
+# ----------------------------- Compression settings -----------------------------
+def compression_options(image_data, compression=None, predictor=None, tile=None, encode_threads=1):
+    # tifffile write options for one image. `compression` is None, "zlib", "lzw" or "zstd"
+    # (lzw/zstd need imagecodecs), `predictor` None, "horizontal" or "floatingpoint",
+    # `tile` None or a (height, width) tile size in multiples of 16.
+    options = {}
+    if compression:
+        options["compression"] = compression
+        if predictor == "floatingpoint" and not np.issubdtype(image_data.dtype, np.floating):
+            predictor = "horizontal"  # The floating point predictor only applies to float data
+        if predictor:
+            options["predictor"] = predictor
+        if encode_threads > 1:
+            options["maxworkers"] = encode_threads  # Strips/tiles are encoded in parallel
+    if tile:
+        options["tile"] = tuple(tile)
+    return options
+
+# ----------------------------- Physical calibration -----------------------------
+SCAN_SIZE_TAGS = (32834, 32835)  # JPK scan length in x and y (metres), in the header IFD
+
+def read_scan_size(tif):
+    # (x, y) scan length in metres from the JPK header tags, or None
+    tags = tif.pages[0].tags
+    size = []
+    for code in SCAN_SIZE_TAGS:
+        value = tags[code].value if code in tags else None
+        if isinstance(value, tuple):
+            value = value[0] if value else None
+        try:
+            size.append(float(value))
+        except (TypeError, ValueError):
+            return None
+    return tuple(size) if all(length > 0 for length in size) else None
+
+def calibration_options(image_data, scan_size):
+    # Standard TIFF resolution tags (pixels per centimetre) for a page covering the whole
+    # scan, so FIJI and other readers open it with its physical pixel size
+    if scan_size is None:
+        return {}
+    height, width = image_data.shape[:2]
+    return {"resolution": (width / (scan_size[0] * 100), height / (scan_size[1] * 100)),
+            "resolutionunit": "CENTIMETER"}
+
+def calibration_text(image_data, scan_size):
+    # The same calibration as description lines, in the "x_scan_length = <m>" form the
+    # FIJI scripts look for in the image Info
+    height, width = image_data.shape[:2]
+    return (f"x_scan_length = {scan_size[0]!r}\ny_scan_length = {scan_size[1]!r}\n"
+            f"x_pixel_size = {scan_size[0] / width!r}\ny_pixel_size = {scan_size[1] / height!r}\nunit = m")
+
+# ----------------------------- Save one page -----------------------------
+def save_page(jpk_path, folder_path, channel_name, role, page, readable_metadata, summarize,
+              palette_mode="rgb", palette_cache=None, metadata_ref=None, write_image=True, return_raw=False,
+              tiff_options=None, file_map=None, scan_size=None):
+    # Writes the page TIFF and its metadata .txt and returns a dict with "channel", "role",
+    # "tif" and "txt" paths, plus:
+    #   "frame": None, or with write_image=False the rendered frame that was not written,
+    #            as (image_data, description, write_options)
+    #   "raw":   the page data as stored in the JPK if return_raw is set, else None
+    # `tiff_options` are passed to compression_options. With `file_map` (see map_file),
+    # eligible pages are read as views into the mapped JPK instead of being copied.
+    # With `scan_size` (see read_scan_size), the image is written with its pixel size
+    # as resolution tags and a --- CALIBRATION --- section in its description.
+    tags = page.tags
+    suffix = role.replace(" ", "_")
+    folder_name = clean_name(f"TIFF_{channel_name}_{suffix}")
+    output_root = folder_path / folder_name
+    image_folder = output_root / "images"
+    metadata_folder = output_root / "metadata"
+    if write_image:
+        image_folder.mkdir(parents=True, exist_ok=True)
+    metadata_folder.mkdir(parents=True, exist_ok=True)
+
+    out_base = clean_name(f"{jpk_path.stem}_{channel_name}_{suffix}")
+    tif_path = image_folder / f"{out_base}.tif"
+    txt_path = metadata_folder / f"{out_base}_metadata.txt"
+
+    image_data = read_page(page, file_map)
+    raw = image_data if return_raw else None
+    write_options = {}
+
+    if page.photometric == 3 and hasattr(page, "colormap"):
+        if palette_mode == "indexed":
+            # Keep the index image and store its colormap: native size on disk and in memory
+            write_options = {"photometric": "palette", "colormap": tiff_colormap(page.colormap)}
+        else:
+            # Single gather through an (N, 3) lookup table
+            lut = palette_lut(page.colormap, palette_cache if palette_cache is not None else {})
+            image_data = lut[image_data]
+
+    write_options.update(compression_options(image_data, **(tiff_options or {})))
+
+    if metadata_ref is not None:
+        # Only a reference to the shared header, relative to the images/ and metadata/ folders
+        readable_metadata = f"metadata-store : {Path(os.path.relpath(metadata_ref, image_folder)).as_posix()}"
+
+    full_metadata = f"--- ASCII METADATA ---\n{readable_metadata}\n\n--- TIFF TAGS ---\n{summarize(tags)}"
+    if scan_size is not None:
+        write_options.update(calibration_options(image_data, scan_size))
+        full_metadata += f"\n\n--- CALIBRATION ---\n{calibration_text(image_data, scan_size)}"
+
+    with open(txt_path, "w", encoding="utf-8") as f:
+        f.write(full_metadata)
+    result = {"channel": channel_name, "role": role, "tif": tif_path, "txt": txt_path, "frame": None, "raw": raw}
+    if not write_image:
+        result["frame"] = (image_data, full_metadata, write_options)
+        return result
+
+    tifffile.imwrite(tif_path, image_data, description=full_metadata, **write_options)
+    return result
+
+# ----------------------------- Per-channel stacks -----------------------------
+# Classic TIFF offsets are 32-bit. Outputs stay classic TIFF, which ImageJ's own opener
+# reads, unless they could pass 4 GB; the margin covers tags and descriptions.
+BIGTIFF_THRESHOLD = 2 ** 32 - 2 ** 26
+FRAME_LIST_SUFFIX = "_frames.txt"  # Source of every stack frame, one output name per line
+
+def needs_bigtiff(nbytes):
+    return nbytes > BIGTIFF_THRESHOLD
+
+def append_to_stack(stacks, tif_path, frame, append=False, expected_frames=1):
+    # Appends one rendered frame to the multi-page stack of its channel/role folder
+    # (TIFF_<channel>_<role>/stack/TIFF_<channel>_<role>_stack.tif). Every frame keeps its
+    # own description, headed by the source file name, and its name is added to the
+    # stack's _frames.txt list (FIJI only reads the first description of a stack).
+    # Frames whose size or type differs from the first one go to a separate stack named
+    # after their shape. The stack is a BigTIFF only if `expected_frames` frames of this
+    # size could pass 4 GB. With append=True, frames are added to the end of existing
+    # stack files, keeping their format.
+    # `stacks` maps (folder, shape, dtype) -> (TiffWriter, path); close them with close_stacks.
+    image_data, description, write_options = frame
+    description = f"source-file : {tif_path.stem}\n{description}"
+    output_root = tif_path.parent.parent
+    key = (output_root, image_data.shape, image_data.dtype.str)
+    if key not in stacks:
+        stack_folder = output_root / "stack"
+        stack_folder.mkdir(parents=True, exist_ok=True)
+        if any(existing[0] == output_root for existing in stacks):
+            stack_name = f"{output_root.name}_stack_{'x'.join(map(str, image_data.shape))}.tif"
+        else:
+            stack_name = f"{output_root.name}_stack.tif"
+        stack_path = stack_folder / stack_name
+        frame_list = stack_path.with_name(stack_path.stem + FRAME_LIST_SUFFIX)
+        expected_size = (image_data.nbytes + len(description.encode("utf-8"))) * expected_frames
+        append = append and stack_path.exists()
+        if append:
+            with tifffile.TiffFile(stack_path) as existing:
+                bigtiff = existing.is_bigtiff
+            if not bigtiff and needs_bigtiff(stack_path.stat().st_size + expected_size):
+                raise ValueError(f"{stack_name} would pass 4 GB as classic TIFF, rebuild it without append")
+        else:
+            bigtiff = needs_bigtiff(expected_size)
+            frame_list.write_text("", encoding="utf-8")
+        writer = tifffile.TiffWriter(stack_path, bigtiff=bigtiff, append=append)
+        stacks[key] = (writer, stack_path)
+
+    writer, stack_path = stacks[key]
+    writer.write(image_data, description=description, **write_options)
+    with open(stack_path.with_name(stack_path.stem + FRAME_LIST_SUFFIX), "a", encoding="utf-8") as f:
+        f.write(tif_path.stem + "\n")
+    return stack_path
+
+def close_stacks(stacks):
+    for writer, _ in stacks.values():
+        writer.close()
+    stacks.clear()
+
+# ----------------------------- Process one JPK file -----------------------------
+def extract_jpk(jpk_path, folder_path, page_threads=1, metadata_mode="readable", channel_filter=None,
+                palette_mode="rgb", metadata_storage="embedded", output_layout="files", return_raw=False,
+                compression=None, predictor=None, tile=None, encode_threads=1, calibrate=False):
+    # Splits one JPK into per-channel TIFFs. Pages are decoded and written by
+    # `page_threads` threads (decoding, palette lookup and file writes release the GIL).
+    # Pages rejected by `channel_filter` (see compile_channel_filter) are never decoded.
+    # Palette pages are converted to RGB, or written as indexed images with their
+    # colormap if `palette_mode` is "indexed".
+    # With `metadata_storage` "store", the whole-file metadata is saved once in the
+    # metadata store and every page only carries a reference plus its own tags.
+    # With `output_layout` "stack" the images are not written but returned as frames
+    # for append_to_stack (see save_page).
+    # `compression`, `predictor`, `tile` and `encode_threads` select the TIFF encoding
+    # (see compression_options); the default writes uncompressed strips as before.
+    # Uncompressed pages are memory-mapped rather than copied (see read_page); the map is
+    # closed before returning, so returned frames and raw pages are copies.
+    # With `calibrate`, the scan size from tags 32834/32835 is written into every output
+    # as its pixel size (see calibration_options).
+    # Returns the list of save_page results.
+    read_metadata, summarize = METADATA_MODES[metadata_mode]
+    keep = compile_channel_filter(channel_filter)
+    readable_metadata = read_metadata(jpk_path)
+    metadata_ref = store_metadata(folder_path, readable_metadata) if metadata_storage == "store" else None
+    palette_cache = {}  # Palettes are shared by most pages of a JPK
+    tiff_options = {"compression": compression, "predictor": predictor, "tile": tile, "encode_threads": encode_threads}
+
+    with mapped_file(jpk_path) as file_map, tifffile.TiffFile(jpk_path) as tif:
+        scan_size = read_scan_size(tif) if calibrate else None
+
+        # --- Group pages by channel name ---
+        grouped_pages = defaultdict(list)
+        for page in tif.pages:
+            channel_name = page.tags.get(32850).value.strip() if 32850 in page.tags else "Unknown"
+            grouped_pages[channel_name].append(page)
+
+        # --- Assign trace/retrace roles per group ---
+        jobs = [
+            (channel_name, role, page)
+            for channel_name, pages in grouped_pages.items()
+            for role, page in assign_page_roles(pages)
+            if keep(channel_name, role)
+        ]
+
+        # --- Save each page with correct label ---
+        def run(job):
+            channel_name, role, page = job
+            return save_page(jpk_path, folder_path, channel_name, role, page, readable_metadata, summarize,
+                             palette_mode, palette_cache, metadata_ref, output_layout != "stack", return_raw, tiff_options,
+                             file_map, scan_size)
+
+        if page_threads <= 1:
+            results = [run(job) for job in jobs]
+        else:
+            tif.filehandle.set_lock(True)  # The threads share one file handle: serialize its seeks and reads
+            with ThreadPoolExecutor(max_workers=page_threads) as pool:
+                results = list(pool.map(run, jobs))
+
+        # Frames and raw pages handed back to the caller must not be views into the map
+        for item in results:
+            if item["frame"] is not None:
+                item["frame"] = (detach(item["frame"][0], file_map), *item["frame"][1:])
+            item["raw"] = detach(item["raw"], file_map)
+    return results
+
+
+# ----------------------------- Worker wrapper (never raises) -----------------------------
+def _extract_worker(args):
+    jpk_path, folder_path, page_threads, options = args
+    try:
+        return extract_jpk(jpk_path, folder_path, page_threads, **options), None
+    except Exception as e:
+        return [], e
+
+# ----------------------------- Process every JPK file in a folder -----------------------------
+def extract_folder(folder_path, num_workers=1, page_threads=1, export_zarr=False, use_manifest=False,
+                   jpk_files=None, append=False, index_metadata=False, index_timestamps=False, pool=None,
+                   **options):
+    # Files are handled by `num_workers` processes (or by the executor `pool`, which the
+    # caller keeps open across calls); output is reported in file order.
+    # With output_layout="stack", frames come back to this process and are appended,
+    # in file order, to one stack per channel/role. With export_zarr, the raw page data
+    # of every file is also appended to the chunked store channels.zarr (see jpk_zarr.py).
+    # With use_manifest, every file's source size/mtime, settings and outputs are recorded
+    # in Extraction_manifest.sqlite as soon as it is done, and reruns only process files
+    # that are new, changed, failed, lost an output or were extracted with other settings.
+    # In stack layout, frames of files that only failed before (and, with `append`, of new
+    # files) are appended to the existing stacks. Any other pending file means frames in
+    # the stacks are stale or out of order, so the stacks are rebuilt from every JPK in
+    # the folder; re-extracted files are never appended a second time.
+    # `jpk_files` restricts the run to the given files (default: every .jpk in the folder).
+    # With index_metadata, each extracted file is added to the search index
+    # Metadata_search.sqlite (see metadata_search.py) as soon as it is done; files
+    # skipped by the manifest are indexed at the end if they are not in it yet.
+    # With index_timestamps, Timestamp_index.csv (see timestamp_index.py) is first updated
+    # with every file's acquisition time (tags only), gaps and out-of-order files are
+    # reported, and stack frames are appended in acquisition order instead of name order.
+    # `options` are passed on to extract_jpk. Returns {file name: error} of the files that failed.
+    whole_folder = jpk_files is None
+    if whole_folder:
+        jpk_files = folder_path.iterdir()
+    jpk_files = sorted(p for p in jpk_files if p.name.lower().endswith(".jpk"))
+    order = {}  # Acquisition order of the stack frames (name order without index_timestamps)
+    all_files = jpk_files
+    options["return_raw"] = export_zarr
+    zarr_path = folder_path / jpk_zarr.ZARR_STORE_NAME if export_zarr else None
+    stacks = {}
+    manifest = None
+    search_index = None
+    if index_metadata:
+        search_index = metadata_search.open_search_index(folder_path / metadata_search.SEARCH_INDEX_FILENAME)
+
+    if index_timestamps:
+        rows = timestamp_index.update_timestamp_index(folder_path, jpk_files, clean_name, remove_missing=whole_folder)
+        flagged = [row for row in rows if row["status"] != "ok"]
+        print(f"{timestamp_index.TIMESTAMP_INDEX_FILENAME}: {len(rows)} file(s) in acquisition order, {len(flagged)} flagged")
+        for row in flagged:
+            print(f"  {row['source']}: {row['status']}")
+        if options.get("output_layout") == "stack":
+            order = {row["source"]: int(row["order"]) for row in rows}
+            jpk_files = sorted(jpk_files, key=lambda p: (order.get(p.name, len(order)), p.name))
+
+    if use_manifest:
+        manifest = extraction_manifest.open_manifest(folder_path / extraction_manifest.MANIFEST_FILENAME)
+        signature = extraction_manifest.settings_signature(options)
+        file_stats = {p.name: (p.stat().st_size, p.stat().st_mtime_ns) for p in jpk_files}
+        pending = extraction_manifest.find_pending(manifest, file_stats, signature, folder_path)
+        if pending and options.get("output_layout") == "stack":
+            stale = sorted(name for name, reason in pending.items()
+                           if reason != "failed" and not (append and reason == "new"))
+            if stale:
+                print(f"Stacks are rebuilt from every file: {', '.join(f'{name} ({pending[name]})' for name in stale)}")
+                if not whole_folder:
+                    jpk_files = sorted((p for p in folder_path.iterdir() if p.name.lower().endswith(".jpk")),
+                                       key=lambda p: (order.get(p.name, len(order)), p.name))
+                    file_stats = {p.name: (p.stat().st_size, p.stat().st_mtime_ns) for p in jpk_files}
+                pending = dict.fromkeys(file_stats, "rebuild")
+                append = False
+            else:
+                append = True  # Only files without frames in the stacks
+        print(f"{len(jpk_files) - len(pending)} file(s) already extracted with these settings, "
+              f"{len(pending)} to process")
+        jpk_files = [p for p in jpk_files if p.name in pending]
+
+    failed = {}
+
+    def handle(results):
+        for jpk_path, (saved, error) in zip(jpk_files, results):
+            print(f"\nProcessing: {jpk_path.name}")
+            outputs = []
+            for item in saved:
+                if item["frame"] is not None:
+                    stack_path = append_to_stack(stacks, item["tif"], item["frame"], append, len(jpk_files))
+                    print(f"✔ Appended to: {stack_path.relative_to(folder_path)}")
+                    outputs.append(stack_path)
+                else:
+                    print(f"✔ Saved: {item['tif'].relative_to(folder_path)}")
+                    outputs.append(item["tif"])
+                print(f"Metadata: {item['txt'].relative_to(folder_path)}")
+                outputs.append(item["txt"])
+
+            if zarr_path is not None and saved:
+                frames = [(item["channel"], item["role"], item["raw"]) for item in saved]
+                skipped = jpk_zarr.append_frames(zarr_path, jpk_path.stem, frames)
+                print(f"✔ Added {len(frames) - len(skipped)} frame(s) to {zarr_path.name}")
+                for channel, role, shape, dtype in skipped:
+                    print(f"Not in {zarr_path.name} (shape {shape}, {dtype} differs): {channel} {role}")
+
+            if error is not None:
+                print(f"Error processing {jpk_path.name}: {error}")
+                failed[jpk_path.name] = error
+
+            if search_index is not None and error is None:
+                try:
+                    metadata_search.index_file(search_index, jpk_path.name, jpk_path)
+                    search_index.commit()
+                except (OSError, ValueError) as e:
+                    print(f"Not added to {metadata_search.SEARCH_INDEX_FILENAME}: {e}")
+
+            if manifest is not None:
+                stat = file_stats[jpk_path.name]
+                if error is not None:
+                    extraction_manifest.record_failed(manifest, jpk_path.name, stat, signature, error)
+                    continue
+                outputs = sorted({output.relative_to(folder_path).as_posix() for output in outputs})
+                # Remove files this JPK produced with earlier settings but not any more
+                for old_output in set(extraction_manifest.get_outputs(manifest, jpk_path.name)) - set(outputs):
+                    (folder_path / old_output).unlink(missing_ok=True)
+                extraction_manifest.record_done(manifest, jpk_path.name, stat, signature, outputs)
+
+    jobs = [(jpk_path, folder_path, page_threads, options) for jpk_path in jpk_files]
+    try:
+        if pool is not None:
+            handle(pool.map(_extract_worker, jobs))
+        elif num_workers <= 1:
+            handle(map(_extract_worker, jobs))
+        else:
+            with ProcessPoolExecutor(max_workers=num_workers) as pool:
+                handle(pool.map(_extract_worker, jobs))
+        if search_index is not None:
+            metadata_search.update_index(search_index, folder_path, all_files, remove_missing=whole_folder)
+    finally:
+        close_stacks(stacks)
+        if manifest is not None:
+            manifest.close()
+        if search_index is not None:
+            search_index.close()
+    return failed
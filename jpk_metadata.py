@@ -0,0 +1,236 @@
+import re  # For regular expressions
+import struct  # For decoding binary TIFF structures
+from pathlib import Path  # For locating Parameters_To_Find.txt
+
+# JPK-specific TIFF tags
+JPK_CHANNEL_TAG = 32850      # Channel name of an image page (e.g. "height")
+JPK_PROPERTIES_TAG = 32851   # "key : value" properties of an image page
+
+# TIFF field type -> (struct format, size in bytes)
+TIFF_FIELD_TYPES = {
+    1: ("B", 1),    # BYTE
+    2: ("s", 1),    # ASCII
+    3: ("H", 2),    # SHORT
+    4: ("I", 4),    # LONG
+    5: ("II", 8),   # RATIONAL
+    6: ("b", 1),    # SBYTE
+    7: ("B", 1),    # UNDEFINED
+    8: ("h", 2),    # SSHORT
+    9: ("i", 4),    # SLONG
+    10: ("ii", 8),  # SRATIONAL
+    11: ("f", 4),   # FLOAT
+    12: ("d", 8),   # DOUBLE
+    13: ("I", 4),   # IFD
+    16: ("Q", 8),   # LONG8 (BigTIFF)
+    17: ("q", 8),   # SLONG8 (BigTIFF)
+    18: ("Q", 8),   # IFD8 (BigTIFF)
+}
+
+# ----------------------------- Decode a single tag value -----------------------------
+def _decode_tag_value(byteorder, field_type, count, raw):
+    fmt, size = TIFF_FIELD_TYPES[field_type]
+    if field_type == 2:
+        return raw[:count].split(b"\x00", 1)[0].decode("ISO-8859-1").strip()
+    if field_type in (1, 6, 7):
+        # Raw byte blocks: keep as bytes, JPK sometimes stores text here
+        return bytes(raw[:count])
+    values = struct.unpack(byteorder + fmt * count, raw[:size * count])
+    if field_type in (5, 10):
+        values = tuple(values[i] / values[i + 1] if values[i + 1] else 0.0 for i in range(0, len(values), 2))
+    return values[0] if len(values) == 1 else values
+
+# ----------------------------- Read all IFDs without touching image data -----------------------------
+def read_tiff_ifds(file_path, codes=None, max_ifds=None):
+    # Returns one {tag code: value} dict per IFD. Only the IFD tables and the
+    # tag values themselves are read, so the cost is independent of image size.
+    # If `codes` is given, only those tags are decoded; `max_ifds` stops after that many IFDs.
+    ifds = []
+    with open(file_path, "rb") as f:
+        header = f.read(16)
+        if len(header) < 16:
+            raise ValueError(f"Not a TIFF file: {file_path}")
+        if header[:2] == b"II":
+            byteorder = "<"
+        elif header[:2] == b"MM":
+            byteorder = ">"
+        else:
+            raise ValueError(f"Not a TIFF file: {file_path}")
+
+        version = struct.unpack(byteorder + "H", header[2:4])[0]
+        if version == 42:  # Classic TIFF
+            offset = struct.unpack(byteorder + "I", header[4:8])[0]
+            count_fmt, entry_fmt, entry_size, inline_size, next_fmt = "H", "HHI", 12, 4, "I"
+        elif version == 43:  # BigTIFF
+            offset = struct.unpack(byteorder + "Q", header[8:16])[0]
+            count_fmt, entry_fmt, entry_size, inline_size, next_fmt = "Q", "HHQ", 20, 8, "Q"
+        else:
+            raise ValueError(f"Unknown TIFF version {version}: {file_path}")
+
+        count_size = struct.calcsize(count_fmt)
+        next_size = struct.calcsize(next_fmt)
+        seen_offsets = set()
+
+        while offset and offset not in seen_offsets:
+            seen_offsets.add(offset)
+            f.seek(offset)
+            count_bytes = f.read(count_size)
+            if len(count_bytes) < count_size:
+                raise ValueError(f"Truncated IFD at offset {offset}: {file_path}")
+            num_entries = struct.unpack(byteorder + count_fmt, count_bytes)[0]
+            table = f.read(num_entries * entry_size + next_size)
+            if len(table) < num_entries * entry_size + next_size:
+                raise ValueError(f"Truncated IFD at offset {offset}: {file_path}")
+
+            tags = {}
+            for i in range(num_entries):
+                entry = table[i * entry_size:(i + 1) * entry_size]
+                code, field_type, count = struct.unpack(byteorder + entry_fmt, entry[:entry_size - inline_size])
+                if field_type not in TIFF_FIELD_TYPES or (codes is not None and code not in codes):
+                    continue
+                if code in tags:
+                    continue  # Duplicate tag (e.g. tifffile's second ImageDescription), the first one wins
+
+                value_size = TIFF_FIELD_TYPES[field_type][1] * count
+                if value_size <= inline_size:
+                    raw = entry[entry_size - inline_size:]
+                else:
+                    value_offset = struct.unpack(byteorder + next_fmt, entry[entry_size - inline_size:])[0]
+                    f.seek(value_offset)
+                    raw = f.read(value_size)
+                    if len(raw) < value_size:
+                        continue  # Value points past end of file, skip it
+                tags[code] = _decode_tag_value(byteorder, field_type, count, raw)
+
+            ifds.append(tags)
+            if max_ifds is not None and len(ifds) >= max_ifds:
+                break
+            offset = struct.unpack(byteorder + next_fmt, table[-next_size:])[0]
+
+    return ifds
+
+# ----------------------------- Collect the JPK ASCII header text -----------------------------
+def read_jpk_header_text(file_path):
+    # Joins every text-valued tag of every IFD (the shared header block in the
+    # first IFD plus the per-page 32850/32851 tags) into one newline-separated string.
+    blocks = []
+    for tags in read_tiff_ifds(file_path):
+        for code, value in tags.items():
+            if isinstance(value, bytes):
+                value = value.split(b"\x00", 1)[0].decode("ISO-8859-1").strip()
+            if isinstance(value, str) and value:
+                blocks.append(value)
+    return "\n".join(blocks)
+
+# ----------------------------- Parameters to find -----------------------------
+# Parameters to search for in the files (default list)
+DEFAULT_PARAMETERS = [
+    "relative-setpoint",
+    "cantilever-calibration-info.calibration-environment",
+    "cantilever-calibration-info.cantilever-name",
+    "cantilever-calibration-info.defined",
+    "cantilever-calibration-info.frequency",
+    "cantilever-calibration-info.qFactor",
+    "cantilever-calibration-info.sensitivity",
+    "cantilever-calibration-info.spring-constant",
+    "experiment-mode.name",
+    "feedback-mode.adjust-reference-amplitude-feedback-settings.reference-amplitude",
+]
+
+def load_parameters():
+    # Optional: one parameter per line in "Parameters_To_Find.txt" next to the scripts replaces the default list
+    parameters_file = Path(__file__).with_name("Parameters_To_Find.txt")
+    if not parameters_file.is_file():
+        return list(DEFAULT_PARAMETERS)
+    with open(parameters_file, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+# ----------------------------- Single-pass multi-parameter matcher -----------------------------
+# Matches every "key : value" line of a metadata text in one regex pass
+_KEY_VALUE_LINE = re.compile(r"^[ \t]*([\w.\-]+)[ \t]*:[ \t]*(.*)$", re.M)
+
+def compile_parameter_matcher(parameters):
+    # Returns a function text -> {parameter: value}. Each line is matched once and its
+    # key (and every dotted suffix of it, so "relative-setpoint" also finds
+    # "feedback-mode.setpoint-feedback-settings.relative-setpoint") is looked up in a
+    # set, so the cost does not grow with the number of requested parameters.
+    wanted = frozenset(parameters)
+
+    def match(text):
+        found = {}
+        for line_match in _KEY_VALUE_LINE.finditer(text):
+            key = line_match.group(1)
+            while True:
+                if key in wanted and key not in found:
+                    found[key] = line_match.group(2).strip()
+                dot = key.find(".")
+                if dot < 0:
+                    break
+                key = key[dot + 1:]
+            if len(found) == len(wanted):
+                break  # Everything found, stop early
+        return found
+
+    return match
+
+# ----------------------------- Typed "key : value" properties -----------------------------
+# Plain decimal numbers only: int()/float() alone would also take "1_000", "nan" or "Infinity"
+_INTEGER = re.compile(r"[-+]?\d+")
+_DECIMAL = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+
+def parse_property_value(value):
+    # "true"/"false" -> bool, integers -> int, decimals -> float, anything else stays text
+    lowered = value.lower()
+    if lowered in ("true", "false"):
+        return lowered == "true"
+    if _INTEGER.fullmatch(value):
+        return int(value)
+    if _DECIMAL.fullmatch(value):
+        return float(value)
+    return value
+
+def parse_properties(text):
+    # Parses every "key : value" line into a flat {dotted key: typed value} dict,
+    # so any property is a single dict lookup. The first occurrence of a key wins.
+    properties = {}
+    for line_match in _KEY_VALUE_LINE.finditer(text):
+        key = line_match.group(1)
+        if key not in properties:
+            properties[key] = parse_property_value(line_match.group(2).strip())
+    return properties
+
+def namespace(properties, prefix):
+    # Sub-dict of one namespace with the prefix removed, e.g.
+    # namespace(p, "cantilever-calibration-info")["spring-constant"]
+    prefix = prefix.rstrip(".") + "."
+    return {key[len(prefix):]: value for key, value in properties.items() if key.startswith(prefix)}
+
+# ----------------------------- Structured metadata of a whole JPK file -----------------------------
+def read_jpk_metadata(file_path):
+    # Reads the TIFF tag tables once and returns
+    #   {"header": {properties of the first IFD},
+    #    "header_tags": {code: value} of the numeric JPK tags (>= 32768) in the first IFD,
+    #    "pages": [{"index", "channel", "retrace", "properties"} for every page with tag 32850]}
+    ifds = read_tiff_ifds(file_path)
+    header, header_tags, pages = {}, {}, []
+
+    for index, tags in enumerate(ifds):
+        if index == 0:
+            for code, value in tags.items():
+                if isinstance(value, bytes):
+                    value = value.split(b"\x00", 1)[0].decode("ISO-8859-1")
+                if isinstance(value, str):
+                    for key, typed in parse_properties(value).items():
+                        header.setdefault(key, typed)
+                elif code >= 32768:
+                    header_tags[code] = value
+
+        if JPK_CHANNEL_TAG in tags:
+            properties = parse_properties(tags.get(JPK_PROPERTIES_TAG, ""))
+            pages.append({
+                "index": index,
+                "channel": tags[JPK_CHANNEL_TAG].strip(),
+                "retrace": properties.get("retrace"),
+                "properties": properties,
+            })
+
+    return {"header": header, "header_tags": header_tags, "pages": pages}
@@ -0,0 +1,154 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from jpk_metadata import read_tiff_ifds, read_jpk_header_text, compile_parameter_matcher, load_parameters
+from jpk_extract import extract_folder
+from parameter_export import export_parameters
+from force_calc import add_forces, resolve_force_parameters, FORCE_COLUMNS
+import parameter_index
+
+# Strip/tile offset and byte count tags
+_DATA_TAGS = ((273, 279), (324, 325))
+
+# ----------------------------- Detect completely written JPK files -----------------------------
+def is_complete(path, size):
+    # True if every IFD can be read and all image data lies inside the file
+    try:
+        ifds = read_tiff_ifds(path, codes={273, 279, 324, 325})
+    except (OSError, ValueError):
+        return False
+    for tags in ifds:
+        for offsets_tag, counts_tag in _DATA_TAGS:
+            offsets, counts = tags.get(offsets_tag), tags.get(counts_tag)
+            if offsets is None or counts is None:
+                continue
+            if not isinstance(offsets, (list, tuple)):
+                offsets, counts = [offsets], [counts]
+            if any(o + c > size for o, c in zip(offsets, counts)):
+                return False
+    return True
+
+def find_ready_files(folder_path, pending, done, stable_seconds, now=None):
+    # A .jpk file is ready once its size and modification time have not changed for
+    # `stable_seconds` and its IFDs and image data are all present (is_complete).
+    # pending: {name: (size, mtime_ns, stable since)} and done: {name: (size, mtime_ns)}
+    # carry the state between calls; `pending` is updated in place.
+    now = time.monotonic() if now is None else now
+    ready = []
+    for path in sorted(folder_path.iterdir()):
+        if not path.is_file() or not path.name.lower().endswith(".jpk"):
+            continue
+        st = path.stat()
+        stat = (st.st_size, st.st_mtime_ns)
+        if done.get(path.name) == stat:
+            continue  # Already ingested and unchanged
+
+        previous = pending.get(path.name)
+        if previous is None or previous[:2] != stat:
+            pending[path.name] = (*stat, now)  # New or still growing
+            continue
+        if stat[0] == 0 or now - previous[2] < stable_seconds:
+            continue
+
+        if not is_complete(path, stat[0]):
+            pending[path.name] = (*stat, now)  # Not complete yet, wait another interval
+            continue
+        del pending[path.name]
+        ready.append(path)
+    return ready
+
+# ----------------------------- Extract and index new files -----------------------------
+def ingest(folder_path, jpk_files, parameters=None, export_formats=("csv",), export=True, **extract_options):
+    # Extracts the given files (appending to per-channel stacks/zarr, recorded in the
+    # extraction manifest) and adds their parameters to Parameters_index.sqlite; with
+    # `export`, the parameter tables in the folder are regenerated (see export_tables).
+    # Returns the files that were extracted and indexed without error. The manifest is
+    # always used, so `extract_options` may be the settings of the extract scripts as-is.
+    extract_options["use_manifest"] = True
+    failed = extract_folder(folder_path, jpk_files=jpk_files, append=True, **extract_options)
+
+    parameters = parameters or load_parameters()
+    match_parameters = compile_parameter_matcher(parameters)
+    con = parameter_index.open_index(folder_path / parameter_index.INDEX_FILENAME)
+    try:
+        for path in jpk_files:
+            rel = path.relative_to(folder_path).as_posix()
+            try:
+                row = match_parameters(read_jpk_header_text(path))
+            except (OSError, ValueError) as e:
+                print(f"Error reading {path.name}: {e}")
+                parameter_index.remove_row(con, rel)
+                failed[path.name] = e
+                continue
+            st = path.stat()
+            parameter_index.store_row(con, rel, st.st_size, st.st_mtime_ns, parameters, row)
+        con.commit()
+    finally:
+        con.close()
+    if export:
+        export_tables(folder_path, parameters, export_formats)
+    return [path for path in jpk_files if path.name not in failed]
+
+def export_tables(folder_path, parameters=None, export_formats=("csv",)):
+    # Regenerates the Parameters tables from the whole Parameters_index.sqlite
+    parameters = parameters or load_parameters()
+    con = parameter_index.open_index(folder_path / parameter_index.INDEX_FILENAME)
+    try:
+        with_forces = resolve_force_parameters(parameters) is not None
+        columns = list(parameters) + FORCE_COLUMNS if with_forces else parameters
+
+        def indexed_rows():
+            rows = parameter_index.iter_rows(con)
+            rows = ({**row, "Filename": rel} for rel, row in rows)  # Relative path, as 01_Excel_Parameters.py
+            return add_forces(rows, parameters) if with_forces else rows
+
+        for table_path in export_parameters(folder_path / "Parameters", columns, indexed_rows, export_formats):
+            print(f"Table updated: {table_path.name}")
+    finally:
+        con.close()
+
+# ----------------------------- Watch loop -----------------------------
+def watch_folder(folder_path, poll_seconds=2.0, stable_seconds=5.0, max_polls=None, retry_seconds=60.0,
+                 export_seconds=30.0, num_workers=1, parameters=None, export_formats=("csv",), **extract_options):
+    # Polls `folder_path` and ingests every newly completed JPK file. Runs until
+    # interrupted, or for `max_polls` polls (useful for testing on a temp directory).
+    # Files already present are ingested on the first polls; the manifest skips
+    # anything that was extracted before with the same settings. A file that fails is
+    # retried after `retry_seconds` (or as soon as it changes). The worker processes are
+    # started once for the whole watch, and the parameter tables, which are rebuilt from
+    # the whole index, are regenerated at most every `export_seconds` and when the watch ends.
+    # Returns {name: (size, mtime_ns)} of the ingested files.
+    pending, done = {}, {}
+    polls = 0
+    last_export, unexported = time.monotonic(), False
+    pool = ProcessPoolExecutor(max_workers=num_workers) if num_workers > 1 else None
+    try:
+        while max_polls is None or polls < max_polls:
+            ready = find_ready_files(folder_path, pending, done, stable_seconds)
+            if ready:
+                print(f"\n{len(ready)} new file(s): {', '.join(p.name for p in ready)}")
+                try:
+                    ingested = ingest(folder_path, ready, parameters, export=False, pool=pool, **extract_options)
+                except Exception as e:  # Keep watching, the files are retried
+                    print(f"Error ingesting {', '.join(p.name for p in ready)}: {e}")
+                    ingested = []
+                now = time.monotonic()
+                for path in ready:
+                    st = path.stat()
+                    if path in ingested:
+                        done[path.name] = (st.st_size, st.st_mtime_ns)
+                    else:
+                        # Stable since a time chosen so that find_ready_files returns it after retry_seconds
+                        pending[path.name] = (st.st_size, st.st_mtime_ns, now + retry_seconds - stable_seconds)
+                unexported = unexported or bool(ingested)
+            if unexported and time.monotonic() - last_export >= export_seconds:
+                export_tables(folder_path, parameters, export_formats)
+                last_export, unexported = time.monotonic(), False
+            polls += 1
+            if max_polls is None or polls < max_polls:
+                time.sleep(poll_seconds)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        if unexported:
+            export_tables(folder_path, parameters, export_formats)
+    return done
@@ -0,0 +1,107 @@
+import os
+import json
+import zlib
+import numpy as np
+from collections import Counter
+
+# Minimal Zarr (format 2) directory store holding every extracted page as
+#   file × channel × role × y × x
+# with one zlib-compressed chunk per frame. The store is plain files on disk: it can
+# be read lazily with read_frame/iter_frames below, or with zarr/dask if installed
+# (zarr.open("channels.zarr")). Frames are appended file by file.
+
+ZARR_STORE_NAME = "channels.zarr"
+DIMENSIONS = ["file", "channel", "role", "y", "x"]
+
+# ----------------------------- Store metadata -----------------------------
+def _write_json(path, data):
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=1)
+    os.replace(tmp_path, path)
+
+def open_store(store_path):
+    # Returns (array metadata, attributes) or (None, None) if the store does not exist yet
+    if not (store_path / ".zarray").exists():
+        return None, None
+    with open(store_path / ".zarray", encoding="utf-8") as f:
+        meta = json.load(f)
+    with open(store_path / ".zattrs", encoding="utf-8") as f:
+        attrs = json.load(f)
+    return meta, attrs
+
+def _create_store(store_path, frame_shape, dtype):
+    store_path.mkdir(parents=True, exist_ok=True)
+    meta = {
+        "zarr_format": 2,
+        "shape": [0, 0, 0, *frame_shape],
+        "chunks": [1, 1, 1, *frame_shape],  # One chunk per frame
+        "dtype": np.dtype(dtype).str,
+        "compressor": {"id": "zlib", "level": 5},
+        "fill_value": 0,
+        "order": "C",
+        "filters": None,
+        "dimension_separator": ".",
+    }
+    attrs = {"_ARRAY_DIMENSIONS": DIMENSIONS, "files": [], "channels": [], "roles": []}
+    return meta, attrs
+
+def _index(names, name):
+    # Position of `name` on an axis, appending it if new
+    if name not in names:
+        names.append(name)
+    return names.index(name)
+
+# ----------------------------- Append one JPK's frames -----------------------------
+def append_frames(store_path, file_name, frames):
+    # frames: list of (channel, role, 2-D array). Frames of a file already in the store
+    # are overwritten, so re-extracting a file is safe. Frames whose shape or dtype
+    # differs from the store's are skipped and returned.
+    meta, attrs = open_store(store_path)
+    if meta is None and frames:
+        # New store: use the most common frame shape/type (not e.g. a thumbnail page)
+        counts = Counter((image.shape, image.dtype.str) for _, _, image in frames)
+        frame_shape, dtype = counts.most_common(1)[0][0]
+        meta, attrs = _create_store(store_path, frame_shape, dtype)
+
+    skipped = []
+    for channel, role, image in frames:
+        if list(image.shape) != meta["chunks"][3:] or image.dtype.str != meta["dtype"]:
+            skipped.append((channel, role, image.shape, image.dtype))
+            continue
+
+        f = _index(attrs["files"], file_name)
+        c = _index(attrs["channels"], channel)
+        r = _index(attrs["roles"], role)
+        chunk_path = store_path / f"{f}.{c}.{r}.0.0"
+        with open(chunk_path, "wb") as out:
+            out.write(zlib.compress(np.ascontiguousarray(image).tobytes(), meta["compressor"]["level"]))
+
+    if meta is not None:
+        meta["shape"][:3] = [len(attrs["files"]), len(attrs["channels"]), len(attrs["roles"])]
+        _write_json(store_path / ".zattrs", attrs)
+        _write_json(store_path / ".zarray", meta)  # Written last: readers only see complete frames
+    return skipped
+
+# ----------------------------- Lazy reads -----------------------------
+def read_frame(store_path, file_name, channel, role, meta=None, attrs=None):
+    # Decompresses a single chunk; missing frames come back filled with the fill value
+    if meta is None:
+        meta, attrs = open_store(store_path)
+    f = attrs["files"].index(file_name)
+    c = attrs["channels"].index(channel)
+    r = attrs["roles"].index(role)
+    chunk_path = store_path / f"{f}.{c}.{r}.0.0"
+    frame_shape = meta["chunks"][3:]
+    if not chunk_path.exists():
+        return np.full(frame_shape, meta["fill_value"], dtype=meta["dtype"])
+    with open(chunk_path, "rb") as src:
+        return np.frombuffer(zlib.decompress(src.read()), dtype=meta["dtype"]).reshape(frame_shape)
+
+def iter_frames(store_path, channel, role):
+    # Yields (file name, frame) for one channel/role, touching only its chunks
+    meta, attrs = open_store(store_path)
+    if meta is None or channel not in attrs["channels"] or role not in attrs["roles"]:
+        return
+    for file_name in attrs["files"]:
+        yield file_name, read_frame(store_path, file_name, channel, role, meta, attrs)
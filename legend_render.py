@@ -0,0 +1,327 @@
+import os
+import re
+import csv
+import tifffile
+import numpy as np
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageDraw, ImageFont
+from itertools import groupby
+from jpk_extract import mapped_file, read_page, needs_bigtiff, FRAME_LIST_SUFFIX
+from force_calc import compute_forces
+from timestamp_index import load_timestamp_index, acquisition_sorted, elapsed_seconds
+
+# Burns the 04_Legand.py legend into the pixels of every frame, without FIJI.
+# Text is assembled from glyphs rasterized once per character, frames are composited
+# in parallel threads and written, in order, to one multi-page TIFF (BigTIFF only if it
+# could pass 4 GB).
+
+LEGEND_FIELDS = ["Title", "Time", "Spring Constant", "Normal Force", "Tapping Force", "Elapsed Time"]
+
+# Same sidecar table as 04_Legand.py, so both reuse each other's rows. Rows of another
+# LEGEND_SCHEMA (e.g. forces from an older formula, no force_status) are recomputed;
+# change it here and in both 04_Legand scripts whenever a stored column changes meaning.
+LEGEND_TABLE_NAME = "Legend_metadata.csv"
+LEGEND_SCHEMA = "2"
+LEGEND_COLUMNS = ["file", "schema", "size", "mtime", "time", "spring_constant", "sensitivity",
+                  "amplitude", "setpoint", "normal_force", "tapping_force", "force_status"]
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+# ----------------------------- Per-slice metadata (as in 04_Legand.py) -----------------------------
+def parse_info_param(info, param_name):
+    for line in info.split("\n"):
+        if param_name in line:
+            return line.split(":", 1)[-1].strip()
+    return "N/A"
+
+def extract_start_time(info):
+    match = re.search(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3}", info)
+    if not match:
+        return None
+    try:
+        return datetime.strptime(match.group(), "%Y-%m-%d %H:%M:%S.%f")
+    except ValueError:
+        return None
+
+def resolve_metadata_store(info, folder_path, cache):
+    # TIFFs extracted with METADATA_STORAGE = "store" only reference the shared JPK header
+    match = re.search(r"metadata-store : (.+)", info)
+    if not match:
+        return info
+    store_path = os.path.normpath(os.path.join(folder_path, match.group(1).strip()))
+    if store_path not in cache:
+        cache[store_path] = Path(store_path).read_text(encoding="utf-8") if os.path.isfile(store_path) else ""
+    return info + "\n" + cache[store_path]
+
+def slice_metadata(file_name, info):
+    # Forces are filled in for all rows at once by add_legend_forces
+    dt = extract_start_time(info)
+    return {
+        "file": file_name,
+        "time": dt.strftime(TIME_FORMAT) if dt else "",
+        "spring_constant": parse_info_param(info, "cantilever-calibration-info.spring-constant"),
+        "sensitivity": parse_info_param(info, "cantilever-calibration-info.sensitivity"),
+        "amplitude": parse_info_param(info, "feedback-mode.adjust-reference-amplitude-feedback-settings.reference-amplitude"),
+        "setpoint": parse_info_param(info, "feedback-mode.setpoint-feedback-settings.relative-setpoint"),
+    }
+
+def add_legend_forces(rows):
+    # Normal/tapping forces of every row in one vectorized pass (see force_calc.py);
+    # rows with unusable inputs keep empty forces and a reason in "force_status"
+    forces = compute_forces(*([row[column] for row in rows]
+                              for column in ("spring_constant", "sensitivity", "amplitude", "setpoint")))
+    for i, row in enumerate(rows):
+        row["normal_force"] = repr(float(forces["normal"][i])) if np.isfinite(forces["normal"][i]) else ""
+        row["tapping_force"] = repr(float(forces["tapping"][i])) if np.isfinite(forces["tapping"][i]) else ""
+        row["force_status"] = forces["status"][i]
+    return rows
+
+def frame_sources(path):
+    # Output names of the frames of a stack written by the extract scripts
+    # (<stack>_frames.txt next to it), or None
+    list_path = path.with_name(path.stem + FRAME_LIST_SUFFIX)
+    if not list_path.is_file():
+        return None
+    return [line.strip() for line in list_path.read_text(encoding="utf-8").splitlines() if line.strip()]
+
+def list_slices(folder_path, tiff_paths):
+    # One entry per frame, as the stack 04_Legand.py builds: {"path", "page", "label",
+    # "source", "info_path"}. Multi-page files (stack output of the extract scripts)
+    # contribute every page; a page is named after its source in the stack's _frames.txt
+    # and takes its metadata from TIFF_<channel>_<role>/metadata/<name>_metadata.txt,
+    # else it is "<file>:<n>" with the page's own description (info_path None).
+    metadata_folder = Path(folder_path).parent / "metadata"
+    slices = []
+    for path in tiff_paths:
+        with tifffile.TiffFile(path) as tif:
+            num_pages = len(tif.pages)
+        if num_pages == 1:
+            slices.append({"path": path, "page": 0, "label": path.name, "source": path.stem, "info_path": None})
+            continue
+        names = frame_sources(path) or []
+        for s in range(num_pages):
+            label = f"{path.name}:{s + 1}"
+            entry = {"path": path, "page": s, "label": label, "source": f"{path.stem}:{s + 1}", "info_path": None}
+            if s < len(names) and (metadata_folder / f"{names[s]}_metadata.txt").is_file():
+                entry.update(label=names[s], source=names[s], info_path=metadata_folder / f"{names[s]}_metadata.txt")
+            slices.append(entry)
+    return slices
+
+def load_legend_rows(folder_path, slices):
+    # One table row per slice (see list_slices): reused from Legend_metadata.csv if its
+    # file is unchanged and the row has the current LEGEND_SCHEMA, else parsed from its
+    # _metadata.txt or page description (tags only, no pixels). The table is rewritten.
+    table_path = folder_path / LEGEND_TABLE_NAME
+    cached = {}
+    if table_path.is_file():
+        with open(table_path, newline="", encoding="utf-8") as f:
+            cached = {row["file"]: row for row in csv.DictReader(f)}
+
+    rows, store_cache = [], {}
+    for path, group in groupby(slices, key=lambda entry: entry["path"]):
+        tif = None  # Opened once per file, only if a page description is needed
+        try:
+            for entry in group:
+                st = (entry["info_path"] or path).stat()
+                size, mtime = str(st.st_size), str(int(st.st_mtime))
+                row = cached.get(entry["label"])
+                if row is None or (row.get("schema"), row["size"], row["mtime"]) != (LEGEND_SCHEMA, size, mtime):
+                    if entry["info_path"] is not None:
+                        info = entry["info_path"].read_text(encoding="utf-8")
+                    else:
+                        tif = tif or tifffile.TiffFile(path)
+                        info = tif.pages[entry["page"]].description or ""
+                    row = slice_metadata(entry["label"], resolve_metadata_store(info, folder_path, store_cache))
+                    row["schema"], row["size"], row["mtime"] = LEGEND_SCHEMA, size, mtime
+                rows.append(row)
+        finally:
+            if tif is not None:
+                tif.close()
+    add_legend_forces(rows)
+    for row in rows:
+        if row["force_status"]:
+            print(f"{row['file']}: {row['force_status']}")
+
+    with open(table_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, LEGEND_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return rows
+
+# ----------------------------- Legend text of every slice -----------------------------
+def _parse_time(text):
+    try:
+        return datetime.strptime(text, TIME_FORMAT) if text else None
+    except ValueError:
+        return None
+
+def _format_force(text):
+    try:
+        return "{:.2e} N".format(float(text))
+    except ValueError:
+        return "N/A"
+
+def legend_lines(rows, fields, elapsed=None):
+    # Returns one list of "Field: value" lines per slice, formatted as in 04_Legand.py.
+    # `elapsed` (seconds per slice, e.g. from the timestamp index) replaces the
+    # differences of the slice times.
+    times = [_parse_time(row["time"]) for row in rows]
+    t0 = times[0] if times else None
+    if elapsed is None:
+        elapsed = [(t - t0).total_seconds() if t0 and t else None for t in times]
+    legends = []
+    for row, t, seconds in zip(rows, times, elapsed):
+        values = {
+            "Title": row["file"],
+            "Time": t.strftime("%Y-%m-%d %H:%M:%S") if t else "N/A",
+            "Spring Constant": row["spring_constant"] or "N/A",
+            "Normal Force": _format_force(row["normal_force"]),
+            "Tapping Force": _format_force(row["tapping_force"]),
+            "Elapsed Time": "N/A",
+        }
+        if seconds is not None:
+            values["Elapsed Time"] = "{:.3f} s".format(seconds) if seconds < 60 else "{:.2f} min".format(seconds / 60.0)
+        legends.append(["{}: {}".format(field, values.get(field, "N/A")) for field in fields])
+    return legends
+
+# ----------------------------- Glyph cache -----------------------------
+def load_font(font_size):
+    for name in ("DejaVuSans.ttf", "arial.ttf", "Arial.ttf"):
+        try:
+            return ImageFont.truetype(name, font_size)
+        except OSError:
+            pass
+    try:
+        return ImageFont.load_default(font_size)  # Pillow >= 10.1
+    except TypeError:
+        return ImageFont.load_default()
+
+def make_glyph_cache(font_size):
+    # {"font", "height", "ascent", "glyphs": {char: (alpha mask, advance)}, "lines": {text: mask}}
+    font = load_font(font_size)
+    ascent, descent = font.getmetrics()
+    return {"font": font, "height": ascent + descent, "glyphs": {}, "lines": {}}
+
+def _glyph(cache, char):
+    glyph = cache["glyphs"].get(char)
+    if glyph is None:
+        font = cache["font"]
+        advance = max(1, int(round(font.getlength(char))))
+        width = max(advance, font.getbbox(char)[2]) if char.strip() else advance
+        image = Image.new("L", (width, cache["height"]), 0)
+        ImageDraw.Draw(image).text((0, 0), char, fill=255, font=font)
+        glyph = (np.asarray(image, dtype=np.float32) / 255.0, advance)
+        cache["glyphs"][char] = glyph
+    return glyph
+
+def text_mask(cache, text):
+    # Alpha mask (0..1) of one line of text, assembled from cached glyphs. Whole lines
+    # are cached too, since most legend lines repeat from frame to frame.
+    mask = cache["lines"].get(text)
+    if mask is None:
+        glyphs = [_glyph(cache, char) for char in text]
+        width = sum(advance for _, advance in glyphs) + max((g.shape[1] for g, _ in glyphs), default=0)
+        mask = np.zeros((cache["height"], width), dtype=np.float32)
+        x = 0
+        for glyph, advance in glyphs:
+            region = mask[:, x:x + glyph.shape[1]]
+            np.maximum(region, glyph[:, :region.shape[1]], out=region)
+            x += advance
+        mask = mask[:, :max(x, 1)]
+        cache["lines"][text] = mask
+    return mask
+
+# ----------------------------- Frame conversion and compositing -----------------------------
+def to_display(frame, saturated=0.35):
+    # uint8 frame with `saturated` % of the pixels clipped, like FIJI's Enhance Contrast
+    if frame.ndim == 3:
+        return frame if frame.dtype == np.uint8 else to_display(frame.mean(axis=2), saturated)
+    low, high = np.percentile(frame, [saturated / 2, 100 - saturated / 2])
+    if high <= low:
+        return np.zeros(frame.shape, dtype=np.uint8)
+    scaled = (frame.astype(np.float32) - low) * (255.0 / (high - low))
+    return np.clip(scaled, 0, 255).astype(np.uint8)
+
+def burn_in(frame, lines, cache, position=(10, 10), spacing=None, box_opacity=0.5):
+    # Returns a copy of `frame` with the lines composited in white on a translucent
+    # dark box. Integer frames use their type's maximum as white, float frames their maximum.
+    out = np.array(frame, copy=True)
+    if np.issubdtype(out.dtype, np.integer):
+        white = np.iinfo(out.dtype).max
+    else:
+        white = float(np.nanmax(out)) if out.size else 1.0
+    spacing = spacing or int(cache["height"] * 1.2)
+    x0, y0 = position
+    for i, line in enumerate(lines):
+        mask = text_mask(cache, line)
+        y = y0 + i * spacing
+        h = max(0, min(mask.shape[0], out.shape[0] - y))
+        w = max(0, min(mask.shape[1], out.shape[1] - x0))
+        if not h or not w:
+            continue
+        alpha = mask[:h, :w]
+        if out.ndim == 3:
+            alpha = alpha[:, :, None]
+        region = out[y:y + h, x0:x0 + w].astype(np.float32)
+        region *= 1.0 - box_opacity  # Dark box behind the text
+        region += (white - region) * alpha
+        out[y:y + h, x0:x0 + w] = region.astype(out.dtype)
+    return out
+
+# ----------------------------- Render a whole folder -----------------------------
+def output_nbytes(tiff_paths, to_8bit):
+    # Upper bound of the image data of the legend stack, from every page of every input
+    # (tags only): one byte per sample with to_8bit, else the input's size
+    nbytes = 0
+    for path in tiff_paths:
+        with tifffile.TiffFile(path) as tif:
+            for page in tif.pages:
+                nbytes += int(np.prod(page.shape)) if to_8bit else page.nbytes
+    return nbytes
+
+def render_legends(folder_path, output_path, fields=LEGEND_FIELDS, font_size=None, position=(10, 10),
+                   to_8bit=True, saturated=0.35, box_opacity=0.5, num_threads=4, compression=None):
+    # Burns the legend into every frame of the TIFFs in `folder_path` (in acquisition order
+    # if there is a Timestamp_index.csv, else by name, as 04_Legand.py; every page of a
+    # multi-page file, see list_slices) and writes them as frames of
+    # `output_path`, which belongs outside the folder: a stack inside it would be read as
+    # a frame by every folder reader (04_Legand.py, stack_merge, stack_pipeline). With
+    # to_8bit, frames are first contrast-stretched to uint8 (movie/publication export);
+    # otherwise the legend is burned into the original data type.
+    # Returns the number of frames written.
+    folder_path = Path(folder_path)
+    tiff_paths = sorted(p for p in folder_path.iterdir() if p.suffix.lower() in (".tif", ".tiff"))
+    tiff_paths = [p for p in tiff_paths if p.resolve() != Path(output_path).resolve()]
+    if not tiff_paths:
+        return 0
+    index = load_timestamp_index(folder_path)
+    tiff_paths = acquisition_sorted(tiff_paths, index)
+    slices = list_slices(folder_path, tiff_paths)
+    elapsed = elapsed_seconds([f"{entry['source']}.tif" for entry in slices], index)
+    legends = legend_lines(load_legend_rows(folder_path, slices), fields, elapsed)
+
+    caches = {}  # One glyph cache per font size (frames of different heights)
+
+    def render(job):
+        entry, lines = job
+        with mapped_file(entry["path"]) as file_map, tifffile.TiffFile(entry["path"]) as tif:
+            frame = read_page(tif.pages[entry["page"]], file_map)
+            if to_8bit:
+                frame = to_display(frame, saturated)
+            size = font_size or max(10, int(frame.shape[0] * 0.03))  # Same size rule as 04_Legand.py
+            if size not in caches:
+                caches[size] = make_glyph_cache(size)
+            frame = burn_in(frame, lines, caches[size], position, int(size * 1.5), box_opacity)  # A copy, not a view
+        return frame
+
+    jobs = list(zip(slices, legends))
+    batch = max(1, num_threads) * 4  # Frames in flight, keeps memory bounded
+    bigtiff = needs_bigtiff(output_nbytes(tiff_paths, to_8bit))
+    with tifffile.TiffWriter(output_path, bigtiff=bigtiff) as writer, \
+            ThreadPoolExecutor(max_workers=max(1, num_threads)) as pool:
+        for start in range(0, len(jobs), batch):
+            for (entry, lines), frame in zip(jobs[start:start + batch], pool.map(render, jobs[start:start + batch])):
+                writer.write(frame, description="\n".join([f"source-file : {entry['source']}", *lines]),
+                             photometric="rgb" if frame.ndim == 3 else "minisblack", compression=compression)
+    return len(jobs)
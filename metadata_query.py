@@ -0,0 +1,139 @@
+import re
+import json
+from concurrent.futures import ProcessPoolExecutor
+from jpk_metadata import read_tiff_ifds, parse_properties
+from parameter_export import split_value_unit
+
+# ----------------------------- Properties of the first IFD -----------------------------
+def read_first_ifd_properties(file_path):
+    # {dotted key: typed value} of every text tag in the first IFD only: the shared
+    # header of a .jpk, or the ImageDescription of an extracted .tif. No other IFD
+    # and no image data is read.
+    properties = {}
+    for tags in read_tiff_ifds(file_path, max_ifds=1):
+        for value in tags.values():
+            if isinstance(value, bytes):
+                value = value.split(b"\x00", 1)[0].decode("ISO-8859-1")
+            if isinstance(value, str):
+                for key, typed in parse_properties(value).items():
+                    properties.setdefault(key, typed)
+    return properties
+
+def lookup(properties, key):
+    # Exact key, else the first longer dotted key ending in it
+    # ("spring-constant" finds "cantilever-calibration-info.spring-constant")
+    if key in properties:
+        return properties[key]
+    suffix = "." + key
+    return next((value for name, value in properties.items() if name.endswith(suffix)), None)
+
+# ----------------------------- Predicates -----------------------------
+# "<key> <op> <value>" or just "<key>" (the key must exist); ~ is a case-insensitive "contains"
+_PREDICATE = re.compile(r"^\s*([\w.\-]+)\s*(?:(==|!=|>=|<=|=|>|<|~)\s*(.*?))?\s*$")
+
+def parse_predicate(text):
+    # "spring-constant > 40" -> ("spring-constant", ">", "40")
+    match = _PREDICATE.match(text)
+    if not match:
+        raise ValueError(f"Invalid predicate: {text!r} (expected e.g. 'spring-constant > 40')")
+    key, op, value = match.groups()
+    return key, "==" if op == "=" else op, value
+
+# Units a value may carry and still compare as a number: an SI-prefixed base unit,
+# optionally with a power ("m^2", "s-1"), combined with "/", "*" or "·" ("N/m", "nm/V")
+_UNIT_PART = r"[afpnuµmcdkMG]?(?:m|g|s|A|K|V|N|Hz|Pa|W|J|C|F|Ω|Ohm|rad|deg|min|h|px|pixels?|lines?)(?:\^?-?\d)?"
+_KNOWN_UNIT = re.compile(rf"{_UNIT_PART}(?:[/*·]{_UNIT_PART})*|%|°C?")
+
+def as_number(value):
+    # Numeric value of a property, or None. Only a plain number or a number with a known
+    # unit (see _KNOWN_UNIT) is numeric: "0.1 N/m" compares as 0.1, while names such as
+    # "240AC-NA" or "300 AC" are text, so "== 240AC-XX" cannot match them numerically.
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    number, unit = split_value_unit(value)
+    if number is None or (unit and not _KNOWN_UNIT.fullmatch(unit)):
+        return None
+    return number
+
+def format_value(value):
+    # Property value as written in the metadata
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+def _test(actual, op, expected):
+    if op is None:
+        return actual is not None
+    if actual is None:
+        return op == "!="
+    if op == "~":
+        return expected.lower() in str(actual).lower()
+    actual_number, expected_number = as_number(actual), as_number(expected)
+    if actual_number is not None and expected_number is not None:
+        a, b = actual_number, expected_number
+    elif expected_number is not None and op not in ("==", "!="):
+        return False  # A number is only ordered against numbers
+    else:
+        # Text and true/false compare case-insensitively; ISO dates order correctly as text
+        a, b = format_value(actual).lower(), expected.lower()
+    return {"==": a == b, "!=": a != b, ">": a > b, "<": a < b, ">=": a >= b, "<=": a <= b}[op]
+
+def compile_query(predicates):
+    # Returns a function properties -> bool that is True if all predicates hold
+    parsed = [parse_predicate(p) for p in predicates]
+    return lambda properties: all(_test(lookup(properties, key), op, value) for key, op, value in parsed)
+
+# ----------------------------- Per-file work (runs inside the worker processes) -----------------------------
+_query = None
+_fields = None
+
+def init_worker(predicates, fields):
+    global _query, _fields
+    _query = compile_query(predicates)
+    _fields = list(fields)
+
+def query_file(file_path):
+    # Returns (record, error): record is None if the file does not match, else the
+    # requested fields (all properties if no fields were given). Never raises.
+    try:
+        properties = read_first_ifd_properties(file_path)
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+    if not _query(properties):
+        return None, None
+    if not _fields:
+        return properties, None
+    return {field: lookup(properties, field) for field in _fields}, None
+
+def query_files(files, predicates=(), fields=(), num_workers=1, chunk_size=32):
+    # Yields (file_path, record, error) in the order of `files` for every file that
+    # matches or failed. Files are filtered inside the workers, so only matches are
+    # sent back.
+    if num_workers <= 1:
+        init_worker(predicates, fields)
+        results = map(query_file, files)
+        for file_path, (record, error) in zip(files, results):
+            if record is not None or error:
+                yield file_path, record, error
+        return
+
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=init_worker, initargs=(predicates, fields)) as pool:
+        for file_path, (record, error) in zip(files, pool.map(query_file, files, chunksize=chunk_size)):
+            if record is not None or error:
+                yield file_path, record, error
+
+# ----------------------------- Output -----------------------------
+def format_json_line(name, record):
+    return json.dumps({"file": name, **record}, ensure_ascii=False, default=str)
+
+def format_table(rows, fields):
+    # rows: list of (name, record). Returns the lines of a left-aligned text table
+    def cell(value):
+        return "" if value is None else format_value(value)
+
+    header = ["file", *fields]
+    body = [[name, *(cell(record.get(field)) for field in fields)] for name, record in rows]
+    widths = [max(len(row[i]) for row in [header, *body]) for i in range(len(header))]
+    return ["  ".join(value.ljust(width) for value, width in zip(row, widths)).rstrip() for row in [header, *body]]
@@ -0,0 +1,206 @@
+import sqlite3  # For the on-disk index (FTS5 full-text table if available)
+from jpk_metadata import read_tiff_ifds, parse_properties
+from metadata_query import parse_predicate, as_number, format_value
+
+# Search index stored next to the JPK files
+SEARCH_INDEX_FILENAME = "Metadata_search.sqlite"
+COMMIT_EVERY = 500  # Save progress every N indexed files in update_index
+# Stored as PRAGMA user_version. 2: "number" only holds plain numbers and numbers with a
+# known unit (see metadata_query.as_number); older indexes are converted on opening.
+SCHEMA_VERSION = 2
+
+# ----------------------------- Open (or create) the index -----------------------------
+def open_search_index(db_path):
+    # Tables:
+    #   files:      one row per JPK (name relative to the folder, size, mtime_ns)
+    #   keys:       every distinct property key
+    #   properties: (file, key, value as text, value as number) with indexes for
+    #               exact, case-insensitive and numeric range lookups
+    #   fulltext:   FTS5 table with the whole header text of each file (rowid = file id)
+    con = sqlite3.connect(db_path)
+    con.executescript(
+        "CREATE TABLE IF NOT EXISTS files ("
+        " id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL);"
+        "CREATE TABLE IF NOT EXISTS keys (id INTEGER PRIMARY KEY, key TEXT UNIQUE NOT NULL);"
+        "CREATE TABLE IF NOT EXISTS properties ("
+        " file_id INTEGER NOT NULL, key_id INTEGER NOT NULL, value TEXT NOT NULL, number REAL);"
+        "CREATE INDEX IF NOT EXISTS properties_number ON properties (key_id, number);"
+        "CREATE INDEX IF NOT EXISTS properties_value ON properties (key_id, value COLLATE NOCASE);"
+        "CREATE INDEX IF NOT EXISTS properties_file ON properties (file_id);"
+    )
+    try:
+        con.execute("CREATE VIRTUAL TABLE IF NOT EXISTS fulltext USING fts5(text)")
+    except sqlite3.OperationalError:
+        # SQLite built without FTS5: plain table, text queries fall back to LIKE
+        con.execute("CREATE TABLE IF NOT EXISTS fulltext (text TEXT)")
+    if con.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+        # Recompute the numbers from the stored text, which is kept as it was read
+        con.create_function("as_number", 1, as_number, deterministic=True)
+        con.execute("UPDATE properties SET number = as_number(value)")
+        con.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        con.commit()
+    return con
+
+def has_fts5(con):
+    sql = con.execute("SELECT sql FROM sqlite_master WHERE name = 'fulltext'").fetchone()[0]
+    return "fts5" in sql.lower()
+
+# ----------------------------- Read the searchable metadata of one JPK -----------------------------
+def read_searchable_metadata(file_path):
+    # (properties, text): the typed "key : value" properties of the shared header
+    # (first occurrence wins) and every text tag of the file joined for full-text search.
+    # Only the TIFF tag tables are read.
+    properties, blocks = {}, []
+    for tags in read_tiff_ifds(file_path):
+        for value in tags.values():
+            if isinstance(value, bytes):
+                value = value.split(b"\x00", 1)[0].decode("ISO-8859-1")
+            if isinstance(value, str) and value.strip():
+                blocks.append(value.strip())
+                for key, typed in parse_properties(value).items():
+                    properties.setdefault(key, typed)
+    return properties, "\n".join(blocks)
+
+# ----------------------------- Add, update and remove files -----------------------------
+def _key_id(con, key, cache):
+    key_id = cache.get(key)
+    if key_id is None:
+        con.execute("INSERT OR IGNORE INTO keys (key) VALUES (?)", (key,))
+        key_id = con.execute("SELECT id FROM keys WHERE key = ?", (key,)).fetchone()[0]
+        cache[key] = key_id
+    return key_id
+
+def remove_file(con, name):
+    row = con.execute("SELECT id FROM files WHERE name = ?", (name,)).fetchone()
+    if row:
+        con.execute("DELETE FROM properties WHERE file_id = ?", row)
+        con.execute("DELETE FROM fulltext WHERE rowid = ?", row)
+        con.execute("DELETE FROM files WHERE id = ?", row)
+
+def index_file(con, name, file_path, key_cache=None):
+    # (Re)indexes one file unless it is already indexed with the same size/mtime.
+    # Returns True if the file was (re)indexed. The caller commits.
+    st = file_path.stat()
+    row = con.execute("SELECT size, mtime_ns FROM files WHERE name = ?", (name,)).fetchone()
+    if row == (st.st_size, st.st_mtime_ns):
+        return False
+
+    properties, text = read_searchable_metadata(file_path)
+    remove_file(con, name)
+    insert_file(con, name, st.st_size, st.st_mtime_ns, properties, text, key_cache)
+    return True
+
+def insert_file(con, name, size, mtime_ns, properties, text, key_cache=None):
+    # Adds the rows of one file that is not in the index yet (see read_searchable_metadata
+    # for `properties` and `text`). The caller commits.
+    key_cache = {} if key_cache is None else key_cache
+    file_id = con.execute(
+        "INSERT INTO files (name, size, mtime_ns) VALUES (?, ?, ?)", (name, size, mtime_ns)
+    ).lastrowid
+    con.executemany(
+        "INSERT INTO properties (file_id, key_id, value, number) VALUES (?, ?, ?, ?)",
+        [(file_id, _key_id(con, key, key_cache), format_value(value), as_number(value))
+         for key, value in properties.items()],
+    )
+    con.execute("INSERT INTO fulltext (rowid, text) VALUES (?, ?)", (file_id, text))
+
+def update_index(con, folder_path, jpk_files=None, remove_missing=True):
+    # Indexes new or changed JPK files of `folder_path` (default: all of them, subfolders
+    # included) and, with remove_missing, drops indexed files that no longer exist. Files
+    # missing from `jpk_files` but still on disk (e.g. in subfolders, indexed by
+    # 02_Search_Metadata.py) are kept. Returns (indexed, errors).
+    if jpk_files is None:
+        jpk_files = [p for p in folder_path.rglob("*") if p.name.lower().endswith(".jpk") and p.is_file()]
+    names = {p.relative_to(folder_path).as_posix(): p for p in jpk_files}
+    if remove_missing:
+        for (name,) in con.execute("SELECT name FROM files").fetchall():
+            if name not in names and not (folder_path / name).is_file():
+                remove_file(con, name)
+
+    indexed, errors, key_cache = 0, [], {}
+    for name in sorted(names):
+        try:
+            indexed += index_file(con, name, names[name], key_cache)
+        except (OSError, ValueError) as e:
+            errors.append((name, e))
+            remove_file(con, name)
+        if indexed and indexed % COMMIT_EVERY == 0:
+            con.commit()
+    con.commit()
+    return indexed, errors
+
+# ----------------------------- Query -----------------------------
+def _matching_key_ids(con, key):
+    # Exact key or any longer dotted key ending in it
+    return [key_id for key_id, name in con.execute("SELECT id, key FROM keys")
+            if name == key or name.endswith("." + key)]
+
+def _predicate_sql(con, predicate):
+    # Returns (SQL condition on files.id, arguments), or None if it can never match
+    key, op, value = parse_predicate(predicate)
+    key_ids = _matching_key_ids(con, key)
+    if not key_ids:
+        return ("1", []) if op == "!=" else None
+    in_keys = f"key_id IN ({','.join('?' * len(key_ids))})"
+    number = as_number(value) if value is not None else None
+
+    if op is None:
+        return f"id IN (SELECT file_id FROM properties WHERE {in_keys})", key_ids
+    if op == "~":
+        return (f"id IN (SELECT file_id FROM properties WHERE {in_keys} AND value LIKE ? ESCAPE '\\')",
+                [*key_ids, "%" + value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"])
+    if op in ("==", "!="):
+        if number is not None:
+            condition, args = "number = ?", [number]
+        else:
+            condition, args = "value = ? COLLATE NOCASE", [value]
+        negate = "NOT " if op == "!=" else ""
+        return f"id {negate}IN (SELECT file_id FROM properties WHERE {in_keys} AND {condition})", [*key_ids, *args]
+    if number is not None:
+        return f"id IN (SELECT file_id FROM properties WHERE {in_keys} AND number {op} ?)", [*key_ids, number]
+    # Text ordering, e.g. "start-time >= 2024-05-01" (ISO dates order correctly as text)
+    return (f"id IN (SELECT file_id FROM properties WHERE {in_keys} AND value COLLATE NOCASE {op} ?)",
+            [*key_ids, value])
+
+def search(con, text=None, where=(), limit=None):
+    # Names of the indexed files (sorted) whose header contains `text` and that satisfy
+    # every predicate in `where` ("spring-constant > 40", "cantilever-name == X", see
+    # metadata_query). With FTS5, `text` uses its query syntax: words, "exact phrases",
+    # prefix*, AND/OR/NOT. Without FTS5 it is a plain substring.
+    conditions, args = [], []
+    for predicate in where:
+        sql = _predicate_sql(con, predicate)
+        if sql is None:
+            return []
+        conditions.append(sql[0])
+        args.extend(sql[1])
+    if text:
+        if has_fts5(con):
+            conditions.append("id IN (SELECT rowid FROM fulltext WHERE fulltext MATCH ?)")
+        else:
+            conditions.append("id IN (SELECT rowid FROM fulltext WHERE instr(lower(text), lower(?)) > 0)")
+        args.append(text)
+
+    query = "SELECT name FROM files"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY name"
+    if limit:
+        query += f" LIMIT {int(limit)}"
+    return [name for (name,) in con.execute(query, args)]
+
+def get_properties(con, name, keys=None):
+    # {key: value text} of one indexed file; `keys` selects keys (dotted suffixes allowed)
+    rows = con.execute(
+        "SELECT keys.key, properties.value FROM properties"
+        " JOIN files ON files.id = properties.file_id JOIN keys ON keys.id = properties.key_id"
+        " WHERE files.name = ?", (name,)
+    ).fetchall()
+    properties = dict(rows)
+    if keys is None:
+        return properties
+    selected = {}
+    for key in keys:
+        selected[key] = properties.get(key, next(
+            (value for full_key, value in rows if full_key.endswith("." + key)), None))
+    return selected
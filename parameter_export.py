@@ -0,0 +1,121 @@
+import re  # For splitting numbers from units
+import csv  # For correctly quoted CSV output
+
+# Rows buffered per Parquet row group
+PARQUET_BATCH_SIZE = 10000
+
+# A number optionally followed by a unit, e.g. "0.1 N/m", "12.3 nm/V", "-5e-3", "20 %".
+# A unit is separated by whitespace and made of unit symbols only ("m^2", "m/s^2"), so names
+# such as "240AC-NA" or "300 AC-A" stay text; only "%" and "°" may follow the number directly.
+_NUMBER_WITH_UNIT = re.compile(r"\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)"
+                               r"(?:\s+([A-Za-zµ°%/][A-Za-zµΩ°%/^*·\d]*)|\s*([%°]))?\s*")
+
+# ----------------------------- Split "0.1 N/m" into (0.1, "N/m") -----------------------------
+def split_value_unit(value):
+    # Returns (number, unit) or (None, None) if the value is not a number
+    match = _NUMBER_WITH_UNIT.fullmatch(value)
+    if not match:
+        return None, None
+    return float(match.group(1)), match.group(2) or match.group(3) or ""
+
+# ----------------------------- Decide the type of every column -----------------------------
+def plan_columns(parameters, rows):
+    # One streaming pass over the rows. A parameter becomes a float column if it has at
+    # least one value and every non-empty value is a number, plus a "<parameter> [unit]"
+    # text column if any value carries a unit. Everything else, including a column
+    # without any value, stays text.
+    # Returns a list of (column name, parameter, kind) with kind in "text", "number", "unit".
+    numeric = dict.fromkeys(parameters, True)
+    seen, with_unit = set(), set()
+    for row in rows:
+        for parameter in parameters:
+            value = row.get(parameter)
+            if not value or not numeric[parameter]:
+                continue
+            seen.add(parameter)
+            number, unit = split_value_unit(value)
+            if number is None:
+                numeric[parameter] = False
+            elif unit:
+                with_unit.add(parameter)
+
+    columns = [("Filename", "Filename", "text")]
+    for parameter in parameters:
+        if numeric[parameter] and parameter in seen:
+            columns.append((parameter, parameter, "number"))
+            if parameter in with_unit:
+                columns.append((f"{parameter} [unit]", parameter, "unit"))
+        else:
+            columns.append((parameter, parameter, "text"))
+    return columns
+
+# ----------------------------- Convert one row to typed values -----------------------------
+def typed_values(row, columns):
+    values = []
+    for _, parameter, kind in columns:
+        value = row.get(parameter) or None
+        if value is not None and kind != "text":
+            number, unit = split_value_unit(value)
+            value = number if kind == "number" else (unit or None)
+        values.append(value)
+    return values
+
+# ----------------------------- Streaming writers -----------------------------
+def write_csv(path, columns, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow([name for name, _, _ in columns])
+        for row in rows:
+            writer.writerow(["" if v is None else v for v in typed_values(row, columns)])
+
+def write_xlsx(path, columns, rows):
+    from openpyxl import Workbook  # Write-only mode streams rows to disk
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Parameters")
+    sheet.append([name for name, _, _ in columns])
+    for row in rows:
+        sheet.append(typed_values(row, columns))
+    workbook.save(path)
+
+def write_parquet(path, columns, rows):
+    import pyarrow as pa  # Optional dependency
+    import pyarrow.parquet as pq
+    schema = pa.schema([(name, pa.float64() if kind == "number" else pa.string()) for name, _, kind in columns])
+
+    def to_table(batch):
+        arrays = [pa.array([values[i] for values in batch], type=schema.field(i).type) for i in range(len(columns))]
+        return pa.Table.from_arrays(arrays, schema=schema)
+
+    with pq.ParquetWriter(path, schema) as writer:
+        batch = []
+        for row in rows:
+            batch.append(typed_values(row, columns))
+            if len(batch) >= PARQUET_BATCH_SIZE:
+                writer.write_table(to_table(batch))
+                batch = []
+        if batch:
+            writer.write_table(to_table(batch))
+
+WRITERS = {
+    "csv": write_csv,
+    "xlsx": write_xlsx,
+    "parquet": write_parquet,
+}
+
+# ----------------------------- Export in all requested formats -----------------------------
+def export_parameters(base_path, parameters, make_rows, formats):
+    # make_rows() must return a fresh iterator of row dicts (with "Filename") each time it
+    # is called: rows are streamed once to plan the columns and once per output format,
+    # so memory stays flat however many files there are.
+    # Returns the list of written files.
+    columns = plan_columns(parameters, make_rows())
+    written = []
+    for fmt in formats:
+        path = base_path.with_suffix(f".{fmt}")
+        try:
+            WRITERS[fmt](path, columns, make_rows())
+        except ImportError as e:
+            print(f"Skipping {fmt} export, missing package: {e.name}")
+            continue
+        written.append(path)
+    return written
@@ -0,0 +1,58 @@
+import json  # For storing parsed rows
+import sqlite3  # For the on-disk index
+import hashlib  # For fingerprinting the parameter list
+
+# Index file stored next to the data
+INDEX_FILENAME = "Parameters_index.sqlite"
+
+# ----------------------------- Open (or create) the index -----------------------------
+def open_index(db_path):
+    con = sqlite3.connect(db_path)
+    con.execute(
+        "CREATE TABLE IF NOT EXISTS files ("
+        " path TEXT PRIMARY KEY,"        # Path relative to the indexed folder
+        " size INTEGER NOT NULL,"        # File size in bytes
+        " mtime_ns INTEGER NOT NULL,"    # Modification time in nanoseconds
+        " parameters TEXT NOT NULL,"     # Fingerprint of the parameter list used
+        " row TEXT NOT NULL)"            # Parsed {parameter: value} as JSON
+    )
+    return con
+
+# ----------------------------- Fingerprint of a parameter list -----------------------------
+def parameters_signature(parameters):
+    # Rows parsed with a different parameter list are treated as stale
+    return hashlib.sha1("\n".join(parameters).encode("utf-8")).hexdigest()
+
+# ----------------------------- Find files that need (re)parsing -----------------------------
+def find_stale(con, file_stats, parameters):
+    # file_stats: {relative path: (size, mtime_ns)}. Returns the paths that are new,
+    # changed on disk, or were parsed with a different parameter list.
+    signature = parameters_signature(parameters)
+    indexed = {
+        path: (size, mtime_ns, params)
+        for path, size, mtime_ns, params in con.execute("SELECT path, size, mtime_ns, parameters FROM files")
+    }
+    return [path for path, stat in file_stats.items() if indexed.get(path) != (*stat, signature)]
+
+# ----------------------------- Drop files that no longer exist -----------------------------
+def remove_missing(con, existing_paths):
+    existing_paths = set(existing_paths)
+    missing = [(path,) for (path,) in con.execute("SELECT path FROM files") if path not in existing_paths]
+    con.executemany("DELETE FROM files WHERE path = ?", missing)
+    return len(missing)
+
+# ----------------------------- Store one parsed file -----------------------------
+def store_row(con, path, size, mtime_ns, parameters, row):
+    con.execute(
+        "INSERT OR REPLACE INTO files (path, size, mtime_ns, parameters, row) VALUES (?, ?, ?, ?, ?)",
+        (path, size, mtime_ns, parameters_signature(parameters), json.dumps(row)),
+    )
+
+# ----------------------------- Forget one file -----------------------------
+def remove_row(con, path):
+    con.execute("DELETE FROM files WHERE path = ?", (path,))
+
+# ----------------------------- Read all rows back in path order -----------------------------
+def iter_rows(con):
+    for path, row in con.execute("SELECT path, row FROM files ORDER BY path"):
+        yield path, json.loads(row)
@@ -0,0 +1,177 @@
+import math
+import tifffile
+import numpy as np
+from pathlib import Path
+from jpk_extract import map_file, read_page, needs_bigtiff
+from timestamp_index import load_timestamp_index, acquisition_sorted
+
+# Headless montage engine: combines two or more stacks frame by frame into one
+# multi-page TIFF (BigTIFF only if it could pass 4 GB). Multi-page inputs are read as memory-mapped views where possible
+# (see jpk_extract.read_page), cells are filled with NumPy slicing into one reused canvas,
+# and every merged frame is written as soon as it is built.
+
+LAYOUTS = ("split", "side-by-side", "grid")
+SIZE_MODES = ("crop", "pad", "resize")
+SLICE_MODES = ("shortest", "longest", "repeat")
+
+# ----------------------------- Open the inputs -----------------------------
+def open_source(path):
+    # A source is a folder of TIFFs (one frame per page of each file, in acquisition order
+    # if the extraction wrote a Timestamp_index.csv, else by name as in 03_Merge_FIJI.py)
+    # or a multi-page TIFF (one frame per page).
+    # Returns (list of frame readers, list of open TiffFiles and file maps to close).
+    path = Path(path)
+    if path.is_dir():
+        files = sorted(p for p in path.iterdir() if p.suffix.lower() in (".tif", ".tiff"))
+        files = acquisition_sorted(files, load_timestamp_index(path))
+        frames = []
+        for file_path in files:
+            with tifffile.TiffFile(file_path) as tif:
+                num_pages = len(tif.pages)  # Tags only
+            frames.extend(lambda p=file_path, i=i: _read_single(p, i) for i in range(num_pages))
+        return frames, []
+
+    tif = tifffile.TiffFile(path)
+    file_map = map_file(path)
+    handles = [tif] if file_map is None else [tif, file_map]
+    return [lambda page=page: _read_frame(page, file_map) for page in tif.pages], handles
+
+def close_source(handles):
+    # Closes the TiffFiles and file maps returned by open_source. Frames read from a map
+    # must be dropped first; one still held by an exception's traceback is released with it.
+    for handle in handles:
+        try:
+            handle.close()
+        except BufferError:
+            pass
+
+def _read_single(file_path, index=0):
+    # Page `index` of a file of a folder source, read into memory: a map would have to
+    # outlive its reader
+    with tifffile.TiffFile(file_path) as tif:
+        return _read_frame(tif.pages[index], None)
+
+def _read_frame(page, file_map):
+    frame = read_page(page, file_map)
+    if frame.ndim == 3 and page.planarconfig == 2:
+        frame = np.moveaxis(frame, 0, -1)  # Separate colour planes -> (y, x, samples), still a view
+    return frame
+
+# ----------------------------- Geometry -----------------------------
+def common_size(shapes, size_mode):
+    # (height, width) every cell is brought to: the smallest input for "crop" and
+    # "resize", the largest for "pad"
+    pick = max if size_mode == "pad" else min
+    return pick(s[0] for s in shapes), pick(s[1] for s in shapes)
+
+def cell_origins(layout, count, height, width, columns=None, gap=0):
+    # Returns (canvas height, canvas width, [(y, x, cell height, cell width) per source])
+    if layout == "split":
+        # Vertical strips of one common frame: source i shows its own i-th strip
+        edges = [round(i * width / count) for i in range(count + 1)]
+        return height, width, [(0, edges[i], height, edges[i + 1] - edges[i]) for i in range(count)]
+    columns = count if layout == "side-by-side" else (columns or math.ceil(math.sqrt(count)))
+    rows = math.ceil(count / columns)
+    cells = [((i // columns) * (height + gap), (i % columns) * (width + gap), height, width) for i in range(count)]
+    return rows * height + (rows - 1) * gap, columns * width + (columns - 1) * gap, cells
+
+def fit_frame(frame, height, width, size_mode):
+    # View (crop/pad) or nearest-neighbour resample of `frame` to at most height × width
+    if size_mode == "resize" and frame.shape[:2] != (height, width):
+        rows = (np.arange(height) * frame.shape[0] // height)
+        cols = (np.arange(width) * frame.shape[1] // width)
+        return frame[rows[:, None], cols]
+    return frame[:height, :width]  # "crop", and "pad" (smaller frames leave fill_value around them)
+
+def common_dtype(dtypes):
+    # (dtype of the merged stack, scale factor per input). Unsigned integer inputs of
+    # different bit depths are scaled to the deepest one (uint8 × 257 -> uint16), so an
+    # 8-bit RGB input keeps its brightness next to a 16-bit gray one. Any other mix
+    # (float with integer, signed integers) raises ValueError.
+    dtypes = [np.dtype(d) for d in dtypes]
+    if len(set(dtypes)) == 1:
+        return dtypes[0], [1] * len(dtypes)
+    if not all(d.kind == "u" for d in dtypes):
+        raise ValueError(f"Cannot merge stacks of types {', '.join(sorted(set(d.name for d in dtypes)))}: "
+                         "only unsigned integer bit depths are rescaled")
+    dtype = max(dtypes, key=lambda d: d.itemsize)
+    return dtype, [int(np.iinfo(dtype).max) // int(np.iinfo(d).max) for d in dtypes]
+
+# ----------------------------- Merge -----------------------------
+def merge_stacks(sources, output_path, layout="split", columns=None, size_mode="crop", slice_mode="shortest",
+                 gap=0, fill_value=0, compression=None):
+    # sources: two or more folders/multi-page TIFFs. Unequal inputs are handled explicitly:
+    #   size_mode  "crop"   cut every frame to the smallest input (top-left corner kept)
+    #              "pad"    place frames at the top-left of a cell of the largest input size
+    #              "resize" nearest-neighbour resample every frame to the smallest input size
+    #   slice_mode "shortest" stop at the shortest input (03_Merge_FIJI.py behaviour)
+    #              "longest"  continue to the longest, missing frames stay fill_value
+    #              "repeat"   continue to the longest, shorter inputs repeat their last frame
+    # Frames with a different number of channels (gray vs RGB) are converted to RGB, and
+    # different bit depths to the deepest one (see common_dtype). The frames are written as
+    # one series (a single description on the first page), so readers return the whole stack.
+    # Returns the number of frames written.
+    if layout not in LAYOUTS or size_mode not in SIZE_MODES or slice_mode not in SLICE_MODES:
+        raise ValueError(f"Unknown layout/size_mode/slice_mode: {layout}, {size_mode}, {slice_mode}")
+    if len(sources) < 2:
+        raise ValueError("At least two stacks are needed")
+
+    opened = [open_source(source) for source in sources]
+    try:
+        readers = [frames for frames, _ in opened]
+        if not all(readers):
+            raise ValueError("Every input must contain at least one frame")
+        counts = [len(frames) for frames in readers]
+        num_frames = min(counts) if slice_mode == "shortest" else max(counts)
+
+        # --- Common frame geometry and type, from the first frame of each input ---
+        firsts = [(f.shape, f.dtype) for f in (frames[0]() for frames in readers)]  # No views kept
+        rgb = any(len(shape) == 3 for shape, _ in firsts)
+        dtype, scales = common_dtype([first_dtype for _, first_dtype in firsts])
+        height, width = common_size([shape for shape, _ in firsts], size_mode)
+        canvas_h, canvas_w, cells = cell_origins(layout, len(sources), height, width, columns, gap)
+        canvas = np.empty((canvas_h, canvas_w, 3) if rgb else (canvas_h, canvas_w), dtype=dtype)
+
+        for source, frames, (shape, first_dtype), scale in zip(sources, readers, firsts, scales):
+            notes = []
+            if scale != 1:
+                notes.append(f"{first_dtype} scaled by {scale} to {dtype}")
+            if shape[:2] != (height, width):
+                notes.append(f"{shape[1]}x{shape[0]} -> {size_mode} to {width}x{height}")
+            if len(frames) != num_frames:
+                notes.append(f"{len(frames)} of {num_frames} frames ({slice_mode})")
+            print(f"{Path(source).name}: {', '.join(notes) if notes else 'ok'}")
+
+        # --- Build and stream every merged frame ---
+        def build(index):
+            # Fills the canvas; the input views die with this call, before the maps are closed
+            canvas.fill(fill_value)
+            for frames, (y, x, cell_h, cell_w), scale in zip(readers, cells, scales):
+                if index < len(frames):
+                    frame = frames[index]()
+                elif slice_mode == "repeat":
+                    frame = frames[-1]()
+                else:
+                    continue
+                frame = fit_frame(frame, height, width, size_mode)
+                if rgb and frame.ndim == 2:
+                    frame = frame[:, :, None]  # Broadcast gray into all three channels
+                if layout == "split":
+                    frame = frame[:, x:x + cell_w]  # Only this source's strip
+                h, w = frame.shape[:2]
+                canvas[y:y + h, x:x + w] = frame
+                if scale != 1:
+                    canvas[y:y + h, x:x + w] *= scale
+            return canvas
+
+        description = "\n".join([f"merged-frames : {num_frames}", f"layout : {layout}",
+                                  *(f"source-{i + 1} : {Path(source).name}" for i, source in enumerate(sources))])
+        with tifffile.TiffWriter(output_path, bigtiff=needs_bigtiff(num_frames * canvas.nbytes)) as writer:
+            # One write of all frames: the canvas is reused, so frames are encoded one at a time
+            writer.write((build(index) for index in range(num_frames)), shape=(num_frames, *canvas.shape),
+                         dtype=dtype, photometric="rgb" if rgb else "minisblack", compression=compression,
+                         description=description, metadata=None, maxworkers=1)
+        return num_frames
+    finally:
+        for _, handles in opened:
+            close_source(handles)
@@ -0,0 +1,362 @@
+import re
+import time
+import tifffile
+import numpy as np
+from pathlib import Path
+from jpk_extract import needs_bigtiff
+from stack_merge import open_source, close_source
+from timestamp_index import load_timestamp_index, acquisition_sorted
+
+# Headless counterpart of the 05_Final_Automatic.py workflow. The same step codes and
+# parameter strings are applied to the whole stack as array operations (one pass per
+# kernel tap or ball offset over a batch of frames) instead of IJ.run per slice.
+# Steps 3 (StackReg) and 5 (TrackMate) are interactive FIJI plugins and are skipped.
+
+STEP_NAMES = {
+    "1": "Gaussian Blur",
+    "2": "Enhance Contrast",
+    "3": "Drift Correction",
+    "4": "Z Projection",
+    "5": "TrackMate Kymograph",
+    "6": "Subtract Background",
+}
+# Used when a step's parameter string is empty, as in 05_Final_Automatic.py
+DEFAULT_PARAMETERS = {"1": "sigma=2", "2": "saturated=0.35", "4": "projection=[Average Intensity]", "6": "rolling=50"}
+FIJI_ONLY_STEPS = {"3", "5"}
+
+BATCH_FRAMES = 64  # Frames per array operation, bounds the temporary arrays
+
+# ----------------------------- Workflow strings -----------------------------
+_ARGUMENT = re.compile(r"(\w+)(?:=(\[[^\]]*\]|\S+))?")
+
+def parse_arguments(text):
+    # ImageJ macro options -> dict: "sigma=2 stack" -> {"sigma": "2", "stack": True},
+    # "projection=[Max Intensity]" -> {"projection": "Max Intensity"}
+    arguments = {}
+    for key, value in _ARGUMENT.findall(text or ""):
+        arguments[key.lower()] = value.strip("[]") if value else True
+    return arguments
+
+def parse_workflow(step_text, parameter_text=""):
+    # "3,1,2,6,4" and "sigma=2; saturated=0.35; ; ; ; rolling=50" (one entry per step code,
+    # as typed in the 05_Final_Automatic.py dialog) -> [(code, name, parameters), ...]
+    step_order = [s.strip() for s in step_text.split(",") if s.strip() in STEP_NAMES]
+    param_list = [s.strip() for s in parameter_text.split(";")]
+    workflow = []
+    for step in step_order:
+        param = param_list[int(step) - 1] if int(step) - 1 < len(param_list) else ""
+        workflow.append((step, STEP_NAMES[step], param or DEFAULT_PARAMETERS.get(step, "")))
+    return workflow
+
+def _batches(stack):
+    for start in range(0, len(stack), BATCH_FRAMES):
+        yield slice(start, start + BATCH_FRAMES)
+
+def _shifted(array, axis, start, length):
+    index = [slice(None)] * array.ndim
+    index[axis] = slice(start, start + length)
+    return array[tuple(index)]
+
+# ----------------------------- 1: Gaussian blur -----------------------------
+def gaussian_kernel(sigma, accuracy=0.0002):
+    # Normalized 1-D kernel, reaching as far as ImageJ's (where the tail drops below `accuracy`)
+    radius = int(np.ceil(sigma * np.sqrt(-2 * np.log(accuracy)))) + 1
+    x = np.arange(-radius, radius + 1, dtype=np.float32)
+    kernel = np.exp(-x * x / (2 * sigma * sigma))
+    return kernel / kernel.sum()
+
+def gaussian_blur(stack, sigma=2.0, accuracy=0.0002):
+    # Separable blur in y and x of every frame; edge pixels are extended as in ImageJ.
+    # `stack` is float32 (frames, y, x[, channels]) and is blurred in place.
+    if sigma <= 0:
+        return stack
+    kernel = gaussian_kernel(sigma, accuracy)
+    radius = len(kernel) // 2
+    for batch in _batches(stack):
+        for axis in (1, 2):
+            frames = stack[batch]
+            pad = [(0, 0)] * frames.ndim
+            pad[axis] = (radius, radius)
+            padded = np.pad(frames, pad, mode="edge")
+            out = np.zeros_like(frames)
+            for tap, weight in enumerate(kernel):
+                out += weight * _shifted(padded, axis, tap, frames.shape[axis])
+            stack[batch] = out
+    return stack
+
+# ----------------------------- 2: Enhance contrast -----------------------------
+def contrast_range(stack, saturated=0.35, use_stack_histogram=False):
+    # Display range (low, high) that Enhance Contrast sets without "normalize": `saturated` %
+    # of the pixels of the first frame (or, with use_stack_histogram, the whole stack)
+    # fall outside it, half at each end. The pixel values are not changed.
+    low, high = np.percentile(stack if use_stack_histogram else stack[0], [saturated / 2, 100 - saturated / 2])
+    return float(low), float(high)
+
+def enhance_contrast(stack, saturated=0.35, use_stack_histogram=False, white=1.0):
+    # Enhance Contrast with "normalize": stretches each frame (or, with use_stack_histogram,
+    # the whole stack) so that `saturated` % of the pixels are clipped, half at each end,
+    # to the range 0..white.
+    low_pct, high_pct = saturated / 2, 100 - saturated / 2
+    if use_stack_histogram:
+        low, high = np.percentile(stack, [low_pct, high_pct])
+        ranges = [(low, high)] * len(stack)
+    else:
+        ranges = []
+        for batch in _batches(stack):
+            flat = stack[batch].reshape(len(stack[batch]), -1)
+            ranges.extend(zip(*np.percentile(flat, [low_pct, high_pct], axis=1)))
+    lows = np.array([r[0] for r in ranges], dtype=np.float32)
+    spans = np.array([r[1] - r[0] for r in ranges], dtype=np.float32)
+    spans[spans <= 0] = np.inf  # Flat frames become 0
+    shape = (-1,) + (1,) * (stack.ndim - 1)
+    for batch in _batches(stack):
+        frames = stack[batch]
+        frames -= lows[batch].reshape(shape)
+        frames *= white / spans[batch].reshape(shape)
+        np.clip(frames, 0, white, out=frames)
+    return stack
+
+# ----------------------------- 4: Z projection -----------------------------
+PROJECTIONS = {
+    "avg": lambda s: s.mean(axis=0, keepdims=True),
+    "max": lambda s: s.max(axis=0, keepdims=True),
+    "min": lambda s: s.min(axis=0, keepdims=True),
+    "sum": lambda s: s.sum(axis=0, keepdims=True),
+    "sd": lambda s: s.std(axis=0, ddof=1 if len(s) > 1 else 0, keepdims=True),
+    "median": lambda s: np.median(s, axis=0, keepdims=True),
+}
+# ImageJ's "Z Project..." names -> PROJECTIONS key
+_PROJECTION_NAMES = {"average": "avg", "max": "max", "min": "min", "sum": "sum", "standard": "sd", "median": "median"}
+
+def projection_method(arguments):
+    # "projection=[Max Intensity]" or "method=max" -> "max"; default "avg" (as 05_Final_Automatic.py)
+    name = str(arguments.get("projection") or arguments.get("method") or "avg").split()[0].lower()
+    return _PROJECTION_NAMES.get(name, name if name in PROJECTIONS else None) or "avg"
+
+def z_project(stack, method="avg"):
+    # One frame of shape (1, y, x[, channels])
+    return PROJECTIONS[method](stack).astype(np.float32)
+
+# ----------------------------- 6: Subtract background (rolling ball) -----------------------------
+def _shrink_factor(radius):
+    # Same steps as ImageJ: large balls roll over a shrunken image
+    return 1 if radius <= 10 else 2 if radius <= 30 else 4 if radius <= 100 else 8
+
+def _ball(radius):
+    # Offsets (dy, dx) inside the ball and the ball height at each
+    r = int(np.floor(radius))
+    dy, dx = np.mgrid[-r:r + 1, -r:r + 1]
+    inside = dy * dy + dx * dx <= radius * radius
+    heights = np.sqrt(radius * radius - dy[inside] ** 2 - dx[inside] ** 2).astype(np.float32)
+    return list(zip(dy[inside], dx[inside], heights)), r
+
+def _roll(frames, radius):
+    # Grayscale opening of every frame with the ball: the top of the ball rolled under the surface
+    offsets, r = _ball(radius)
+    h, w = frames.shape[1:3]
+    pad = [(0, 0), (r, r), (r, r)] + [(0, 0)] * (frames.ndim - 3)
+    padded = np.pad(frames, pad, constant_values=np.inf)  # Pixels outside the image never touch the ball
+    eroded = np.full_like(frames, np.inf)
+    for dy, dx, z in offsets:
+        np.minimum(eroded, padded[:, r + dy:r + dy + h, r + dx:r + dx + w] - z, out=eroded)
+    padded = np.pad(eroded, pad, constant_values=-np.inf)
+    opened = np.full_like(frames, -np.inf)
+    for dy, dx, z in offsets:
+        np.maximum(opened, padded[:, r + dy:r + dy + h, r + dx:r + dx + w] + z, out=opened)
+    return opened
+
+def _mean3x3(frames):
+    pad = [(0, 0), (1, 1), (1, 1)] + [(0, 0)] * (frames.ndim - 3)
+    padded = np.pad(frames, pad, mode="edge")
+    h, w = frames.shape[1:3]
+    return sum(padded[:, dy:dy + h, dx:dx + w] for dy in range(3) for dx in range(3)) / 9.0
+
+def rolling_ball_background(frames, radius=50.0, smooth=True):
+    # Background of each frame as in ImageJ's rolling ball: optional 3×3 mean, shrink by
+    # block minimum, roll a ball of radius/shrink, then interpolate back to full size
+    shrink = _shrink_factor(radius)
+    source = _mean3x3(frames) if smooth else frames
+    h, w = frames.shape[1:3]
+    if shrink > 1:
+        hs, ws = -(-h // shrink), -(-w // shrink)
+        pad = [(0, 0), (0, hs * shrink - h), (0, ws * shrink - w)] + [(0, 0)] * (frames.ndim - 3)
+        blocks = np.pad(source, pad, mode="edge")
+        blocks = blocks.reshape((len(frames), hs, shrink, ws, shrink) + frames.shape[3:])
+        source = blocks.min(axis=(2, 4))
+    background = _roll(source, radius / shrink)
+    if shrink == 1:
+        return background
+    # Bilinear interpolation between the centres of the shrunken blocks
+    ys = np.clip((np.arange(h) - (shrink - 1) / 2) / shrink, 0, background.shape[1] - 1)
+    xs = np.clip((np.arange(w) - (shrink - 1) / 2) / shrink, 0, background.shape[2] - 1)
+    y0, x0 = ys.astype(int), xs.astype(int)
+    y1, x1 = np.minimum(y0 + 1, background.shape[1] - 1), np.minimum(x0 + 1, background.shape[2] - 1)
+    wy = (ys - y0).astype(np.float32).reshape((1, -1, 1) + (1,) * (frames.ndim - 3))
+    wx = (xs - x0).astype(np.float32).reshape((1, 1, -1) + (1,) * (frames.ndim - 3))
+    top = background[:, y0][:, :, x0] * (1 - wx) + background[:, y0][:, :, x1] * wx
+    bottom = background[:, y1][:, :, x0] * (1 - wx) + background[:, y1][:, :, x1] * wx
+    return top * (1 - wy) + bottom * wy
+
+def subtract_background(stack, radius=50.0, light=False, create=False, smooth=True, white=0.0):
+    # Rolling-ball background subtraction of every frame, in place. With `light`, the
+    # background is brighter than the objects: the inverted image is processed and the
+    # result inverted back around `white` (the type's maximum for integer data, as ImageJ).
+    # With `create`, the background itself is kept.
+    for batch in _batches(stack):
+        frames = stack[batch]
+        background = rolling_ball_background(-frames if light else frames, radius, smooth)
+        if create:
+            stack[batch] = -background if light else background
+        else:
+            stack[batch] = white + frames + background if light else frames - background
+    return stack
+
+# ----------------------------- Run a workflow -----------------------------
+def _white(dtype):
+    return float(np.iinfo(dtype).max) if np.issubdtype(dtype, np.integer) else 1.0
+
+def run_step(stack, dtype, step, parameters, display_range=None):
+    # Applies one step code to the float32 stack. Returns (stack, output dtype, display range):
+    # projections other than max/min give 32-bit results, as in ImageJ. As in FIJI, Enhance
+    # Contrast only sets the display range unless its parameters contain "normalize"; the
+    # range is kept by later steps and reset by a projection, which is a new image.
+    arguments = parse_arguments(parameters)
+    if step == "1":
+        accuracy = 0.002 if dtype == np.uint8 else 0.0002  # ImageJ's accuracy per bit depth
+        return gaussian_blur(stack, float(arguments.get("sigma", 2)), accuracy), dtype, display_range
+    if step == "2":
+        saturated, use_stack_histogram = float(arguments.get("saturated", 0.35)), "use" in arguments
+        if "normalize" in arguments:
+            return enhance_contrast(stack, saturated, use_stack_histogram, _white(dtype)), dtype, None
+        return stack, dtype, contrast_range(stack, saturated, use_stack_histogram)
+    if step == "4":
+        method = projection_method(arguments)
+        return z_project(stack, method), dtype if method in ("max", "min") else np.dtype(np.float32), None
+    if step == "6":
+        white = _white(dtype) if np.issubdtype(dtype, np.integer) else 0.0
+        return subtract_background(stack, float(arguments.get("rolling", 50)), "light" in arguments,
+                                   "create" in arguments, "disable" not in arguments, white), dtype, display_range
+    raise ValueError(f"Step {step} ({STEP_NAMES.get(step)}) needs FIJI")
+
+def run_pipeline(stack, workflow, dtype=None, log=print, display_range=None):
+    # Runs [(code, name, parameters), ...] (see parse_workflow) on a (frames, y, x[, channels])
+    # array. Returns (float32 result, dtype to save it as, display range or None).
+    dtype = np.dtype(dtype or stack.dtype)
+    stack = np.array(stack, dtype=np.float32)
+    for step, name, parameters in workflow:
+        if step in FIJI_ONLY_STEPS:
+            log(f"{name}: interactive FIJI plugin, skipped")
+            continue
+        start = time.time()
+        stack, dtype, display_range = run_step(stack, dtype, step, parameters, display_range)
+        log(f"{name} ({parameters or 'default'}): {len(stack)} frame(s) in {time.time() - start:.2f} s")
+    return stack, dtype, display_range
+
+def to_dtype(stack, dtype):
+    # Rounds and clips integer results to the range of `dtype`
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        return np.clip(np.rint(stack), info.min, info.max).astype(dtype)
+    return stack.astype(dtype)
+
+# ----------------------------- Files -----------------------------
+def load_stack(source):
+    # (frames, y, x[, channels]) array of a folder of TIFFs or a multi-page TIFF (see
+    # stack_merge.open_source), plus the TIFF write options of its calibration
+    frames, handles = open_source(source)
+    try:
+        if not frames:
+            raise ValueError(f"No TIFF frames in {source}")
+        stack = _read_frames(frames)
+    finally:
+        close_source(handles)
+    return stack, read_calibration(source)
+
+def _read_frames(frames):
+    # Copies every frame into one array; the (memory-mapped) views die with this call
+    first = frames[0]()
+    stack = np.empty((len(frames),) + first.shape, dtype=first.dtype)
+    for i, read in enumerate(frames):
+        frame = first if i == 0 else read()
+        if frame.shape != first.shape:
+            raise ValueError(f"Frame {i + 1} is {frame.shape}, the first frame {first.shape}")
+        stack[i] = frame
+    return stack
+
+def _first_file(source):
+    # First frame's file of a folder (in the order of stack_merge.open_source), or the TIFF itself
+    source = Path(source)
+    if not source.is_dir():
+        return source
+    files = sorted(p for p in source.iterdir() if p.suffix.lower() in (".tif", ".tiff"))
+    return acquisition_sorted(files, load_timestamp_index(source))[0]
+
+def read_calibration(source):
+    # Resolution tags of the first input image (written by the extract scripts with CALIBRATE)
+    with tifffile.TiffFile(_first_file(source)) as tif:
+        tags = tif.pages[0].tags
+        if "XResolution" not in tags or "YResolution" not in tags:
+            return {}
+        x, y = tags["XResolution"].value, tags["YResolution"].value
+        unit = tags["ResolutionUnit"].value if "ResolutionUnit" in tags else 2
+        return {"resolution": (x[0] / x[1], y[0] / y[1]), "resolutionunit": unit}
+
+IMAGEJ_DTYPES = (np.uint8, np.uint16, np.float32)  # Types an ImageJ TIFF can hold
+
+def save_stack(path, stack, dtype, workflow, calibration=None, display_range=None):
+    # With a display range (see run_step), the stack is written as an ImageJ TIFF whose
+    # min=/max= entries FIJI applies on opening, and the pipeline text goes into its Info;
+    # ImageJ TIFFs over 4 GB stay classic (contiguous), which ImageJ reads.
+    data = to_dtype(stack, dtype)
+    description = "pipeline : " + " > ".join(f"{name} ({parameters})" for step, name, parameters in workflow
+                                             if step not in FIJI_ONLY_STEPS)
+    photometric = "rgb" if data.ndim == 4 else "minisblack"
+    if display_range is not None and data.dtype in IMAGEJ_DTYPES:
+        metadata = {"axes": "TYXS" if data.ndim == 4 else "TYX", "min": display_range[0], "max": display_range[1],
+                    "Info": description}
+        tifffile.imwrite(path, data, imagej=True, metadata=metadata, photometric=photometric, **(calibration or {}))
+    else:
+        tifffile.imwrite(path, data, bigtiff=needs_bigtiff(data.nbytes), description=description,
+                         photometric=photometric, **(calibration or {}))
+    return path
+
+def default_output_folder(source):
+    # "<folder>_pipeline" next to a folder of frames (inside it, the results would be read
+    # as frames on the next run), or the folder of a multi-page TIFF
+    source = Path(source)
+    return source.with_name(source.name + "_pipeline") if source.is_dir() else source.parent
+
+def run_folder(source, output_folder, step_text, parameter_text="", title=None, save_each_step=False, log=print):
+    # Loads `source`, runs the workflow and saves <title>_Final_Result.tif in `output_folder`
+    # (and <title>_<Step_Name>_<n>.tif after every step with save_each_step), like the FIJI
+    # script's "Save result" prompts answered with yes. The title defaults to the first
+    # frame's file name, as in 05_Final_Automatic.py. `output_folder` (created if needed)
+    # must not be the folder of frames itself, see default_output_folder.
+    # Returns the list of written files.
+    workflow = parse_workflow(step_text, parameter_text)
+    if not workflow:
+        raise ValueError(f"No valid steps in {step_text!r}")
+    output_folder = Path(output_folder)
+    if Path(source).is_dir() and output_folder.resolve() == Path(source).resolve():
+        raise ValueError(f"Results saved in {source} would be read as frames on the next run, "
+                         "choose another output folder")
+    output_folder.mkdir(parents=True, exist_ok=True)
+    stack, calibration = load_stack(source)
+    title = title or _first_file(source).stem
+    log(f"Loaded {len(stack)} frame(s) of {stack.shape[1:]} {stack.dtype} from {source}")
+
+    written = []
+    if save_each_step:
+        dtype, display_range = stack.dtype, None
+        for index, step in enumerate(workflow):
+            stack, dtype, display_range = run_pipeline(stack, [step], dtype, log, display_range)
+            if step[0] in FIJI_ONLY_STEPS:
+                continue
+            step_id = "{}_{}".format(step[1].replace(" ", "_"), index + 1)
+            written.append(save_stack(output_folder / f"{title}_{step_id}.tif", stack, dtype, workflow[:index + 1],
+                                      calibration, display_range))
+    else:
+        stack, dtype, display_range = run_pipeline(stack, workflow, log=log)
+    written.append(save_stack(output_folder / f"{title}_Final_Result.tif", stack, dtype, workflow, calibration,
+                              display_range))
+    return written
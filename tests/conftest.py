@@ -0,0 +1,36 @@
+import sys
+import numpy as np
+import pytest
+import tifffile
+from pathlib import Path
+
+# The modules are flat scripts next to this folder, not an installed package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+HEADER = ("cantilever-calibration-info.spring-constant : {spring}\n"
+          "cantilever-calibration-info.sensitivity : 12.3 nm/V\n"
+          "cantilever.name : 240AC-NA\n"
+          "start-time : {start}")
+
+def write_jpk(path, channels=("height", "amplitude"), shape=(48, 64), compression=None, bigtiff=False, byteorder="<",
+              spring="40.5 N/m", start="2024-01-02 10:11:12.345", scan_size=(2e-6, 1e-6), seed=0):
+    # Minimal JPK-like TIFF: a header IFD (tag 32830 text, scan size tags 32834/32835),
+    # then a trace and a retrace uint16 page per channel (tags 32850/32851)
+    rng = np.random.default_rng(seed)
+    pages = {}
+    with tifffile.TiffWriter(path, bigtiff=bigtiff, byteorder=byteorder) as tw:
+        tw.write(np.zeros((8, 8), np.uint8), extratags=[(32830, "s", 0, HEADER.format(spring=spring, start=start), True),
+                                                         (32834, "d", 1, scan_size[0], True),
+                                                         (32835, "d", 1, scan_size[1], True)])
+        for channel in channels:
+            for retrace in ("false", "true"):
+                data = rng.integers(0, 4000, shape, dtype=np.uint16)
+                pages[channel, retrace] = data
+                tw.write(data, compression=compression, rowsperstrip=4,
+                         extratags=[(32850, "s", 0, channel, True),
+                                    (32851, "s", 0, f"retrace : {retrace}\nchannel.name : {channel}", True)])
+    return pages
+
+@pytest.fixture
+def make_jpk():
+    return write_jpk
@@ -0,0 +1,44 @@
+import importlib
+import numpy as np
+import tifffile
+import jpk_extract
+
+compression_report = importlib.import_module("02_Compression_Report")
+
+def test_report_pages_are_copies_and_map_is_closed(tmp_path, make_jpk, monkeypatch):
+    jpk_path = tmp_path / "scan.jpk"
+    pages = make_jpk(jpk_path, channels=("height",), byteorder=">")
+    maps = []
+    map_file = jpk_extract.map_file
+    monkeypatch.setattr(jpk_extract, "map_file", lambda path: maps.append(map_file(path)) or maps[-1])
+    images = compression_report.load_pages(jpk_path)
+    assert len(images) == 3 and maps and all(file_map.closed for file_map in maps)
+    np.testing.assert_array_equal(images[1], pages["height", "false"])  # Still readable after the close
+
+def test_compression_options():
+    integer = np.zeros((32, 32), np.uint16)
+    floating = np.zeros((32, 32), np.float32)
+    assert jpk_extract.compression_options(integer) == {}
+    assert jpk_extract.compression_options(integer, predictor="horizontal", encode_threads=4) == {}
+    assert jpk_extract.compression_options(floating, "zlib", "floatingpoint") == {"compression": "zlib",
+                                                                                 "predictor": "floatingpoint"}
+    # The floating point predictor falls back to horizontal differencing for integer pages
+    assert jpk_extract.compression_options(integer, "zlib", "floatingpoint") == {"compression": "zlib",
+                                                                                "predictor": "horizontal"}
+    assert jpk_extract.compression_options(integer, "zlib", None, [16, 32], encode_threads=4) == {
+        "compression": "zlib", "maxworkers": 4, "tile": (16, 32)}
+    assert jpk_extract.compression_options(integer, tile=(16, 16)) == {"tile": (16, 16)}
+
+def test_compressed_extraction_is_lossless(tmp_path, make_jpk):
+    pages = make_jpk(tmp_path / "scan.jpk", channels=("height",))
+    results = jpk_extract.extract_jpk(tmp_path / "scan.jpk", tmp_path, channel_filter=["height"],
+                                      compression="zlib", predictor="floatingpoint", tile=(16, 16), encode_threads=2)
+    assert len(results) == 2
+    for item in results:
+        with tifffile.TiffFile(item["tif"]) as tif:
+            page = tif.pages[0]
+            assert page.compression == tifffile.COMPRESSION.ADOBE_DEFLATE
+            assert page.predictor == tifffile.PREDICTOR.HORIZONTAL
+            assert page.is_tiled and (page.tilelength, page.tilewidth) == (16, 16)
+            retrace = "true" if item["role"] == "retrace" else "false"
+            np.testing.assert_array_equal(page.asarray(), pages["height", retrace])
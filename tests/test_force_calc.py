@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+import fiji_units
+from force_calc import UNITS, DEFAULT_UNITS, to_si, compute_forces, add_forces, resolve_force_parameters
+
+def test_to_si():
+    numbers, problems = to_si(["0.1 N/m", "40", "2 pN/nm", "", "N/A", "abc", "3 kN/m", 5], "spring_constant")
+    np.testing.assert_allclose(numbers[[0, 1, 2, 7]], [0.1, 0.04, 2e-3, 5e-3])  # No unit: mN/m
+    assert np.isnan(numbers[3:7]).all()
+    assert problems[:3] == ["", "", ""]
+    assert problems[3:7] == ["missing spring constant", "missing spring constant",
+                             "spring constant not a number: 'abc'", "unknown spring constant unit 'kN/m'"]
+
+def test_to_si_setpoint():
+    numbers, problems = to_si(["20 %", "20%", "0.2"], "setpoint")
+    np.testing.assert_allclose(numbers, [0.2, 0.2, 0.2])
+
+def test_compute_forces():
+    forces = compute_forces(["40 N/m", "40 N/m"], ["10 nm/V", "10 nm/V"], ["0.5 V", ""], ["20 %", "20 %"])
+    np.testing.assert_allclose(forces["normal"][0], 40 * 0.5 * 10e-9)
+    np.testing.assert_allclose(forces["tapping"][0], 40 * 0.5 * 0.2)
+    assert np.isnan(forces["normal"][1]) and np.isnan(forces["tapping"][1])
+    assert forces["status"] == ["", "missing amplitude"]
+
+def test_add_forces():
+    parameters = ["spring-constant", "sensitivity", "reference-amplitude", "relative-setpoint"]
+    assert resolve_force_parameters(parameters) is not None
+    assert resolve_force_parameters(parameters[:3]) is None
+    rows = [{"spring-constant": "40 N/m", "sensitivity": "10 nm/V", "reference-amplitude": "0.5 V",
+             "relative-setpoint": "20 %"} for _ in range(3)]
+    out = list(add_forces(rows, parameters, batch_size=2))
+    assert len(out) == 3
+    assert out[2]["normal-force"] == "2.000000e-07 N" and out[2]["force-status"] == "ok"
+    assert list(add_forces([{}], parameters[:3]))[0]["force-status"] == "inputs not extracted"
+
+def test_fiji_unit_tables_match():
+    # fiji_units.py is the Jython copy of UNITS/DEFAULT_UNITS used by the FIJI legend scripts
+    for quantity, table in (("spring_constant", fiji_units.SPRING_UNITS), ("sensitivity", fiji_units.SENSITIVITY_UNITS),
+                            ("amplitude", fiji_units.AMPLITUDE_UNITS), ("setpoint", fiji_units.SETPOINT_UNITS)):
+        jython = dict(table)
+        default = jython.pop("")  # Factor of a value without a unit
+        assert jython == UNITS[quantity]
+        assert default == (UNITS[quantity][DEFAULT_UNITS[quantity]] if DEFAULT_UNITS[quantity] else 1.0)
+
+def test_fiji_to_si():
+    problems = []
+    assert fiji_units.to_si("20%", fiji_units.SETPOINT_UNITS, "setpoint", problems) == pytest.approx(0.2)
+    assert fiji_units.to_si("40", fiji_units.SPRING_UNITS, "spring constant", problems) == pytest.approx(0.04)
+    assert fiji_units.to_si("3 kN/m", fiji_units.SPRING_UNITS, "spring constant", problems) is None
+    assert fiji_units.to_si("N/A", fiji_units.AMPLITUDE_UNITS, "amplitude", problems) is None
+    assert problems == ["unknown spring constant unit kN/m", "missing amplitude"]
@@ -0,0 +1,176 @@
+import os
+import tifffile
+import numpy as np
+import pytest
+from jpk_extract import (extract_jpk, extract_folder, extract_readable_metadata, extract_all_ascii_strings,
+                         needs_bigtiff, mapped_file, read_page, FRAME_LIST_SUFFIX)
+
+@pytest.mark.parametrize("compression, byteorder", [("zlib", "<"), (None, ">")])
+def test_parallel_page_extraction(tmp_path, make_jpk, compression, byteorder):
+    # Several threads decode pages of one TiffFile (compressed pages are not memory-mapped);
+    # their seeks and reads must not interleave
+    jpk_path = tmp_path / "scan 01.jpk"
+    channels = ("height", "amplitude", "phase", "error", "deflection", "adhesion", "stiffness", "slope")
+    pages = make_jpk(jpk_path, channels=channels, shape=(1024, 1024), compression=compression, byteorder=byteorder)
+    for _ in range(5):
+        results = extract_jpk(jpk_path, tmp_path, page_threads=4, channel_filter=list(channels))
+        assert len(results) == 16
+        for item in results:
+            retrace = "true" if item["role"] == "retrace" else "false"
+            np.testing.assert_array_equal(tifffile.imread(item["tif"]), pages[item["channel"], retrace])
+
+def test_big_endian_pages_are_mapped(tmp_path, make_jpk):
+    jpk_path = tmp_path / "scan.jpk"
+    pages = make_jpk(jpk_path, channels=("height",), byteorder=">")
+    expected = pages["height", "false"]
+    with mapped_file(jpk_path) as file_map, tifffile.TiffFile(jpk_path) as tif:
+        view = read_page(tif.pages[1], file_map)
+        assert view.dtype == np.dtype(">u2") and not view.flags.owndata  # A view, not a decoded copy
+        np.testing.assert_array_equal(view, expected)
+        assert view.mean() == expected.mean()
+        tifffile.imwrite(tmp_path / "out.tif", view)
+        del view
+    np.testing.assert_array_equal(tifffile.imread(tmp_path / "out.tif"), expected)
+
+def test_metadata_modes_read_tags_only(tmp_path, make_jpk, monkeypatch):
+    jpk_path = tmp_path / "scan.jpk"
+    make_jpk(jpk_path)
+    monkeypatch.setattr(tifffile.TiffPage, "asarray", lambda *a, **k: pytest.fail("image data decoded"))
+    readable = extract_readable_metadata(jpk_path)
+    assert "cantilever-calibration-info.spring-constant : 40.5 N/m" in readable.splitlines()
+    assert "retrace : true" in readable.splitlines()
+    assert "cantilever.name : 240AC-NA" in extract_all_ascii_strings(jpk_path).splitlines()
+
+def test_stack_layout_writes_classic_tiff(tmp_path, make_jpk):
+    pages = {name: make_jpk(tmp_path / f"{name}.jpk", channels=("height",), seed=i)
+             for i, name in enumerate(["scan 01", "scan 02", "scan 03"])}
+    extract_folder(tmp_path, output_layout="stack", channel_filter=["height:trace"])
+    stack_path = tmp_path / "TIFF_height_trace" / "stack" / "TIFF_height_trace_stack.tif"
+    with tifffile.TiffFile(stack_path) as tif:
+        assert not tif.is_bigtiff  # ImageJ's native opener cannot read BigTIFF
+        frames = [page.asarray() for page in tif.pages]
+        assert tif.pages[1].description.startswith("source-file : scan_02_height_trace\n")
+    for frame, name in zip(frames, pages):
+        np.testing.assert_array_equal(frame, pages[name]["height", "false"])
+    frame_list = stack_path.with_name("TIFF_height_trace_stack" + FRAME_LIST_SUFFIX).read_text().split()
+    assert frame_list == ["scan_01_height_trace", "scan_02_height_trace", "scan_03_height_trace"]
+
+def test_needs_bigtiff():
+    assert not needs_bigtiff(2 ** 31)
+    assert needs_bigtiff(2 ** 32)
+
+def _stack_sources(folder):
+    stack_path = folder / "TIFF_height_trace" / "stack" / "TIFF_height_trace_stack.tif"
+    with tifffile.TiffFile(stack_path) as tif:
+        return [page.description.split("\n", 1)[0].split(" : ")[1] for page in tif.pages]
+
+def test_manifest_stack_changed_file_is_not_appended_twice(tmp_path, make_jpk):
+    for i in range(3):
+        make_jpk(tmp_path / f"scan {i}.jpk", channels=("height",), seed=i)
+    options = {"output_layout": "stack", "channel_filter": ["height:trace"], "use_manifest": True}
+    extract_folder(tmp_path, **options)
+    assert _stack_sources(tmp_path) == ["scan_0_height_trace", "scan_1_height_trace", "scan_2_height_trace"]
+
+    # Re-extracting a changed file rebuilds the stacks, also when appending (watch folder)
+    pages = make_jpk(tmp_path / "scan 1.jpk", channels=("height",), seed=7)
+    os.utime(tmp_path / "scan 1.jpk", ns=(0, 10 ** 9))
+    extract_folder(tmp_path, jpk_files=[tmp_path / "scan 1.jpk"], append=True, **options)
+    assert _stack_sources(tmp_path) == ["scan_0_height_trace", "scan_1_height_trace", "scan_2_height_trace"]
+    stack_path = tmp_path / "TIFF_height_trace" / "stack" / "TIFF_height_trace_stack.tif"
+    np.testing.assert_array_equal(tifffile.imread(stack_path, key=1), pages["height", "false"])
+
+    # New files are appended with `append`
+    make_jpk(tmp_path / "scan 3.jpk", channels=("height",), seed=3)
+    extract_folder(tmp_path, jpk_files=[tmp_path / "scan 3.jpk"], append=True, **options)
+    assert _stack_sources(tmp_path)[-1] == "scan_3_height_trace" and len(_stack_sources(tmp_path)) == 4
+
+def test_manifest_stack_failing_file_does_not_rebuild(tmp_path, make_jpk, capsys):
+    for i in range(2):
+        make_jpk(tmp_path / f"scan {i}.jpk", channels=("height",), seed=i)
+    (tmp_path / "broken.jpk").write_bytes(b"not a tiff")
+    options = {"output_layout": "stack", "channel_filter": ["height:trace"], "use_manifest": True}
+    extract_folder(tmp_path, **options)
+    stack_path = tmp_path / "TIFF_height_trace" / "stack" / "TIFF_height_trace_stack.tif"
+    mtime = stack_path.stat().st_mtime_ns
+    capsys.readouterr()
+
+    extract_folder(tmp_path, **options)
+    out = capsys.readouterr().out
+    assert "2 file(s) already extracted with these settings, 1 to process" in out
+    assert "rebuilt" not in out
+    assert stack_path.stat().st_mtime_ns == mtime  # Only the failing file was retried, nothing appended
+    assert _stack_sources(tmp_path) == ["scan_0_height_trace", "scan_1_height_trace"]
+
+def test_file_map_is_closed(tmp_path, make_jpk, monkeypatch):
+    import jpk_extract
+    jpk_path = tmp_path / "scan.jpk"
+    pages = make_jpk(jpk_path, channels=("height",))
+    maps = []
+    map_file = jpk_extract.map_file
+    monkeypatch.setattr(jpk_extract, "map_file", lambda path: maps.append(map_file(path)) or maps[-1])
+    results = extract_jpk(jpk_path, tmp_path, output_layout="stack", return_raw=True, channel_filter=["height"])
+    assert len(maps) == 1 and maps[0].closed
+    for item in results:
+        # Returned frames are copies that stay valid after the map is closed
+        retrace = "true" if item["role"] == "retrace" else "false"
+        np.testing.assert_array_equal(item["frame"][0], pages["height", retrace])
+        np.testing.assert_array_equal(item["raw"], pages["height", retrace])
+
+@pytest.mark.parametrize("output_layout", ["files", "stack"])
+def test_calibration_matches_scan_size(tmp_path, make_jpk, output_layout):
+    # 64 x 48 pixels over 2 x 1 µm: 320000 px/cm across, 480000 px/cm down
+    make_jpk(tmp_path / "scan.jpk", channels=("height",), shape=(48, 64), scan_size=(2e-6, 1e-6))
+    extract_folder(tmp_path, calibrate=True, output_layout=output_layout, channel_filter=["height:trace"])
+    folder = tmp_path / "TIFF_height_trace"
+    tif_path = folder / ("stack/TIFF_height_trace_stack.tif" if output_layout == "stack" else "images/scan_height_trace.tif")
+    with tifffile.TiffFile(tif_path) as tif:
+        tags = tif.pages[0].tags
+        assert tags["ResolutionUnit"].value == tifffile.RESUNIT.CENTIMETER
+        assert tags["XResolution"].value[0] / tags["XResolution"].value[1] == pytest.approx(64 / (2e-6 * 100))
+        assert tags["YResolution"].value[0] / tags["YResolution"].value[1] == pytest.approx(48 / (1e-6 * 100))
+        description = tif.pages[0].description
+    text = (folder / "metadata" / "scan_height_trace_metadata.txt").read_text(encoding="utf-8")
+    for info in (description, text):
+        calibration = info.split("--- CALIBRATION ---\n")[1]
+        assert "x_scan_length = 2e-06\ny_scan_length = 1e-06\n" in calibration
+        assert f"x_pixel_size = {2e-6 / 64!r}\ny_pixel_size = {1e-6 / 48!r}\nunit = m" in calibration
+
+def test_no_calibration_by_default(tmp_path, make_jpk):
+    make_jpk(tmp_path / "scan.jpk", channels=("height",))
+    results = extract_jpk(tmp_path / "scan.jpk", tmp_path, channel_filter=["height:trace"])
+    with tifffile.TiffFile(results[0]["tif"]) as tif:
+        assert tif.pages[0].tags["ResolutionUnit"].value == tifffile.RESUNIT.NONE
+        assert "--- CALIBRATION ---" not in tif.pages[0].description
+
+def _write_palette_jpk(path, shape=(24, 32)):
+    # JPK with one palette (indexed colour) page, as written for e.g. overlay channels
+    rng = np.random.default_rng(0)
+    indices = rng.integers(0, 256, shape, dtype=np.uint8)
+    colormap = rng.integers(0, 65536, (3, 256), dtype=np.uint16)
+    with tifffile.TiffWriter(path) as tw:
+        tw.write(np.zeros((8, 8), np.uint8), extratags=[(32830, "s", 0, "start-time : 2024-01-02 10:11:12.345", True)])
+        tw.write(indices, photometric="palette", colormap=colormap,
+                 extratags=[(32850, "s", 0, "overlay", True),
+                            (32851, "s", 0, "retrace : false\nchannel.name : overlay", True)])
+    return indices, colormap
+
+@pytest.mark.parametrize("output_layout", ["files", "stack"])
+def test_indexed_palette_keeps_colormap(tmp_path, output_layout):
+    indices, colormap = _write_palette_jpk(tmp_path / "scan.jpk")
+    extract_folder(tmp_path, palette_mode="indexed", output_layout=output_layout, channel_filter=["overlay"])
+    folder = tmp_path / "TIFF_overlay_trace"
+    tif_path = folder / ("stack/TIFF_overlay_trace_stack.tif" if output_layout == "stack" else "images/scan_overlay_trace.tif")
+    with tifffile.TiffFile(tif_path) as tif:
+        page = tif.pages[0]
+        assert page.photometric == tifffile.PHOTOMETRIC.PALETTE
+        np.testing.assert_array_equal(page.colormap, colormap)
+        np.testing.assert_array_equal(page.asarray(), indices)
+
+def test_rgb_palette_expansion(tmp_path):
+    indices, colormap = _write_palette_jpk(tmp_path / "scan.jpk")
+    results = extract_jpk(tmp_path / "scan.jpk", tmp_path, channel_filter=["overlay"])
+    rgb = tifffile.imread(results[0]["tif"])
+    assert rgb.shape == (*indices.shape, 3) and rgb.dtype == np.uint8
+    # Every pixel is its colormap entry reduced to 8 bits (high byte of the uint16 value)
+    np.testing.assert_array_equal(rgb, (colormap >> 8).T.astype(np.uint8)[indices])
+    np.testing.assert_array_equal(rgb[0, 0], [colormap[c, indices[0, 0]] // 256 for c in range(3)])
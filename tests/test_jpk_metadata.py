@@ -0,0 +1,33 @@
+import pytest
+from jpk_metadata import parse_property_value, parse_properties, read_jpk_metadata, namespace
+from jpk_extract import parse_retrace_value
+
+@pytest.mark.parametrize("text, expected", [
+    ("true", True), ("False", False), ("42", 42), ("-7", -7), ("0.25", 0.25), ("1e-9", 1e-9), (".5", 0.5),
+    ("1_000", "1_000"), ("nan", "nan"), ("NaN", "NaN"), ("Infinity", "Infinity"), ("inf", "inf"),
+    ("0x10", "0x10"), ("40.5 N/m", "40.5 N/m"), ("240AC-NA", "240AC-NA"),
+])
+def test_parse_property_value(text, expected):
+    value = parse_property_value(text)
+    assert value == expected and type(value) is type(expected)
+
+def test_parse_properties_first_key_wins():
+    properties = parse_properties("a.b : 1\nc : text\na.b : 2")
+    assert properties == {"a.b": 1, "c": "text"}
+    assert namespace({"x.y": 1, "x.z": 2, "w": 3}, "x") == {"y": 1, "z": 2}
+
+@pytest.mark.parametrize("meta, expected", [
+    ("retrace : true\nchannel.name : height", True),
+    (b"retrace : false\x00garbage", False),
+    (b"channel.name : height", None),
+    ("", None),
+])
+def test_parse_retrace_value(meta, expected):
+    assert parse_retrace_value(meta) is expected
+
+def test_read_jpk_metadata(tmp_path, make_jpk):
+    make_jpk(tmp_path / "scan.jpk", channels=("height",))
+    metadata = read_jpk_metadata(tmp_path / "scan.jpk")
+    assert metadata["header"]["cantilever-calibration-info.spring-constant"] == "40.5 N/m"
+    assert metadata["header_tags"][32834] == 2e-6
+    assert [(page["channel"], page["retrace"]) for page in metadata["pages"]] == [("height", False), ("height", True)]
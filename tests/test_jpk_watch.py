@@ -0,0 +1,63 @@
+import pytest
+import jpk_extract
+import jpk_watch
+from jpk_watch import watch_folder
+from extract_settings import extract_options
+
+OPTIONS = {"poll_seconds": 0, "stable_seconds": 0, "export_seconds": 0, "channel_filter": ["height:trace"],
+           "parameters": ["cantilever-calibration-info.spring-constant"]}
+
+@pytest.mark.parametrize("num_workers", [1, 2])
+def test_watch_ingests_completed_files(tmp_path, make_jpk, num_workers):
+    for i in range(2):
+        make_jpk(tmp_path / f"scan {i}.jpk", channels=("height",), seed=i)
+    # First poll sees the files, the second finds them unchanged and ingests them
+    done = watch_folder(tmp_path, max_polls=2, num_workers=num_workers, **OPTIONS)
+    assert sorted(done) == ["scan 0.jpk", "scan 1.jpk"]
+    assert (tmp_path / "TIFF_height_trace" / "images" / "scan_1_height_trace.tif").is_file()
+    table = (tmp_path / "Parameters.csv").read_text().splitlines()
+    assert len(table) == 3 and "40.5" in table[1]
+
+def test_watch_accepts_shared_extract_settings(tmp_path, make_jpk):
+    # As 02_Watch_Folder.py: the settings of the extract scripts, use_manifest included
+    make_jpk(tmp_path / "scan.jpk", channels=("height",))
+    options = extract_options(num_workers=1, use_manifest=False, channel_filter=["height:trace"])
+    done = watch_folder(tmp_path, max_polls=2, poll_seconds=0, stable_seconds=0, export_seconds=0,
+                        parameters=OPTIONS["parameters"], **options)
+    assert list(done) == ["scan.jpk"]
+    assert (tmp_path / "Extraction_manifest.sqlite").is_file()
+    assert (tmp_path / "Metadata_search.sqlite").is_file() and (tmp_path / "Timestamp_index.csv").is_file()
+
+def test_watch_retries_failed_files(tmp_path, make_jpk, monkeypatch):
+    make_jpk(tmp_path / "scan.jpk", channels=("height",))
+    extract_jpk = jpk_extract.extract_jpk
+    calls = []
+
+    def fail_once(*args, **kwargs):
+        calls.append(args[0])
+        if len(calls) == 1:
+            raise OSError("disk full")
+        return extract_jpk(*args, **kwargs)
+
+    monkeypatch.setattr(jpk_extract, "extract_jpk", fail_once)
+    # The failed file is not marked done; with retry_seconds=0 it is picked up on the next poll
+    done = watch_folder(tmp_path, max_polls=3, retry_seconds=0, **OPTIONS)
+    assert list(done) == ["scan.jpk"] and len(calls) == 2
+
+def test_failed_file_waits_for_retry(tmp_path, make_jpk, monkeypatch):
+    make_jpk(tmp_path / "scan.jpk", channels=("height",))
+    calls = []
+    monkeypatch.setattr(jpk_watch, "ingest", lambda folder_path, ready, *args, **kwargs: calls.append(ready) or [])
+    done = watch_folder(tmp_path, max_polls=5, retry_seconds=3600, **OPTIONS)
+    assert done == {} and len(calls) == 1
+
+def test_exported_tables_keep_subfolder_paths(tmp_path):
+    # Files of different subfolders may share a name; each keeps its own row
+    con = jpk_watch.parameter_index.open_index(tmp_path / jpk_watch.parameter_index.INDEX_FILENAME)
+    for rel, spring in (("s0.jpk", "1 N/m"), ("sub/s0.jpk", "2 N/m")):
+        jpk_watch.parameter_index.store_row(con, rel, 1, 1, ["spring-constant"], {"spring-constant": spring})
+    con.commit()
+    con.close()
+    jpk_watch.export_tables(tmp_path, ["spring-constant"])
+    table = (tmp_path / "Parameters.csv").read_text().splitlines()
+    assert table[1:] == ["s0.jpk,1.0,N/m", "sub/s0.jpk,2.0,N/m"]
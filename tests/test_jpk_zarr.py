@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from jpk_extract import extract_folder
+from jpk_zarr import ZARR_STORE_NAME, iter_frames, open_store
+
+def _frames(store_path, channel, role):
+    return {name: frame for name, frame in iter_frames(store_path, channel, role)}
+
+def test_zarr_write_append_and_overwrite(tmp_path, make_jpk):
+    store_path = tmp_path / ZARR_STORE_NAME
+    pages = {f"scan_{i}": make_jpk(tmp_path / f"scan_{i}.jpk", seed=i) for i in range(2)}
+    extract_folder(tmp_path, export_zarr=True)
+    meta, attrs = open_store(store_path)
+    assert attrs["files"] == ["scan_0", "scan_1"] and meta["shape"] == [2, 2, 2, 48, 64]
+    for channel in ("height", "amplitude"):
+        for role, retrace in (("trace", "false"), ("retrace", "true")):
+            frames = _frames(store_path, channel, role)
+            assert list(frames) == ["scan_0", "scan_1"]
+            for name, frame in frames.items():
+                np.testing.assert_array_equal(frame, pages[name][channel, retrace])
+
+    # A new file is appended after the existing ones
+    pages["scan_2"] = make_jpk(tmp_path / "scan_2.jpk", seed=2)
+    extract_folder(tmp_path, export_zarr=True, jpk_files=[tmp_path / "scan_2.jpk"], append=True)
+    meta, attrs = open_store(store_path)
+    assert attrs["files"] == ["scan_0", "scan_1", "scan_2"] and meta["shape"][0] == 3
+    frames = _frames(store_path, "height", "trace")
+    np.testing.assert_array_equal(frames["scan_2"], pages["scan_2"]["height", "false"])
+    np.testing.assert_array_equal(frames["scan_0"], pages["scan_0"]["height", "false"])
+
+    # A re-extracted file overwrites its own frames in place
+    pages["scan_0"] = make_jpk(tmp_path / "scan_0.jpk", seed=10)
+    extract_folder(tmp_path, export_zarr=True, jpk_files=[tmp_path / "scan_0.jpk"], append=True)
+    meta, attrs = open_store(store_path)
+    assert attrs["files"] == ["scan_0", "scan_1", "scan_2"] and meta["shape"][0] == 3
+    for role, retrace in (("trace", "false"), ("retrace", "true")):
+        frames = _frames(store_path, "amplitude", role)
+        for name, frame in frames.items():
+            np.testing.assert_array_equal(frame, pages[name]["amplitude", retrace])
+
+    # Plain zarr reads the same array
+    zarr = pytest.importorskip("zarr")
+    array = zarr.open(str(store_path), mode="r")
+    np.testing.assert_array_equal(array[1, attrs["channels"].index("height"), attrs["roles"].index("retrace")],
+                                  pages["scan_1"]["height", "true"])
+
+def test_zarr_skips_frames_of_another_shape(tmp_path, make_jpk, capsys):
+    store_path = tmp_path / ZARR_STORE_NAME
+    make_jpk(tmp_path / "scan_0.jpk", channels=("height",))
+    extract_folder(tmp_path, export_zarr=True)
+    make_jpk(tmp_path / "scan_1.jpk", channels=("height",), shape=(32, 32))
+    extract_folder(tmp_path, export_zarr=True, jpk_files=[tmp_path / "scan_1.jpk"], append=True)
+    assert "Not in channels.zarr (shape (32, 32)" in capsys.readouterr().out
+    assert list(_frames(store_path, "height", "trace")) == ["scan_0"]
@@ -0,0 +1,128 @@
+import numpy as np
+import tifffile
+from legend_render import make_glyph_cache, text_mask, burn_in, render_legends, legend_lines
+from jpk_extract import extract_folder
+
+def test_text_mask():
+    cache = make_glyph_cache(16)
+    mask = text_mask(cache, "Time: 12")
+    assert mask.shape[0] == cache["height"] and mask.dtype == np.float32
+    assert 0 <= mask.min() and mask.max() == 1.0
+    assert text_mask(cache, "Time: 12") is mask  # Whole lines are cached
+    assert text_mask(cache, "Time: 12345").shape[1] > mask.shape[1]
+    assert set(cache["glyphs"]) == set("Time: 12345")
+    assert not text_mask(cache, " ").any()
+
+def test_burn_in_gray():
+    cache = make_glyph_cache(12)
+    frame = np.full((60, 200), 1000, np.uint16)
+    out = burn_in(frame, ["Title: A", "Time: B"], cache, position=(5, 5), spacing=20, box_opacity=0.5)
+    assert (frame == 1000).all()  # The input is not modified
+    assert out.dtype == np.uint16
+    mask = text_mask(cache, "Title: A")
+    box = out[5:5 + mask.shape[0], 5:5 + mask.shape[1]]
+    assert box.max() == 65535  # Text is white: the type's maximum
+    assert box[mask == 0].max() == 500  # Background darkened by the box
+    assert (out[:, -20:] == 1000).all() and (out[-10:] == 1000).all()  # Outside the legend
+
+def test_burn_in_rgb_and_clipping():
+    cache = make_glyph_cache(12)
+    frame = np.zeros((10, 30, 3), np.uint8)  # Smaller than the legend: clipped, no error
+    out = burn_in(frame, ["A long legend line"], cache, position=(25, 5))
+    assert out.shape == frame.shape and out.max() > 0
+    assert (out[:, :25] == 0).all()
+    assert (out[..., 0] == out[..., 1]).all() and (out[..., 0] == out[..., 2]).all()  # White text on all channels
+
+def test_legend_lines():
+    rows = [{"file": f"{i}.tif", "time": f"2024-01-02 10:00:0{i}.000000", "spring_constant": "40 N/m",
+             "normal_force": "1e-9", "tapping_force": ""} for i in range(2)]
+    first, second = legend_lines(rows, ["Title", "Normal Force", "Tapping Force", "Elapsed Time"])
+    assert first == ["Title: 0.tif", "Normal Force: 1.00e-09 N", "Tapping Force: N/A", "Elapsed Time: 0.000 s"]
+    assert second[-1] == "Elapsed Time: 1.000 s"
+
+def test_render_legends_parallel(tmp_path, make_jpk):
+    for i in range(6):
+        make_jpk(tmp_path / f"scan {i}.jpk", channels=("height",), start=f"2024-01-02 10:00:0{i}.000", seed=i)
+    extract_folder(tmp_path, channel_filter=["height:trace"])
+    images = tmp_path / "TIFF_height_trace" / "images"
+    serial, parallel = tmp_path / "serial.tif", tmp_path / "parallel.tif"
+    assert render_legends(images, serial, font_size=8, num_threads=1) == 6
+    assert render_legends(images, parallel, font_size=8, num_threads=4) == 6
+    # Threads render out of order, frames are still written in order
+    with tifffile.TiffFile(serial) as a, tifffile.TiffFile(parallel) as b:
+        assert not b.is_bigtiff and len(b.pages) == 6
+        for page_a, page_b, i in zip(a.pages, b.pages, range(6)):
+            assert page_b.description.startswith(f"source-file : scan_{i}_height_trace\n")
+            np.testing.assert_array_equal(page_a.asarray(), page_b.asarray())
+    assert (images / "Legend_metadata.csv").is_file()
+    assert sorted(p.suffix for p in images.iterdir()).count(".tif") == 6  # Nothing written among the frames
+
+def test_legend_rows_of_old_schema_are_recomputed(tmp_path, make_jpk):
+    from legend_render import load_legend_rows, list_slices, LEGEND_TABLE_NAME
+    make_jpk(tmp_path / "scan.jpk", channels=("height",))
+    extract_folder(tmp_path, channel_filter=["height:trace"])
+    images = tmp_path / "TIFF_height_trace" / "images"
+    path = images / "scan_height_trace.tif"
+    st = path.stat()
+    # Written by an older version: same file stamp, a stale force and no schema/force_status
+    (images / LEGEND_TABLE_NAME).write_text(
+        "file,size,mtime,time,spring_constant,sensitivity,amplitude,setpoint,normal_force,tapping_force\n"
+        f"{path.name},{st.st_size},{int(st.st_mtime)},,,,,,1.0,1.0\n")
+    row, = load_legend_rows(images, list_slices(images, [path]))
+    assert row["spring_constant"] == "40.5 N/m" and row["normal_force"] == ""
+    assert row["force_status"] == "missing amplitude; missing setpoint"
+    assert (images / LEGEND_TABLE_NAME).read_text().splitlines()[0].startswith("file,schema,")
+
+def test_render_legends_of_a_stack(tmp_path, make_jpk):
+    # Stack layout: every page is a frame, named and described by its own source file
+    for i in range(3):
+        make_jpk(tmp_path / f"scan {i}.jpk", channels=("height",), start=f"2024-01-02 10:00:0{i}.000",
+                 spring=f"{i + 1}0 N/m", seed=i)
+    extract_folder(tmp_path, channel_filter=["height:trace"], output_layout="stack")
+    stack_folder = tmp_path / "TIFF_height_trace" / "stack"
+    output = tmp_path / "legend.tif"
+    assert render_legends(stack_folder, output, ["Title", "Spring Constant", "Elapsed Time"], font_size=8) == 3
+    with tifffile.TiffFile(output) as tif:
+        descriptions = [page.description.splitlines() for page in tif.pages]
+    for i, lines in enumerate(descriptions):
+        assert lines[:3] == [f"source-file : scan_{i}_height_trace", f"Title: scan_{i}_height_trace",
+                             f"Spring Constant: {i + 1}0 N/m"]
+    assert descriptions[2][3] == "Elapsed Time: 2.000 s"
+    table = (stack_folder / "Legend_metadata.csv").read_text().splitlines()
+    assert [line.split(",")[0] for line in table[1:]] == [f"scan_{i}_height_trace" for i in range(3)]
+
+def test_metadata_store_is_shared_and_resolved(tmp_path, make_jpk):
+    import ast
+    import os
+    import re
+    from pathlib import Path
+    from jpk_extract import METADATA_STORE_FOLDER
+    from legend_render import resolve_metadata_store
+    # Two scans with the same header share one stored copy; a third with another header gets its own
+    for i in range(2):
+        make_jpk(tmp_path / f"scan_{i}.jpk", channels=("height",), seed=i)
+    make_jpk(tmp_path / "scan_2.jpk", channels=("height",), spring="2.5 N/m")
+    extract_folder(tmp_path, metadata_storage="store", channel_filter=["height:trace"])
+    stored = sorted((tmp_path / METADATA_STORE_FOLDER).iterdir())
+    assert len(stored) == 2 and all(p.suffix == ".txt" for p in stored)
+
+    image_folder = tmp_path / "TIFF_height_trace" / "images"
+    info = tifffile.TiffFile(image_folder / "scan_0_height_trace.tif").pages[0].description
+    assert "40.5 N/m" not in info
+    ref = re.search(r"metadata-store : (.+)", info).group(1)
+    assert ref.startswith(f"../../{METADATA_STORE_FOLDER}/")
+    text = (image_folder / ref).resolve().read_text(encoding="utf-8")
+    assert "40.5 N/m" in text
+
+    cache = {}
+    assert resolve_metadata_store(info, image_folder, cache) == info + "\n" + text
+    assert list(cache.values()) == [text]
+    assert resolve_metadata_store("no reference", image_folder, cache) == "no reference"
+
+    # 04_Legand.py (Jython) resolves the same reference against the folder it runs in
+    script = (Path(__file__).resolve().parent.parent / "04_Legand.py").read_text(encoding="utf-8")
+    node = next(n for n in ast.parse(script).body
+                if isinstance(n, ast.FunctionDef) and n.name == "resolve_metadata_store")
+    namespace = {"re": re, "os": os, "folder_path": str(image_folder), "metadata_store_cache": {}}
+    exec(ast.get_source_segment(script, node), namespace)
+    assert namespace["resolve_metadata_store"](info) == info + "\n" + text
@@ -0,0 +1,44 @@
+import pytest
+from metadata_query import as_number, compile_query, parse_predicate, lookup
+
+PROPERTIES = {"cantilever.name": "240AC-NA", "cantilever-calibration-info.spring-constant": "40.5 N/m",
+              "relative-setpoint": "20 %", "start-time": "2024-05-03 10:00:00.000", "scan-count": 12,
+              "closed-loop": True}
+
+@pytest.mark.parametrize("value, number", [
+    ("0.1 N/m", 0.1), ("12.3 nm/V", 12.3), ("20 %", 20.0), ("1.5 kHz", 1.5), ("-4", -4.0), (12, 12.0),
+    ("240AC-NA", None), ("300 AC", None), ("5e", None), (True, None), ("fast", None),
+])
+def test_as_number(value, number):
+    assert as_number(value) == number
+
+@pytest.mark.parametrize("predicate, expected", [
+    ("name == 240AC-NA", True),
+    ("name == 240ac-na", True),
+    ("name == 240AC-XX", False),  # Not compared as the number 240
+    ("name != 240AC-XX", True),
+    ("name > 100", False),
+    ("spring-constant > 40", True),
+    ("spring-constant == 40.5", True),
+    ("spring-constant < 40", False),
+    ("relative-setpoint >= 20", True),
+    ("scan-count = 12", True),
+    ("closed-loop == true", True),
+    ("start-time >= 2024-05", True),
+    ("start-time < 2024-05", False),
+    ("name ~ ac-n", True),
+    ("missing-key", False),
+    ("missing-key != 1", True),
+])
+def test_compile_query(predicate, expected):
+    assert compile_query([predicate])(PROPERTIES) is expected
+
+def test_parse_predicate():
+    assert parse_predicate("spring-constant = 40") == ("spring-constant", "==", "40")
+    assert parse_predicate("  cantilever.name  ") == ("cantilever.name", None, None)
+    with pytest.raises(ValueError):
+        parse_predicate("spring constant > 40")
+
+def test_lookup_dotted_suffix():
+    assert lookup(PROPERTIES, "spring-constant") == "40.5 N/m"
+    assert lookup(PROPERTIES, "constant") is None
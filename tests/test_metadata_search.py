@@ -0,0 +1,64 @@
+import metadata_search
+from metadata_search import open_search_index, update_index, search, get_properties
+from jpk_extract import extract_folder
+
+def make_folder(folder, make_jpk):
+    make_jpk(folder / "scan a.jpk", spring="40.5 N/m", start="2024-05-03 10:00:00.000")
+    make_jpk(folder / "scan b.jpk", spring="0.1 N/m", start="2024-04-01 09:00:00.000")
+    (folder / "day 2").mkdir()
+    make_jpk(folder / "day 2" / "scan c.jpk", spring="41 N/m", start="2024-05-04 08:00:00.000")
+
+def test_search(tmp_path, make_jpk):
+    make_folder(tmp_path, make_jpk)
+    con = open_search_index(tmp_path / metadata_search.SEARCH_INDEX_FILENAME)
+    assert update_index(con, tmp_path) == (3, [])
+    assert update_index(con, tmp_path) == (0, [])  # Unchanged files are skipped
+    assert search(con, where=["spring-constant > 40"]) == ["day 2/scan c.jpk", "scan a.jpk"]
+    assert search(con, where=["spring-constant == 0.1"]) == ["scan b.jpk"]
+    assert search(con, where=["start-time >= 2024-05", "spring-constant < 41"]) == ["scan a.jpk"]
+    assert search(con, where=["cantilever.name == 240ac-na"]) == ["day 2/scan c.jpk", "scan a.jpk", "scan b.jpk"]
+    # A name starting with a number is not compared as that number
+    assert search(con, where=["cantilever.name == 240AC-XX"]) == []
+    assert search(con, where=["cantilever.name == 240"]) == []
+    assert search(con, text="240AC") == ["day 2/scan c.jpk", "scan a.jpk", "scan b.jpk"]
+    assert get_properties(con, "scan a.jpk", ["spring-constant"]) == {"spring-constant": "40.5 N/m"}
+    con.close()
+
+def test_old_index_numbers_are_recomputed(tmp_path, make_jpk):
+    make_jpk(tmp_path / "scan.jpk")
+    db_path = tmp_path / metadata_search.SEARCH_INDEX_FILENAME
+    con = open_search_index(db_path)
+    update_index(con, tmp_path)
+    # As written before SCHEMA_VERSION 2: "240AC-NA" stored as the number 240
+    con.execute("UPDATE properties SET number = 240 WHERE value = '240AC-NA'")
+    con.execute("PRAGMA user_version = 0")
+    con.commit()
+    con.close()
+    con = open_search_index(db_path)
+    assert search(con, where=["cantilever.name == 240"]) == []
+    assert search(con, where=["spring-constant == 40.5"]) == ["scan.jpk"]
+    con.close()
+
+def test_extract_keeps_subfolder_entries(tmp_path, make_jpk):
+    make_folder(tmp_path, make_jpk)
+    con = open_search_index(tmp_path / metadata_search.SEARCH_INDEX_FILENAME)
+    update_index(con, tmp_path)
+    con.close()
+    (tmp_path / "scan b.jpk").unlink()
+    extract_folder(tmp_path, index_metadata=True, channel_filter=["height:trace"])
+    con = open_search_index(tmp_path / metadata_search.SEARCH_INDEX_FILENAME)
+    # The top-level folder was extracted: the deleted file is dropped, the subfolder's file is kept
+    assert search(con) == ["day 2/scan c.jpk", "scan a.jpk"]
+    con.close()
+
+def test_benchmark_queries_run_on_a_synthetic_index(tmp_path):
+    import importlib
+    benchmark = importlib.import_module("02_Benchmark_Search")
+    con = benchmark.build_index(tmp_path / "index.sqlite", 60, 3, seed=1)
+    try:
+        results = benchmark.measure(con, repeats=1)
+    finally:
+        con.close()
+    assert [label for label, *_ in results] == [label for label, _, _ in benchmark.QUERIES]
+    matches = dict((label, count) for label, count, _, _ in results)
+    assert 0 < matches["exact text value"] < 60 and 0 < matches["date range"] < 60
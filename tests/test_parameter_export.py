@@ -0,0 +1,44 @@
+import csv
+import pytest
+from parameter_export import split_value_unit, plan_columns, typed_values, export_parameters
+
+@pytest.mark.parametrize("value, expected", [
+    ("0.1 N/m", (0.1, "N/m")),
+    ("12.3 nm/V", (12.3, "nm/V")),
+    ("-5e-3", (-0.005, "")),
+    ("20 %", (20.0, "%")),
+    ("20%", (20.0, "%")),
+    ("5 m^2", (5.0, "m^2")),
+])
+def test_split_value_unit(value, expected):
+    assert split_value_unit(value) == expected
+
+@pytest.mark.parametrize("value", ["240AC-NA", "300AC-A", "300 AC-A", "5e", "5nm", "NCHV-A", ""])
+def test_names_are_not_numbers(value):
+    assert split_value_unit(value) == (None, None)
+
+def test_cantilever_names_stay_text():
+    rows = [{"Filename": "a.jpk", "cantilever": "240AC-NA", "k": "0.1 N/m"},
+            {"Filename": "b.jpk", "cantilever": "300AC-A", "k": "40 N/m"}]
+    columns = plan_columns(["cantilever", "k"], rows)
+    assert columns == [("Filename", "Filename", "text"), ("cantilever", "cantilever", "text"),
+                       ("k", "k", "number"), ("k [unit]", "k", "unit")]
+    assert typed_values(rows[0], columns) == ["a.jpk", "240AC-NA", 0.1, "N/m"]
+
+def test_mixed_column_falls_back_to_text():
+    rows = [{"Filename": "a.jpk", "p": "5"}, {"Filename": "b.jpk", "p": "5e"}]
+    columns = plan_columns(["p"], rows)
+    assert columns[1] == ("p", "p", "text")
+    assert [typed_values(row, columns)[1] for row in rows] == ["5", "5e"]
+
+def test_empty_column_is_text():
+    # No value at all (e.g. a parameter no file has): text, not a column of float NaNs
+    rows = [{"Filename": "a.jpk", "p": ""}, {"Filename": "b.jpk"}]
+    assert plan_columns(["p"], rows)[1] == ("p", "p", "text")
+
+def test_export_csv(tmp_path):
+    rows = [{"Filename": "a.jpk", "cantilever": "240AC-NA", "k": "0.1 N/m"}]
+    written = export_parameters(tmp_path / "Parameters", ["cantilever", "k"], lambda: iter(rows), ["csv"])
+    assert written == [tmp_path / "Parameters.csv"]
+    with open(written[0], newline="", encoding="utf-8") as f:
+        assert list(csv.reader(f)) == [["Filename", "cantilever", "k", "k [unit]"], ["a.jpk", "240AC-NA", "0.1", "N/m"]]
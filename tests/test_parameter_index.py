@@ -0,0 +1,59 @@
+import os
+import parameter_index
+from jpk_metadata import read_jpk_header_text, compile_parameter_matcher
+
+def _scan(folder_path, con, parameters):
+    # The incremental scan of 01_Excel_Parameters.py: only stale files are parsed
+    files = {p.relative_to(folder_path).as_posix(): p for p in folder_path.glob("**/*.jpk")}
+    file_stats = {rel: (p.stat().st_size, p.stat().st_mtime_ns) for rel, p in files.items()}
+    removed = parameter_index.remove_missing(con, file_stats)
+    stale = sorted(parameter_index.find_stale(con, file_stats, parameters))
+    match_parameters = compile_parameter_matcher(parameters)
+    for rel in stale:
+        row = match_parameters(read_jpk_header_text(files[rel]))
+        parameter_index.store_row(con, rel, *file_stats[rel], parameters, row)
+    con.commit()
+    return stale, removed
+
+def test_only_stale_files_are_rescanned(tmp_path, make_jpk):
+    (tmp_path / "sub").mkdir()
+    for name in ("a.jpk", "b.jpk", "sub/c.jpk"):
+        make_jpk(tmp_path / name, channels=("height",))
+    parameters = ["spring-constant"]
+    con = parameter_index.open_index(tmp_path / parameter_index.INDEX_FILENAME)
+    try:
+        assert _scan(tmp_path, con, parameters) == (["a.jpk", "b.jpk", "sub/c.jpk"], 0)
+        assert _scan(tmp_path, con, parameters) == ([], 0)
+
+        # A rewritten file (new size or mtime) and a new file are the only ones parsed again
+        make_jpk(tmp_path / "b.jpk", channels=("height",), spring="2.5 N/m")
+        st = (tmp_path / "b.jpk").stat()
+        os.utime(tmp_path / "b.jpk", ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        make_jpk(tmp_path / "sub" / "d.jpk", channels=("height",))
+        (tmp_path / "a.jpk").unlink()
+        assert _scan(tmp_path, con, parameters) == (["b.jpk", "sub/d.jpk"], 1)
+        assert dict(parameter_index.iter_rows(con)) == {
+            "b.jpk": {"spring-constant": "2.5 N/m"},
+            "sub/c.jpk": {"spring-constant": "40.5 N/m"},
+            "sub/d.jpk": {"spring-constant": "40.5 N/m"},
+        }
+
+        # Another parameter list invalidates every row, even of unchanged files
+        parameters = ["spring-constant", "cantilever.name"]
+        assert _scan(tmp_path, con, parameters) == (["b.jpk", "sub/c.jpk", "sub/d.jpk"], 0)
+        assert all(row["cantilever.name"] == "240AC-NA" for _, row in parameter_index.iter_rows(con))
+        assert _scan(tmp_path, con, parameters) == ([], 0)
+    finally:
+        con.close()
+
+def test_index_survives_reopening(tmp_path, make_jpk):
+    make_jpk(tmp_path / "a.jpk", channels=("height",))
+    db_path = tmp_path / parameter_index.INDEX_FILENAME
+    con = parameter_index.open_index(db_path)
+    _scan(tmp_path, con, ["spring-constant"])
+    con.close()
+    con = parameter_index.open_index(db_path)
+    try:
+        assert _scan(tmp_path, con, ["spring-constant"]) == ([], 0)
+    finally:
+        con.close()
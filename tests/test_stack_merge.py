@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+import tifffile
+from stack_merge import cell_origins, fit_frame, common_dtype, merge_stacks
+
+def test_cell_origins_split():
+    assert cell_origins("split", 3, 10, 100) == (10, 100, [(0, 0, 10, 33), (0, 33, 10, 34), (0, 67, 10, 33)])
+
+def test_cell_origins_side_by_side():
+    assert cell_origins("side-by-side", 2, 10, 20, gap=4) == (10, 44, [(0, 0, 10, 20), (0, 24, 10, 20)])
+
+def test_cell_origins_grid():
+    height, width, cells = cell_origins("grid", 5, 10, 20, gap=2)
+    assert (height, width) == (2 * 10 + 2, 3 * 20 + 2 * 2)  # Square-ish: 3 columns, 2 rows
+    assert cells[3] == (12, 0, 10, 20) and cells[4] == (12, 22, 10, 20)
+    assert cell_origins("grid", 5, 10, 20, columns=1)[:2] == (50, 20)
+
+def test_fit_frame():
+    frame = np.arange(4 * 6).reshape(4, 6)
+    cropped = fit_frame(frame, 2, 3, "crop")
+    np.testing.assert_array_equal(cropped, frame[:2, :3])
+    assert np.shares_memory(cropped, frame)  # A view, not a copy
+    np.testing.assert_array_equal(fit_frame(frame, 2, 3, "resize"), frame[::2, ::2])
+    np.testing.assert_array_equal(fit_frame(frame, 8, 12, "pad"), frame)
+    rgb = np.zeros((4, 6, 3))
+    assert fit_frame(rgb, 2, 3, "resize").shape == (2, 3, 3)
+
+def test_common_dtype():
+    assert common_dtype([np.uint16, np.uint16]) == (np.uint16, [1, 1])
+    assert common_dtype([np.uint16, np.uint8]) == (np.uint16, [1, 257])
+    with pytest.raises(ValueError):
+        common_dtype([np.uint16, np.float32])
+
+def write_stack(path, frames, **kwargs):
+    with tifffile.TiffWriter(path) as tw:
+        for frame in frames:
+            tw.write(frame, **kwargs)
+
+@pytest.mark.parametrize("compression", [None, "zlib"])
+def test_merge_gray16_with_rgb8(tmp_path, compression):
+    gray = [np.full((8, 10), 1000 * (i + 1), np.uint16) for i in range(3)]
+    rgb = [np.full((8, 10, 3), 10 * (i + 1), np.uint8) for i in range(3)]
+    write_stack(tmp_path / "gray.tif", gray)
+    write_stack(tmp_path / "rgb.tif", rgb, photometric="rgb")
+    output_path = tmp_path / "merged.tif"
+    assert merge_stacks([tmp_path / "gray.tif", tmp_path / "rgb.tif"], output_path, "side-by-side",
+                        compression=compression) == 3
+    merged = tifffile.imread(output_path)  # Every frame, not only the first
+    assert merged.shape == (3, 8, 20, 3) and merged.dtype == np.uint16
+    for i in range(3):
+        assert (merged[i, :, :10] == 1000 * (i + 1)).all()  # Gray in all three channels
+        assert (merged[i, :, 10:] == 10 * (i + 1) * 257).all()  # 8-bit scaled to 16-bit
+    with tifffile.TiffFile(output_path) as tif:
+        assert not tif.is_bigtiff and len(tif.series) == 1
+
+def test_merge_folders_longest(tmp_path):
+    for name, count in (("a", 2), ("b", 3)):
+        (tmp_path / name).mkdir()
+        for i in range(count):
+            tifffile.imwrite(tmp_path / name / f"{i}.tif", np.full((4, 6), i + 1, np.uint16))
+    output_path = tmp_path / "merged.tif"
+    assert merge_stacks([tmp_path / "a", tmp_path / "b"], output_path, slice_mode="longest", fill_value=9) == 3
+    merged = tifffile.imread(output_path)
+    assert merged.shape == (3, 4, 6)
+    assert (merged[2, :, :3] == 9).all() and (merged[2, :, 3:] == 3).all()  # "split": left half from a
+
+def test_folder_with_multipage_files_keeps_every_page(tmp_path):
+    # A folder of extracted stacks: every page of every file is a frame, in file order
+    for name in ("a", "b"):
+        (tmp_path / name).mkdir()
+        write_stack(tmp_path / name / "0.tif", [np.full((4, 6), i + 1, np.uint16) for i in range(3)])
+        tifffile.imwrite(tmp_path / name / "1.tif", np.full((4, 6), 4, np.uint16))
+    output_path = tmp_path / "merged.tif"
+    assert merge_stacks([tmp_path / "a", tmp_path / "b"], output_path) == 4
+    assert tifffile.imread(output_path)[:, 0, 0].tolist() == [1, 2, 3, 4]
+
+def test_maps_are_closed(tmp_path, monkeypatch):
+    import stack_merge
+    maps = []
+    map_file = stack_merge.map_file
+    monkeypatch.setattr(stack_merge, "map_file", lambda path: maps.append(map_file(path)) or maps[-1])
+    for name in ("a", "b"):
+        write_stack(tmp_path / f"{name}.tif", [np.full((4, 6), i, np.uint16) for i in range(3)])
+    merge_stacks([tmp_path / "a.tif", tmp_path / "b.tif"], tmp_path / "merged.tif")
+    assert len(maps) == 2 and all(m.closed for m in maps)
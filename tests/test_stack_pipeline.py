@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+import tifffile
+from stack_pipeline import (load_stack, run_folder, default_output_folder, parse_arguments, parse_workflow,
+                            gaussian_kernel, gaussian_blur, enhance_contrast, projection_method,
+                            subtract_background, run_pipeline, to_dtype)
+
+def test_parse_arguments():
+    assert parse_arguments("sigma=2 stack") == {"sigma": "2", "stack": True}
+    assert parse_arguments("projection=[Max Intensity]") == {"projection": "Max Intensity"}
+    assert parse_arguments(None) == {}
+
+def test_parse_workflow_fills_defaults():
+    workflow = parse_workflow("3, 1,2,9,4", "sigma=1; ; ; ")
+    assert [step for step, _, _ in workflow] == ["3", "1", "2", "4"]  # Unknown code 9 is dropped
+    assert workflow[1] == ("1", "Gaussian Blur", "sigma=1")
+    assert workflow[2][2] == "saturated=0.35" and workflow[3][2] == "projection=[Average Intensity]"
+
+def test_gaussian_blur_keeps_flat_frames_and_mass():
+    kernel = gaussian_kernel(2.0)
+    assert kernel.sum() == pytest.approx(1.0) and kernel[len(kernel) // 2] == kernel.max()
+    flat = np.full((2, 9, 9), 5.0, np.float32)
+    assert np.allclose(gaussian_blur(flat, 2.0), 5.0)
+    spot = np.zeros((1, 21, 21), np.float32)
+    spot[0, 10, 10] = 1.0
+    blurred = gaussian_blur(spot, 1.0)
+    assert blurred.sum() == pytest.approx(1.0, abs=1e-4) and blurred[0, 10, 10] < 0.5
+
+def test_enhance_contrast_stretches_each_frame():
+    stack = np.stack([np.arange(100, dtype=np.float32).reshape(10, 10), np.full((10, 10), 3, np.float32)])
+    result = enhance_contrast(stack, saturated=0.0, white=255.0)
+    assert result[0].min() == 0 and result[0].max() == pytest.approx(255.0)
+    assert not result[1].any()  # A flat frame becomes 0
+
+def test_enhance_contrast_step_sets_display_range_only(tmp_path):
+    # As IJ.run(imp, "Enhance Contrast", "saturated=0.35"): pixels unchanged, range saved for FIJI
+    stack = np.stack([np.arange(100, dtype=np.uint16).reshape(10, 10) * (i + 1) for i in range(2)])
+    result, dtype, display_range = run_pipeline(stack, parse_workflow("2,1", "sigma=0; saturated=0"), log=lambda message: None)
+    np.testing.assert_array_equal(result, stack)
+    assert dtype == np.uint16 and display_range == (0.0, 99.0)  # From the first frame
+    assert run_pipeline(stack, parse_workflow("2", "; saturated=0 use"), log=lambda message: None)[2] == (0.0, 198.0)
+    assert run_pipeline(stack, parse_workflow("2,4"), log=lambda message: None)[2] is None  # A projection is a new image
+
+    result, _, display_range = run_pipeline(stack, parse_workflow("2", "; saturated=0 normalize"), log=lambda message: None)
+    assert display_range is None and result[1].max() == 65535.0  # Stretched to the type's range
+
+    folder = tmp_path / "images"
+    folder.mkdir()
+    for i, frame in enumerate(stack):
+        tifffile.imwrite(folder / f"scan_{i}.tif", frame)
+    written, = run_folder(folder, tmp_path / "out", "2", "; saturated=0", log=lambda message: None)
+    with tifffile.TiffFile(written) as tif:
+        assert tif.imagej_metadata["min"] == 0.0 and tif.imagej_metadata["max"] == 99.0
+        assert tif.imagej_metadata["Info"] == "pipeline : Enhance Contrast (saturated=0)"
+        np.testing.assert_array_equal(tif.asarray(), stack)
+
+def test_projection_method_names():
+    assert projection_method({"projection": "Max Intensity"}) == "max"
+    assert projection_method({"projection": "Standard Deviation"}) == "sd"
+    assert projection_method({"method": "median"}) == "median"
+    assert projection_method({}) == "avg" and projection_method({"projection": "Bogus"}) == "avg"
+
+def test_subtract_background_removes_a_flat_offset():
+    stack = np.full((1, 32, 32), 50.0, np.float32)
+    stack[0, 14:18, 14:18] += 100.0  # A small object on a flat background; the ball barely enters it
+    result = subtract_background(stack.copy(), radius=5.0, smooth=False)
+    assert np.allclose(result[0, :5, :5], 0.0) and result[0, 15, 15] == pytest.approx(100.0, abs=1.0)
+
+def test_run_pipeline_skips_fiji_steps_and_sets_dtype():
+    stack = np.stack([np.full((4, 4), v, np.uint16) for v in (10, 20, 40)])
+    messages = []
+    result, dtype, _ = run_pipeline(stack, parse_workflow("3,4", ";;;projection=[Max Intensity]"), log=messages.append)
+    assert "skipped" in messages[0] and dtype == np.uint16 and result.shape == (1, 4, 4) and result[0, 0, 0] == 40
+    result, dtype, _ = run_pipeline(stack, parse_workflow("4"), log=messages.append)
+    assert dtype == np.float32 and result[0, 0, 0] == pytest.approx(70 / 3)
+
+def test_to_dtype_rounds_and_clips():
+    values = np.array([-3.0, 1.6, 300.0], np.float32)
+    assert to_dtype(values, np.dtype(np.uint8)).tolist() == [0, 2, 255]
+    assert to_dtype(values, np.dtype(np.float32)).dtype == np.float32
+
+def test_load_stack_from_multipage_tiff(tmp_path):
+    with tifffile.TiffWriter(tmp_path / "stack.tif") as tw:
+        for i in range(3):
+            tw.write(np.full((4, 5), i, np.uint16), contiguous=False)
+    stack, _ = load_stack(tmp_path / "stack.tif")  # The memory map is closed after copying
+    assert stack.shape == (3, 4, 5) and list(stack[:, 0, 0]) == [0, 1, 2]
+
+def test_load_stack_from_folder_of_stacks(tmp_path):
+    with tifffile.TiffWriter(tmp_path / "a.tif") as tw:
+        for i in range(2):
+            tw.write(np.full((4, 5), i, np.uint16), contiguous=False)
+    tifffile.imwrite(tmp_path / "b.tif", np.full((4, 5), 7, np.uint16))
+    stack, _ = load_stack(tmp_path)
+    assert list(stack[:, 0, 0]) == [0, 1, 7]  # No page of a multi-page file is dropped
+
+def _frames_folder(tmp_path):
+    folder = tmp_path / "images"
+    folder.mkdir()
+    for i in range(3):
+        tifffile.imwrite(folder / f"scan_{i}.tif", np.full((8, 8), 100 * (i + 1), np.uint16))
+    return folder
+
+def test_rerun_reads_the_same_frames(tmp_path):
+    folder = _frames_folder(tmp_path)
+    output_folder = default_output_folder(folder)
+    assert output_folder == tmp_path / "images_pipeline"
+    for _ in range(2):
+        written = run_folder(folder, output_folder, "4", log=lambda message: None)  # Average projection
+        assert [p.name for p in written] == ["scan_0_Final_Result.tif"]
+        assert tifffile.imread(written[0]).squeeze().shape == (8, 8)
+        assert load_stack(folder)[0].shape == (3, 8, 8)  # Still 3 frames, not 4
+    assert tifffile.imread(written[0]).squeeze()[0, 0] == 200
+    with pytest.raises(ValueError):
+        run_folder(folder, folder, "4")
+
+def test_default_output_folder_of_a_stack(tmp_path):
+    assert default_output_folder(tmp_path / "stack.tif") == tmp_path
@@ -0,0 +1,57 @@
+from timestamp_index import (analyse_timing, parse_timestamp, read_timing, update_timestamp_index,
+                             load_timestamp_index, find_row, acquisition_sorted, elapsed_seconds)
+import fiji_timestamps
+
+def row(source, start, duration=""):
+    return {"source": source, "start_time": start, "duration_s": duration}
+
+def statuses(rows):
+    return {r["source"]: r["status"] for r in analyse_timing(rows)}
+
+def test_parse_timestamp():
+    assert str(parse_timestamp("start-time : 2024-01-02 10:11:12.345")) == "2024-01-02 10:11:12.345000"
+    assert str(parse_timestamp("2024-01-02T10:11:12:5")) == "2024-01-02 10:11:12.500000"  # JPK style fraction
+    assert parse_timestamp("no time") is None and parse_timestamp(None) is None
+
+def test_regular_series_is_ok():
+    rows = [row(f"{i}.jpk", f"2024-01-02 10:00:{10 * i:02d}.000", "8") for i in range(4)]
+    ordered = analyse_timing(rows)
+    assert [r["status"] for r in ordered] == ["ok"] * 4
+    assert [r["elapsed_s"] for r in ordered] == ["0.000", "10.000", "20.000", "30.000"]
+    assert [r["gap_s"] for r in ordered] == ["", "2.000", "2.000", "2.000"]
+
+def test_gap():
+    rows = [row(f"{i}.jpk", f"2024-01-02 10:00:{t:02d}.000") for i, t in enumerate([0, 10, 20, 55])]
+    assert statuses(rows)["3.jpk"] == "gap"  # 35 s > 2 × the median interval of 10 s
+
+def test_overlap_and_duplicate_time():
+    rows = [row("a.jpk", "2024-01-02 10:00:00.000", "15"), row("b.jpk", "2024-01-02 10:00:10.000", "5"),
+            row("c.jpk", "2024-01-02 10:00:10.000", "5")]
+    result = statuses(rows)
+    assert result["b.jpk"] == "overlap"  # Starts before a.jpk's 15 s scan is done
+    assert result["c.jpk"] == "duplicate time"
+
+def test_out_of_order_and_no_timestamp():
+    rows = [row("scan 1.jpk", "2024-01-02 10:00:10.000"), row("scan 2.jpk", "2024-01-02 10:00:00.000"),
+            row("scan 3.jpk", "2024-01-02 10:00:20.000"), row("scan 0.jpk", "")]
+    ordered = analyse_timing(rows)
+    assert [r["source"] for r in ordered] == ["scan 2.jpk", "scan 1.jpk", "scan 3.jpk", "scan 0.jpk"]
+    assert [r["order"] for r in ordered] == ["1", "2", "3", "4"]
+    assert statuses(rows) == {"scan 2.jpk": "out of order", "scan 1.jpk": "ok", "scan 3.jpk": "ok",
+                              "scan 0.jpk": "no timestamp"}
+
+def test_index_of_a_folder(tmp_path, make_jpk):
+    for name, start in (("scan 1", "2024-01-02 10:00:10.000"), ("scan 2", "2024-01-02 10:00:00.000")):
+        make_jpk(tmp_path / f"{name}.jpk", start=start)
+    assert read_timing(tmp_path / "scan 1.jpk")["lines"] == 48
+    files = sorted(tmp_path.glob("*.jpk"))
+    rows = update_timestamp_index(tmp_path, files, lambda stem: stem.replace(" ", "_"))
+    assert [r["source"] for r in rows] == ["scan 2.jpk", "scan 1.jpk"]
+    (tmp_path / "TIFF_height_trace" / "images").mkdir(parents=True)
+    index = load_timestamp_index(tmp_path / "TIFF_height_trace" / "images")  # Found two levels up
+    assert find_row(index, "scan_1_height_trace.tif")["order"] == "2"
+    outputs = ["scan_1_height_trace.tif", "scan_2_height_trace.tif", "other.tif"]
+    assert acquisition_sorted(outputs, index) == ["scan_2_height_trace.tif", "scan_1_height_trace.tif", "other.tif"]
+    assert elapsed_seconds(outputs[1::-1], index) == [0.0, 10.0]
+    # The FIJI helper orders the same way
+    assert fiji_timestamps.acquisition_order(outputs, index) == acquisition_sorted(outputs, index)
@@ -0,0 +1,231 @@
+import re
+import csv
+import statistics
+from pathlib import Path
+from datetime import datetime
+from jpk_metadata import read_tiff_ifds, parse_properties, JPK_CHANNEL_TAG
+from metadata_query import lookup
+
+# Acquisition-time index of an extraction folder: one row per JPK with its start time,
+# duration and scan rate, read from the TIFF tags only. Rows are kept in acquisition
+# order, so stack builders can order frames by when they were recorded instead of by
+# file name, and elapsed times are a lookup instead of reopening every image.
+# Stored as CSV so the FIJI (Jython) scripts can read it too.
+
+TIMESTAMP_INDEX_FILENAME = "Timestamp_index.csv"
+TIMESTAMP_COLUMNS = ["source", "stem", "size", "mtime_ns", "start_time", "end_time", "duration_s",
+                     "scan_rate_hz", "lines", "order", "elapsed_s", "gap_s", "status"]
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+# Where the timing is looked for: header properties first (dotted suffixes match),
+# then the JPK StartDate/EndDate/Scanrate tags of the first IFD
+START_TIME_KEYS = ("start-time", "start-date", "timestamp")
+END_TIME_KEYS = ("end-time", "end-date")
+SCAN_RATE_KEYS = ("scan-rate", "line-rate", "scanrate-frequency")  # Lines per second
+START_TIME_TAG = 32771
+END_TIME_TAG = 32774
+SCAN_RATE_TAG = 32840
+
+GAP_FACTOR = 2.0  # An interval longer than GAP_FACTOR × the median interval is reported as a gap
+
+# "2024-01-02 10:11:12.345", also with "T" or a ":" before the fraction (JPK style)
+_TIMESTAMP = re.compile(r"(\d{4}-\d{2}-\d{2})[ T](\d{2}:\d{2}:\d{2})(?:[.:](\d{1,6}))?")
+
+# ----------------------------- Timing of one JPK -----------------------------
+def parse_timestamp(value):
+    # First timestamp in a text (or None)
+    match = _TIMESTAMP.search(str(value)) if value is not None else None
+    if not match:
+        return None
+    date, clock, fraction = match.groups()
+    try:
+        return datetime.strptime(f"{date} {clock}.{(fraction or '0').ljust(6, '0')}", TIME_FORMAT)
+    except ValueError:
+        return None
+
+def _text(value):
+    if isinstance(value, bytes):
+        value = value.split(b"\x00", 1)[0].decode("ISO-8859-1")
+    return value if isinstance(value, str) else None
+
+def read_timing(file_path):
+    # {"start_time", "end_time" (datetime or None), "duration_s", "scan_rate_hz" (float or None),
+    #  "lines" (int or None)} from the header IFD and the first image page; no pixels are read.
+    # Without an end time, the duration is lines / scan rate.
+    ifds = read_tiff_ifds(file_path, max_ifds=2)
+    header = ifds[0] if ifds else {}
+    texts = [text for text in map(_text, header.values()) if text]
+    properties = {}
+    for text in texts:
+        for key, value in parse_properties(text).items():
+            properties.setdefault(key, value)
+
+    def find(keys, tag, parse):
+        for key in keys:
+            value = parse(lookup(properties, key))
+            if value is not None:
+                return value
+        return parse(_text(header.get(tag)) or header.get(tag))
+
+    start = find(START_TIME_KEYS, START_TIME_TAG, parse_timestamp)
+    if start is None:
+        start = next((t for t in map(parse_timestamp, texts) if t is not None), None)  # As 04_Legand.py
+    end = find(END_TIME_KEYS, END_TIME_TAG, parse_timestamp)
+    scan_rate = find(SCAN_RATE_KEYS, SCAN_RATE_TAG, _positive)
+    page = next((tags for tags in ifds if JPK_CHANNEL_TAG in tags), {})
+    lines = page.get(257)  # ImageLength of the first channel page
+    lines = int(lines[0] if isinstance(lines, tuple) else lines) if lines else None
+
+    duration = None
+    if start is not None and end is not None and end >= start:
+        duration = (end - start).total_seconds()
+    elif lines and scan_rate:
+        duration = lines / scan_rate
+    return {"start_time": start, "end_time": end, "duration_s": duration, "scan_rate_hz": scan_rate, "lines": lines}
+
+def _positive(value):
+    if isinstance(value, tuple):
+        value = value[0] if value else None
+    if isinstance(value, str):
+        match = re.match(r"\s*([-+\d.eE]+)", value)
+        value = match.group(1) if match else None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+# ----------------------------- Ordering, gaps and out-of-order files -----------------------------
+def _number(text):
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return None
+
+def analyse_timing(rows):
+    # Sorts `rows` (dicts with TIMESTAMP_COLUMNS as text) by acquisition time and fills in
+    # "order", "elapsed_s" (since the first frame), "gap_s" (idle time after the previous
+    # frame, negative = overlap) and "status": "ok", or any of "gap", "overlap",
+    # "duplicate time", "out of order" (recorded before a file that sorts earlier by name)
+    # and "no timestamp". Rows without a start time go last, in name order.
+    starts = {row["source"]: parse_timestamp(row["start_time"]) for row in rows}
+    problems = {row["source"]: [] for row in rows}
+
+    latest = None
+    for row in sorted(rows, key=lambda row: row["source"]):
+        start = starts[row["source"]]
+        if start is None:
+            continue
+        if latest is not None and start < latest:
+            problems[row["source"]].append("out of order")
+        latest = start if latest is None else max(latest, start)
+
+    timed = sorted((row for row in rows if starts[row["source"]]), key=lambda row: (starts[row["source"]], row["source"]))
+    untimed = sorted((row for row in rows if not starts[row["source"]]), key=lambda row: row["source"])
+    intervals = [(starts[b["source"]] - starts[a["source"]]).total_seconds() for a, b in zip(timed, timed[1:])]
+    typical = statistics.median(intervals) if intervals else 0
+
+    for i, row in enumerate(timed):
+        start = starts[row["source"]]
+        row["elapsed_s"] = f"{(start - starts[timed[0]['source']]).total_seconds():.3f}"
+        row["gap_s"] = ""
+        if i == 0:
+            continue
+        previous = timed[i - 1]
+        duration = _number(previous["duration_s"]) or 0.0
+        gap = (start - starts[previous["source"]]).total_seconds() - duration
+        row["gap_s"] = f"{gap:.3f}"
+        if intervals[i - 1] == 0:
+            problems[row["source"]].append("duplicate time")
+        elif duration and gap < 0:
+            problems[row["source"]].append("overlap")
+        if typical > 0 and intervals[i - 1] > GAP_FACTOR * typical:
+            problems[row["source"]].append("gap")
+    for row in untimed:
+        row["elapsed_s"] = row["gap_s"] = ""
+        problems[row["source"]].append("no timestamp")
+
+    ordered = timed + untimed
+    for order, row in enumerate(ordered, start=1):
+        row["order"] = str(order)
+        row["status"] = "; ".join(problems[row["source"]]) or "ok"
+    return ordered
+
+# ----------------------------- Build / update the index -----------------------------
+def _format(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.strftime(TIME_FORMAT)
+    return f"{value:.6g}" if isinstance(value, float) else str(value)
+
+def update_timestamp_index(folder_path, jpk_files, output_stem=lambda stem: stem, remove_missing=True):
+    # Adds new or changed `jpk_files` to folder_path/Timestamp_index.csv, reusing the rows of
+    # unchanged files (same size and mtime), and rewrites it in acquisition order.
+    # `output_stem` maps a JPK stem to the prefix of its output names (see jpk_extract.clean_name).
+    # With remove_missing, rows of files not in `jpk_files` are dropped. Returns the rows.
+    index_path = Path(folder_path) / TIMESTAMP_INDEX_FILENAME
+    cached = {}
+    if index_path.is_file():
+        with open(index_path, newline="", encoding="utf-8") as f:
+            cached = {row["source"]: row for row in csv.DictReader(f)}
+    rows = {} if remove_missing else dict(cached)
+
+    for path in jpk_files:
+        st = path.stat()
+        row = cached.get(path.name)
+        if row is None or (row["size"], row["mtime_ns"]) != (str(st.st_size), str(st.st_mtime_ns)):
+            try:
+                timing = read_timing(path)
+            except (OSError, ValueError) as e:
+                print(f"No timing for {path.name}: {e}")
+                timing = {}
+            row = {"source": path.name, "stem": output_stem(path.stem), "size": str(st.st_size),
+                   "mtime_ns": str(st.st_mtime_ns)}
+            row.update({key: _format(timing.get(key)) for key in ("start_time", "end_time", "duration_s",
+                                                                   "scan_rate_hz", "lines")})
+        rows[path.name] = row
+
+    ordered = analyse_timing(list(rows.values()))
+    with open(index_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, TIMESTAMP_COLUMNS)
+        writer.writeheader()
+        writer.writerows(ordered)
+    return ordered
+
+# ----------------------------- Use the index -----------------------------
+def load_timestamp_index(folder_path):
+    # {output stem: row} of the index covering `folder_path`: the extraction folder itself
+    # or one of its TIFF_<channel>_<role>/images|stack subfolders. {} if there is none.
+    folder_path = Path(folder_path)
+    for parent in (folder_path, folder_path.parent, folder_path.parent.parent):
+        index_path = parent / TIMESTAMP_INDEX_FILENAME
+        if index_path.is_file():
+            with open(index_path, newline="", encoding="utf-8") as f:
+                return {row["stem"]: row for row in csv.DictReader(f)}
+    return {}
+
+def find_row(index, name):
+    # Index row of the JPK an output was extracted from: its name is "<stem>_<channel>_<role>"
+    name = Path(name).stem
+    while name:
+        if name in index:
+            return index[name]
+        name = name.rpartition("_")[0]
+    return None
+
+def acquisition_sorted(paths, index):
+    # `paths` in acquisition order; files not in the index follow in name order
+    def key(path):
+        row = find_row(index, Path(path).name)
+        return (0, int(row["order"]), Path(path).name) if row else (1, 0, Path(path).name)
+    return sorted(paths, key=key)
+
+def elapsed_seconds(paths, index):
+    # Seconds since the first of `paths` for each of them (None where unknown), or None
+    # if the index does not cover the first path
+    rows = [find_row(index, Path(path).name) for path in paths]
+    elapsed = [_number(row["elapsed_s"]) if row else None for row in rows]
+    if not elapsed or elapsed[0] is None:
+        return None
+    return [None if e is None else e - elapsed[0] for e in elapsed]